@@ -0,0 +1,303 @@
+"""
+乐队统计引擎。
+
+原来只有写进 view_map 的两支乐队能看到统计，而且每次请求都要重新计算视图。
+这里对任意 band_id 使用同一套逻辑，结果存放在汇总表 Band_Stat (见 sql/002_band_stats.sql):
+- 关注 / 取关、报名、乐评、资料修改、删除时按 delta 增量更新 (record_* / retract_*)
+- rebuild_band_stats() 按乐队逐个全量重建，用于首次上线或修正漂移
+- 乐队后台只需一条按主键前缀的查询，再由 summarize() 组装成模板需要的结构
+"""
+from decimal import Decimal
+
+# 年龄段: (上限 (不含), 名称)，None 表示没有上限
+AGE_BUCKETS = ((18, '<18'), (25, '18-24'), (35, '25-34'), (None, '35+'))
+MAX_AGE = 150
+UNKNOWN = 'unknown'
+FEMALE_VALUES = ('女', 'F', 'female', 'Female')
+BACHELOR_OR_ABOVE = ('本科', '硕士', '博士', '研究生')
+
+_BUMP_SQL = """
+    INSERT INTO Band_Stat (band_id, dim, bucket, cnt, total) VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt), total = total + VALUES(total)
+"""
+
+
+def parse_age(raw):
+    """表单里的年龄 -> int，留空为 None，不是 0~150 的整数抛 ValueError"""
+    if raw is None or str(raw).strip() == '':
+        return None
+    try:
+        age = int(str(raw).strip())
+    except ValueError:
+        raise ValueError(f'无效的年龄: {raw}')
+    if not 0 <= age <= MAX_AGE:
+        raise ValueError(f'年龄需在 0 - {MAX_AGE} 之间')
+    return age
+
+
+def age_bucket(age):
+    if age is None or age == '':
+        return UNKNOWN
+    age = int(age)
+    for upper, name in AGE_BUCKETS:
+        if upper is None or age < upper:
+            return name
+
+
+def _label(value):
+    return value if value not in (None, '') else UNKNOWN
+
+
+def _age_bucket_sql(col):
+    """与 age_bucket() 等价的 SQL 表达式 (全量重建用)"""
+    parts = [f"WHEN {col} IS NULL THEN '{UNKNOWN}'"]
+    for upper, name in AGE_BUCKETS:
+        parts.append(f"WHEN {col} < {upper} THEN '{name}'" if upper is not None else f"ELSE '{name}'")
+    return "CASE " + " ".join(parts) + " END"
+
+
+def _label_sql(col):
+    return f"COALESCE(NULLIF({col}, ''), '{UNKNOWN}')"
+
+
+# ================= 增量维护 =================
+def _bump(cursor, deltas):
+    """deltas: [(band_id, dim, bucket, cnt_delta, total_delta)]，同一行的 delta 先合并再批量 upsert"""
+    merged = {}
+    for band_id, dim, bucket, cnt, total in deltas:
+        key = (band_id, dim, str(bucket))
+        old_cnt, old_total = merged.get(key, (0, 0))
+        merged[key] = (old_cnt + cnt, old_total + total)
+    # 按主键排序写入，减少并发事务之间的死锁
+    rows = [(*key, cnt, total) for key, (cnt, total) in sorted(merged.items()) if cnt or total]
+    if rows:
+        cursor.executemany(_BUMP_SQL, rows)
+
+
+def _profile_deltas(band_id, profile, sign):
+    age = profile.get('age')
+    age_total = sign * int(age) if age not in (None, '') else 0
+    return [
+        (band_id, 'fans', '', sign, 0),
+        (band_id, 'age', age_bucket(age), sign, age_total),
+        (band_id, 'gender', _label(profile.get('gender')), sign, 0),
+        (band_id, 'education', _label(profile.get('education')), sign, 0),
+    ]
+
+
+def _fetch_profile(cursor, fan_id):
+    # 锁定读：读到最新提交的资料，并挡住并发的资料修改，保证加上去和以后撤销的是同一组分组
+    cursor.execute("SELECT age, gender, education FROM Fan WHERE fan_id=%s FOR UPDATE", (fan_id,))
+    return cursor.fetchone()
+
+
+def record_likes(cursor, fan_id, kind, changes):
+    """
+    关注乐队 / 收藏歌曲 / 报名演唱会 (+1) 或取消 (-1) 后调用。changes: {target_id: +1/-1}，
+    只包含确实改变了的关注关系。返回受影响的 band_id 集合 (不计入统计的类型返回空集合)。
+    """
+    if not changes:
+        return set()
+    if kind == 'band':
+        profile = _fetch_profile(cursor, fan_id)
+        if profile is None:
+            return set()
+        deltas = []
+        for band_id, sign in changes.items():
+            deltas += _profile_deltas(band_id, profile, sign)
+        _bump(cursor, deltas)
+        return set(changes)
+
+    ids = list(changes)
+    placeholders = ', '.join(['%s'] * len(ids))
+    if kind == 'song':
+        cursor.execute(f"SELECT s.song_id AS id, a.band_id FROM Song s JOIN Album a ON a.album_id = s.album_id WHERE s.song_id IN ({placeholders})", ids)
+    elif kind == 'concert':
+        cursor.execute(f"SELECT concert_id AS id, band_id FROM Concert WHERE concert_id IN ({placeholders})", ids)
+    else:
+        return set()
+    rows = cursor.fetchall()
+    _bump(cursor, [(r['band_id'], kind, r['id'], changes[r['id']], 0) for r in rows])
+    return {r['band_id'] for r in rows}
+
+
+def record_review(cursor, band_id, count_delta, score_delta):
+    """新乐评 (1, score) 或重新评分 (0, 新分 - 旧分)"""
+    _bump(cursor, [(band_id, 'review', '', count_delta, score_delta)])
+
+
+def update_fan_profile(cursor, fan_id, old, new):
+    """歌迷修改资料后，把他在所关注乐队里的年龄段/性别/学历分组从旧值挪到新值。返回受影响的 band_id 列表"""
+    def buckets(p):
+        age = int(p['age']) if p.get('age') not in (None, '') else None
+        return age, _label(p.get('gender')), _label(p.get('education'))
+    if buckets(old) == buckets(new):
+        return []
+    cursor.execute("SELECT band_id FROM Fan_Like_Band WHERE fan_id=%s", (fan_id,))
+    band_ids = [r['band_id'] for r in cursor.fetchall()]
+    deltas = []
+    for band_id in band_ids:
+        deltas += _profile_deltas(band_id, old, -1) + _profile_deltas(band_id, new, 1)
+    _bump(cursor, deltas)
+    return band_ids
+
+
+def retract_fan(cursor, fan_id):
+    """删除歌迷前调用：撤销他的关注、收藏、报名和乐评。返回受影响的 band_id 集合"""
+    profile = _fetch_profile(cursor, fan_id)
+    if profile is None:
+        return set()
+    deltas = []
+    cursor.execute("SELECT band_id FROM Fan_Like_Band WHERE fan_id=%s", (fan_id,))
+    for r in cursor.fetchall():
+        deltas += _profile_deltas(r['band_id'], profile, -1)
+    cursor.execute("""
+        SELECT a.band_id, l.song_id FROM Fan_Like_Song l
+        JOIN Song s ON s.song_id = l.song_id JOIN Album a ON a.album_id = s.album_id
+        WHERE l.fan_id=%s
+    """, (fan_id,))
+    deltas += [(r['band_id'], 'song', r['song_id'], -1, 0) for r in cursor.fetchall()]
+    cursor.execute("""
+        SELECT c.band_id, l.concert_id FROM Fan_Attend_Concert l
+        JOIN Concert c ON c.concert_id = l.concert_id
+        WHERE l.fan_id=%s
+    """, (fan_id,))
+    deltas += [(r['band_id'], 'concert', r['concert_id'], -1, 0) for r in cursor.fetchall()]
+    cursor.execute("""
+        SELECT a.band_id, COUNT(*) AS cnt, SUM(r.score) AS total FROM Review r
+        JOIN Album a ON a.album_id = r.album_id
+        WHERE r.fan_id=%s GROUP BY a.band_id
+    """, (fan_id,))
+    deltas += [(r['band_id'], 'review', '', -r['cnt'], -Decimal(str(r['total']))) for r in cursor.fetchall()]
+    _bump(cursor, deltas)
+    return {d[0] for d in deltas}
+
+
+def _drop_rows(cursor, band_id, dim, ids):
+    if ids:
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"DELETE FROM Band_Stat WHERE band_id=%s AND dim=%s AND bucket IN ({placeholders})",
+                       (band_id, dim, *[str(i) for i in ids]))
+
+
+def retract_song(cursor, band_id, song_id):
+    _drop_rows(cursor, band_id, 'song', [song_id])
+
+
+def retract_concert(cursor, band_id, concert_id):
+    _drop_rows(cursor, band_id, 'concert', [concert_id])
+
+
+def retract_album(cursor, band_id, album_id):
+    """删除专辑前调用：去掉其歌曲的收藏统计，并扣除该专辑的乐评"""
+    cursor.execute("SELECT s.song_id FROM Song s JOIN Album a ON a.album_id = s.album_id WHERE s.album_id=%s AND a.band_id=%s",
+                   (album_id, band_id))
+    _drop_rows(cursor, band_id, 'song', [r['song_id'] for r in cursor.fetchall()])
+    cursor.execute("""
+        SELECT COUNT(*) AS cnt, SUM(r.score) AS total FROM Review r JOIN Album a ON a.album_id = r.album_id
+        WHERE r.album_id=%s AND a.band_id=%s
+    """, (album_id, band_id))
+    row = cursor.fetchone()
+    if row and row['cnt']:
+        record_review(cursor, band_id, -row['cnt'], -Decimal(str(row['total'])))
+
+
+def drop_band(cursor, band_id):
+    cursor.execute("DELETE FROM Band_Stat WHERE band_id=%s", (band_id,))
+
+
+# ================= 全量重建 =================
+_REBUILD_SQL = (
+    """INSERT INTO Band_Stat (band_id, dim, bucket, cnt, total)
+       SELECT %s, 'fans', '', COUNT(*), 0 FROM Fan_Like_Band WHERE band_id=%s""",
+    f"""INSERT INTO Band_Stat (band_id, dim, bucket, cnt, total)
+        SELECT %s, 'age', {_age_bucket_sql('f.age')} AS b, COUNT(*), IFNULL(SUM(f.age), 0)
+        FROM Fan_Like_Band l JOIN Fan f ON f.fan_id = l.fan_id WHERE l.band_id=%s GROUP BY b""",
+    f"""INSERT INTO Band_Stat (band_id, dim, bucket, cnt, total)
+        SELECT %s, 'gender', {_label_sql('f.gender')} AS b, COUNT(*), 0
+        FROM Fan_Like_Band l JOIN Fan f ON f.fan_id = l.fan_id WHERE l.band_id=%s GROUP BY b""",
+    f"""INSERT INTO Band_Stat (band_id, dim, bucket, cnt, total)
+        SELECT %s, 'education', {_label_sql('f.education')} AS b, COUNT(*), 0
+        FROM Fan_Like_Band l JOIN Fan f ON f.fan_id = l.fan_id WHERE l.band_id=%s GROUP BY b""",
+    """INSERT INTO Band_Stat (band_id, dim, bucket, cnt, total)
+       SELECT %s, 'song', CAST(l.song_id AS CHAR), COUNT(*), 0 FROM Fan_Like_Song l
+       JOIN Song s ON s.song_id = l.song_id JOIN Album a ON a.album_id = s.album_id
+       WHERE a.band_id=%s GROUP BY l.song_id""",
+    """INSERT INTO Band_Stat (band_id, dim, bucket, cnt, total)
+       SELECT %s, 'concert', CAST(l.concert_id AS CHAR), COUNT(*), 0 FROM Fan_Attend_Concert l
+       JOIN Concert c ON c.concert_id = l.concert_id
+       WHERE c.band_id=%s GROUP BY l.concert_id""",
+    """INSERT INTO Band_Stat (band_id, dim, bucket, cnt, total)
+       SELECT %s, 'review', '', COUNT(*), IFNULL(SUM(r.score), 0) FROM Review r
+       JOIN Album a ON a.album_id = r.album_id WHERE a.band_id=%s""",
+)
+
+
+def rebuild_band_stats(conn, band_ids=None):
+    """
+    全量重建统计。每支乐队一个事务，避免一次性大事务。
+    band_ids 为空时重建所有乐队并清理已删除乐队的残留行。返回重建的乐队数。
+    """
+    with conn.cursor() as cursor:
+        if band_ids is None:
+            cursor.execute("DELETE FROM Band_Stat WHERE band_id NOT IN (SELECT band_id FROM Band)")
+            cursor.execute("SELECT band_id FROM Band ORDER BY band_id")
+            band_ids = [r['band_id'] for r in cursor.fetchall()]
+            conn.commit()
+        for band_id in band_ids:
+            drop_band(cursor, band_id)
+            for sql in _REBUILD_SQL:
+                cursor.execute(sql, (band_id, band_id))
+            conn.commit()
+    return len(band_ids)
+
+
+# ================= 读取 =================
+def summarize(rows, songs=(), concerts=(), top=5):
+    """
+    把 Band_Stat 行组装成模板使用的 (stats, song_stats, concert_stats)。
+    songs / concerts 用于把 id 换成名称 (乐队后台本来就会加载这两份列表)。
+    没有任何数据时 stats 为 None。
+    """
+    by_dim = {}
+    for r in rows:
+        by_dim.setdefault(r['dim'], {})[r['bucket']] = (r['cnt'], r['total'])
+
+    def breakdown(dim, order=None):
+        items = [(b, c) for b, (c, _) in by_dim.get(dim, {}).items() if c > 0]
+        if order:
+            rank = {name: i for i, name in enumerate(order)}
+            return sorted(items, key=lambda x: rank.get(x[0], len(rank)))
+        return sorted(items, key=lambda x: -x[1])
+
+    def top_items(dim, names, key):
+        counts = [(int(b), c) for b, (c, _) in by_dim.get(dim, {}).items() if c > 0]
+        counts.sort(key=lambda x: -x[1])
+        return [{key: names[i], 'count': c} for i, c in counts if i in names][:top]
+
+    song_titles = {s['song_id']: s['title'] for s in songs}
+    concert_names = {c['concert_id']: c['name'] for c in concerts}
+    song_stats = [{'song_title': x['song_title'], 'like_count': x['count']} for x in top_items('song', song_titles, 'song_title')]
+    concert_stats = [{'concert_name': x['concert_name'], 'attend_count': x['count']} for x in top_items('concert', concert_names, 'concert_name')]
+
+    total_fans = by_dim.get('fans', {}).get('', (0, 0))[0]
+    review_count, score_total = by_dim.get('review', {}).get('', (0, 0))
+    if not total_fans and not review_count and not song_stats and not concert_stats:
+        return None, song_stats, concert_stats
+
+    known_ages = [(c, t) for b, (c, t) in by_dim.get('age', {}).items() if b != UNKNOWN]
+    age_count = sum(c for c, _ in known_ages)
+    gender = by_dim.get('gender', {})
+    education = by_dim.get('education', {})
+    stats = {
+        'total_fans': total_fans,
+        'avg_age': float(sum(t for _, t in known_ages)) / age_count if age_count else None,
+        'female_count': sum(gender.get(v, (0, 0))[0] for v in FEMALE_VALUES),
+        'bachelor_count': sum(education.get(v, (0, 0))[0] for v in BACHELOR_OR_ABOVE),
+        'age_breakdown': breakdown('age', [name for _, name in AGE_BUCKETS] + [UNKNOWN]),
+        'gender_breakdown': breakdown('gender'),
+        'education_breakdown': breakdown('education'),
+        'review_count': review_count,
+        'avg_score': float(score_total) / review_count if review_count else None,
+    }
+    return stats, song_stats, concert_stats
@@ -0,0 +1,119 @@
+"""
+并发查询批处理。
+
+仪表盘上互不依赖的只读查询原来在同一个连接上依次执行，页面延迟是所有往返之和。
+QueryBatch 把它们分给线程池，各自从连接池借连接并行执行，
+页面延迟接近最慢的那条查询。
+
+    batch = QueryBatch(db_pool)
+    batch.add('profile', "SELECT ... WHERE fan_id=%s", (fan_id,), fetch='one')
+    batch.add('songs', lambda cursor: keyset_page(cursor, ...))
+    results = batch.run()
+    results['profile'], results.timings['profile']
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers):
+    """进程内共享的线程池 (Serverless 实例复用期间不用反复创建线程)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db-batch')
+    return _executor
+
+
+class QueryBatchError(Exception):
+    """批内有查询失败。errors: {名称: 异常}，partial: 成功的结果"""
+
+    def __init__(self, errors, partial):
+        self.errors = errors
+        self.partial = partial
+        detail = '; '.join(f'{name}: {e}' for name, e in errors.items())
+        super().__init__(f'{len(errors)} 条查询失败 ({detail})')
+
+
+class BatchResults(dict):
+    """{名称: 结果}，另带 timings: {名称: 秒} 与 elapsed (整批耗时)"""
+
+    def __init__(self, results, timings, elapsed):
+        super().__init__(results)
+        self.timings = timings
+        self.elapsed = elapsed
+
+
+class QueryBatch:
+    """
+    一组互不依赖的只读查询。
+    max_concurrency: 同时占用的连接数上限 (不超过连接池大小，避免自己把池占满)
+    """
+
+    def __init__(self, pool, max_concurrency=4, timeout=None):
+        self.pool = pool
+        self.max_concurrency = max(1, min(max_concurrency, pool.max_size))
+        self.timeout = timeout
+        self._queries = {}
+
+    def add(self, name, query, args=(), fetch='all'):
+        """
+        query 为 SQL 字符串 (fetch 取 'one' / 'all')，
+        或接收 cursor 的函数 (返回值即结果，用于分页等需要自定义处理的查询)。
+        """
+        self._queries[name] = (query, args, fetch)
+        return self
+
+    def _run_group(self, names):
+        """在一个借来的连接上依次执行若干查询，返回 ({名称: 结果}, {名称: 耗时}, {名称: 异常})"""
+        results, timings, errors = {}, {}, {}
+        try:
+            conn = self.pool.acquire()
+        except Exception as e:
+            return results, timings, {name: e for name in names}
+        try:
+            with conn.cursor() as cursor:
+                for name in names:
+                    query, args, fetch = self._queries[name]
+                    start = time.perf_counter()
+                    try:
+                        if callable(query):
+                            results[name] = query(cursor)
+                        else:
+                            cursor.execute(query, args)
+                            results[name] = cursor.fetchone() if fetch == 'one' else cursor.fetchall()
+                    except Exception as e:
+                        errors[name] = e
+                    timings[name] = time.perf_counter() - start
+        finally:
+            conn.close()
+        return results, timings, errors
+
+    def run(self):
+        """并行执行全部查询；任何一条失败都会在全部结束后抛出 QueryBatchError"""
+        start = time.perf_counter()
+        names = list(self._queries)
+        # 查询数多于并发上限时，轮流分组，每组占一个连接
+        groups = [names[i::self.max_concurrency] for i in range(min(self.max_concurrency, len(names)))]
+
+        results, timings, errors = {}, {}, {}
+        if len(groups) <= 1:
+            outcomes = [self._run_group(g) for g in groups]
+        else:
+            executor = get_executor(self.pool.max_size)
+            # 复制调用方的 contextvars (请求级埋点)，工作线程里的查询也记到发起它的请求上
+            futures = [executor.submit(contextvars.copy_context().run, self._run_group, g) for g in groups]
+            outcomes = [f.result(timeout=self.timeout) for f in futures]
+        for r, t, e in outcomes:
+            results.update(r)
+            timings.update(t)
+            errors.update(e)
+
+        if errors:
+            raise QueryBatchError(errors, results)
+        return BatchResults(results, timings, time.perf_counter() - start)
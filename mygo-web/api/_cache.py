@@ -0,0 +1,207 @@
+"""
+读穿透缓存。
+
+band_dashboard 每次 GET 要跑九条查询，而这些数据只有乐队自己 POST 或歌迷评分时才会变。
+这里按 (乐队, 数据集) 缓存查询结果:
+- 后端可替换 (CacheBackend)，默认进程内 MemoryCache: TTL + LRU，按估算字节数限制内存
+- 写路径按数据集精确失效；失效会递增该乐队的代数，防止并发读把旧数据写回缓存
+- 命中/未命中/淘汰计数可通过 stats() 取得
+
+注意：Serverless 下每个实例各有一份缓存，其他实例的写入只能靠 TTL 兜底。
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def approx_size(obj, _depth=0):
+    """粗略估算对象占用的字节数 (查询结果是 dict/list 的嵌套，足够用来做内存上限)"""
+    size = sys.getsizeof(obj)
+    if _depth > 4:
+        return size
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, _depth + 1) for v in obj)
+    return size
+
+
+class CacheBackend:
+    """缓存后端接口"""
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class NullCache(CacheBackend):
+    """不缓存 (用于关闭缓存或排查问题)"""
+
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key, default=None):
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'none', 'hits': 0, 'misses': self.misses}
+
+
+class MemoryCache(CacheBackend):
+    """
+    进程内缓存：TTL 过期 + LRU 淘汰。
+    max_bytes 按 approx_size 估算，超出后从最久未使用的条目开始淘汰。
+    """
+
+    def __init__(self, ttl=60, max_bytes=32 * 1024 * 1024, max_entries=10000):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = approx_size(value)
+        if size > self.max_bytes:
+            return  # 单个条目就超过上限，不缓存
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (expires_at, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._data) > self.max_entries:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class BandCache:
+    """按 (band_id, 数据集) 组织的缓存视图"""
+
+    def __init__(self, backend, datasets=(), on_invalidate=None):
+        self.backend = backend
+        self.datasets = tuple(datasets)  # invalidate() 不指定数据集时全部失效
+        self.on_invalidate = on_invalidate  # on_invalidate(band_id, 数据集)，clear() 时 band_id 为 None
+        self._generations = {}
+        self._epoch = 0  # clear() 时递增，让所有乐队的代数一起失效
+        self._lock = threading.Lock()
+
+    def generation(self, band_id):
+        """读数据前先取代数，写回时用它判断期间是否发生过失效"""
+        with self._lock:
+            return self._epoch, self._generations.get(band_id, 0)
+
+    def get_many(self, band_id, datasets):
+        """返回 {数据集: 值}，只包含命中的数据集"""
+        found = {}
+        for name in datasets:
+            value = self.backend.get(('band', band_id, name), _MISSING)
+            if value is not _MISSING:
+                found[name] = value
+        return found
+
+    def set(self, band_id, dataset, value, generation):
+        # 写后端也在锁内：否则校验通过后、写入前插进来的 invalidate() 会先删再被旧值覆盖
+        with self._lock:
+            if (self._epoch, self._generations.get(band_id, 0)) != generation:
+                return  # 加载期间被失效过，丢弃可能过期的结果
+            self.backend.set(('band', band_id, dataset), value)
+
+    def invalidate(self, band_id, *datasets):
+        """失效该乐队的指定数据集 (不指定则全部失效)"""
+        with self._lock:
+            self._generations[band_id] = self._generations.get(band_id, 0) + 1
+        for name in datasets or self.datasets:
+            self.backend.delete(('band', band_id, name))
+        if self.on_invalidate is not None:
+            self.on_invalidate(band_id, datasets or self.datasets)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+        self.backend.clear()
+        if self.on_invalidate is not None:
+            self.on_invalidate(None, self.datasets)
+
+    def stats(self):
+        return self.backend.stats()
+
+
+def make_cache_backend(kind='memory', ttl=60, max_bytes=32 * 1024 * 1024):
+    """按配置创建缓存后端"""
+    if kind == 'none':
+        return NullCache()
+    if kind == 'memory':
+        return MemoryCache(ttl=ttl, max_bytes=max_bytes)
+    raise ValueError(f'未知的缓存后端: {kind}')
@@ -0,0 +1,333 @@
+"""
+数据库连接池。
+
+原来每个请求都要重新做一次 TCP + TLS 握手、重建 SSL 上下文、执行 SET，
+握手的代价比查询本身还高。这里改为进程内复用连接:
+- 最小/最大连接数可配置，最小连接数在启动时预热
+- 借出时按间隔 ping 探活，超过最大存活时间的连接自动回收重建
+- 会话初始化 (SET SQL_SAFE_UPDATES = 0) 每条物理连接只执行一次
+- 连接耗尽时抛出 PoolExhausted，而不是返回 None
+- SSL 上下文 (加载 CA 证书包) 每个实例只构建一次，所有连接共用；
+  pymysql 延迟到第一次建连时导入 (通常在预热线程里)，不占用冷启动的导入时间
+
+(文件名以下划线开头，Vercel 不会把它当成独立的 Serverless Function)
+"""
+import os
+import ssl
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SSL_CA_PATH = "/etc/ssl/certs/ca-certificates.crt"
+
+
+class DatabaseUnavailable(Exception):
+    """无法建立数据库连接"""
+
+
+class PoolExhausted(DatabaseUnavailable):
+    """等待超时后仍没有可用连接"""
+
+
+# ================= SSL 与物理连接 =================
+_ssl_config = None
+_ssl_lock = threading.Lock()
+
+
+def get_ssl_config():
+    """
+    SSL 配置 (每个进程只构建一次)。
+    强制使用 SSL，解决 TiDB Cloud Error 1105。
+    直接返回 SSLContext：传 {"ca": ...} 时 pymysql 每次建连都会重新加载整个 CA 证书包 (几十毫秒)。
+    """
+    global _ssl_config
+    if _ssl_config is None:
+        with _ssl_lock:
+            if _ssl_config is None:
+                if os.path.exists(SSL_CA_PATH):
+                    # 使用系统证书 (Linux/Vercel)，校验方式与 pymysql 对 {"ca": ...} 的处理一致
+                    ctx = ssl.create_default_context(cafile=SSL_CA_PATH)
+                    ctx.verify_flags &= ~getattr(ssl, 'VERIFY_X509_STRICT', 0)
+                    _ssl_config = ctx
+                else:
+                    # 本地/无证书环境：创建忽略验证的 SSL 上下文
+                    ctx = ssl.create_default_context()
+                    ctx.check_hostname = False
+                    ctx.verify_mode = ssl.CERT_NONE
+                    _ssl_config = ctx
+    return _ssl_config
+
+
+def connect_tidb():
+    """建立一条新的物理连接 (不做会话初始化，由连接池负责)"""
+    import pymysql  # 延迟导入，见模块说明
+    return pymysql.connect(
+        host=os.environ.get('DB_HOST'),
+        port=int(os.environ.get('DB_PORT', 4000)),
+        user=os.environ.get('DB_USER'),
+        password=os.environ.get('DB_PASSWORD'),
+        database=os.environ.get('DB_NAME', 'mygo_db'),
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor,
+        ssl=get_ssl_config(),  # [关键] 强制传入 SSL
+        autocommit=False  # 关闭自动提交
+    )
+
+
+def setup_session(raw):
+    """每条物理连接建立后执行一次的会话初始化"""
+    # 关闭安全更新模式 (防止 DELETE/UPDATE 报错)
+    try:
+        with raw.cursor() as cursor:
+            cursor.execute("SET SQL_SAFE_UPDATES = 0")
+        raw.commit()
+    except Exception:
+        pass
+
+
+# ================= 连接池 =================
+class PooledConnection:
+    """
+    从池中借出的连接。
+    用法与 pymysql 连接一致；close() 表示归还到池中而不是断开。
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._checked_out = False
+        self._dirty = False  # 借出后执行过语句且尚未 commit/rollback
+        self.lease = 0  # 每次借出递增；持有旧 lease 的一方不能归还别人正在用的连接
+
+    def cursor(self, *args, **kwargs):
+        self._dirty = True
+        cursor = self._raw.cursor(*args, **kwargs)
+        wrapper = self._pool.cursor_wrapper
+        return wrapper(cursor) if wrapper is not None else cursor
+
+    def commit(self):
+        self._raw.commit()
+        self._dirty = False
+
+    def rollback(self):
+        self._raw.rollback()
+        self._dirty = False
+
+    def close(self, lease=None):
+        # 重复 close 是安全的 (路由 finally 与请求结束时的兜底可能都会调用)
+        # 兜底方传入借出时的 lease：连接已被归还并借给别的请求时什么都不做
+        if self._checked_out and (lease is None or lease == self.lease):
+            self._pool.release(self)
+
+    def discard(self):
+        """连接状态不可信 (例如流式结果没有读完) 时，直接断开而不是归还"""
+        if self._checked_out:
+            self._pool.release(self, discard=True)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    线程安全的连接池。
+
+    connect: 创建物理连接的函数
+    setup: 新连接的一次性会话初始化
+    min_size / max_size: 预热连接数 / 连接数上限
+    max_lifetime: 物理连接最大存活秒数，超过后回收重建
+    timeout: 连接耗尽时最多等待的秒数
+    ping_interval: 空闲超过这么多秒的连接在借出前先 ping 一次 (0 表示每次都 ping)
+    cursor_wrapper: 包装借出连接上创建的 cursor (埋点用，见 _metrics.py)
+    """
+
+    def __init__(self, connect, setup=setup_session, min_size=1, max_size=10,
+                 max_lifetime=1800, timeout=5.0, ping_interval=5.0, cursor_wrapper=None):
+        self._connect = connect
+        self._setup = setup
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.cursor_wrapper = cursor_wrapper
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # LIFO: 优先复用最近用过的连接，多余的自然老化
+        self._size = 0  # 已创建 (空闲 + 借出 + 正在创建) 的连接数
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'exhausted': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    # ---------- 借出 / 归还 ----------
+    def acquire(self, timeout=None):
+        """借出一条连接；超时抛出 PoolExhausted"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # 先占位，在锁外创建
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['exhausted'] += 1
+                    raise PoolExhausted(f'连接池已满 ({self.max_size})，等待 {timeout}s 超时')
+                self._cond.wait(remaining)
+
+        try:
+            conn = self._create() if conn is None else self._validate(conn)
+        except Exception:
+            self._forget()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+        conn.lease += 1
+        conn._checked_out = True
+        conn._dirty = False
+        return conn
+
+    def release(self, conn, discard=False):
+        """归还连接；未结束的事务会被回滚，避免把旧快照带给下一个请求"""
+        if not conn._checked_out:
+            return
+        conn._checked_out = False
+        if not discard and conn._dirty:
+            try:
+                conn._raw.rollback()
+            except Exception:
+                discard = True
+        conn._dirty = False
+
+        if not discard and self._expired(conn):
+            discard = True
+            with self._cond:
+                self._stats['recycled'] += 1
+        if not discard and not conn._raw.open:
+            discard = True
+
+        if discard:
+            self._close_raw(conn)
+            self._forget()
+            return
+        conn.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """with pool.connection() as conn: ..."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ---------- 预热 / 关闭 ----------
+    def warm(self):
+        """把空闲连接补足到 min_size"""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size or self._size >= self.max_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._create()
+            except Exception as e:
+                self._forget()
+                print(f"❌ Database Connection Failed: {e}")
+                return
+            conn.last_used = time.monotonic()
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def close_all(self):
+        """断开所有空闲连接 (借出中的连接归还时正常处理)"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_raw(conn)
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+        snapshot['in_use'] = snapshot['size'] - snapshot['idle']
+        snapshot['max_size'] = self.max_size
+        checkouts = snapshot['checkouts']
+        snapshot['wait_seconds_avg'] = snapshot['wait_seconds_total'] / checkouts if checkouts else 0.0
+        return snapshot
+
+    # ---------- 内部 ----------
+    def _create(self):
+        try:
+            raw = self._connect()
+        except Exception as e:
+            print(f"❌ Database Connection Failed: {e}")
+            raise DatabaseUnavailable(str(e)) from e
+        if self._setup:
+            self._setup(raw)
+        with self._cond:
+            self._stats['created'] += 1
+        return PooledConnection(self, raw)
+
+    def _validate(self, conn):
+        """借出前检查：过期则重建，空闲过久则 ping 探活"""
+        if self._expired(conn):
+            with self._cond:
+                self._stats['recycled'] += 1
+            self._close_raw(conn)
+            return self._create()
+        if time.monotonic() - conn.last_used >= self.ping_interval:
+            try:
+                conn._raw.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._stats['ping_failures'] += 1
+                self._close_raw(conn)
+                return self._create()
+        return conn
+
+    def _expired(self, conn):
+        return self.max_lifetime and time.monotonic() - conn.created_at >= self.max_lifetime
+
+    def _forget(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_raw(conn):
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
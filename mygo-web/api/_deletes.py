@@ -0,0 +1,326 @@
+"""
+分批的后台级联删除 (乐队、歌迷)。
+
+原来删除乐队是一条 DELETE Band，由外键 ON DELETE CASCADE 一次带走成员、专辑、歌曲、乐评、演唱会和全部关注 / 报名，
+大乐队就是一个巨大的事务：长时间持有锁、超出 TiDB 的事务大小限制、Serverless 请求超时。
+现在删除是一个任务 (Delete_Job，见 sql/006_delete_jobs.sql):
+- 按步骤先删子表再删父表。每批沿索引顺序取出最多 batch_size 个主键，再按主键删除，一批一个事务
+- 每一批和任务进度 (下一个步骤、已删除行数) 在同一个事务里提交；中断后从记录的步骤继续
+  (已经删掉的行不会再被取到，同一步骤重跑是幂等的)
+- 每批先对任务行做条件 UPDATE (step 没变才继续)：任务行同时是锁，多个执行者同时推进同一个任务时
+  后来的放弃这一批，不会重复执行不幂等的准备步骤
+- 歌迷: 准备步骤一次性撤销其统计 (由调用方传入，Band_Stat / 排行榜底表 / 推荐脏标记) 并记下评过分的专辑；
+  删除期间专辑累计评分暂不更新，全部删完后对这些专辑统一对账一次
+- 任务进行中目标不再接受写入 (否则准备步骤之后的写入会让统计漂移)：登录被拒绝，已登录的会话每次写入前
+  用 writable_targets() 锁住目标行并检查任务。创建任务时也锁目标行，所以写入要么在任务创建之前提交
+  (准备步骤能看到它)，要么看到进行中的任务被拒绝
+- 乐队删除期间，其他歌迷对它的专辑 / 歌曲 / 演唱会的关注和乐评也被拒绝 (require_bands_writable()，
+  否则删除步骤跑过之后写入的行会留下孤儿统计和排行榜底表)；歌迷修改资料不受影响
+  (只更新还关注着的乐队的统计，关注行删掉之后就不会再碰到这支乐队)
+- 最后删除乐队 / 歌迷本身；外键级联只兜底不经过检查的写入 (管理员导入等)
+
+    jobs = DeleteJobs(batch_size=500, prepare={'fan': fn})
+    jobs.start(conn, 'band', band_id)          # 创建任务 (已有进行中的任务时直接返回它)
+    jobs.run_pending(conn, budget=3)           # 推进所有进行中的任务，最多约 budget 秒
+"""
+import time
+
+from _ratings import reconcile_album_aggregates
+
+BATCH_SIZE = 500
+
+_BAND_ALBUMS = "SELECT album_id FROM Album WHERE band_id = %s"
+_BAND_SONGS = "SELECT s.song_id FROM Song s JOIN Album a ON a.album_id = s.album_id WHERE a.band_id = %s"
+_BAND_CONCERTS = "SELECT concert_id FROM Concert WHERE band_id = %s"
+
+
+class Step:
+    """
+    删除一张表里属于目标的行。
+    where: 条件 (其中的每个 %s 都是目标 id)；key: 主键列，按这个顺序 (沿索引) 取批次
+    """
+
+    def __init__(self, table, key, where, label):
+        self.table = table
+        self.key = key
+        self.where = where
+        self.label = label
+
+    def _args(self, target_id):
+        return (target_id,) * self.where.count('%s')
+
+    def count(self, cursor, target_id):
+        cursor.execute(f"SELECT COUNT(*) AS n FROM {self.table} WHERE {self.where}", self._args(target_id))
+        return cursor.fetchone()['n']
+
+    def run(self, conn, cursor, job, batch_size):
+        """删除一批，返回 (删除的行数, 这一步是否已完成)"""
+        cols = ', '.join(self.key)
+        cursor.execute(f"SELECT {cols} FROM {self.table} WHERE {self.where} ORDER BY {cols} LIMIT %s",
+                       self._args(job['target_id']) + (batch_size,))
+        keys = [tuple(row[c] for c in self.key) for row in cursor.fetchall()]
+        if keys:
+            if len(self.key) == 1:
+                cursor.execute(f"DELETE FROM {self.table} WHERE {cols} IN ({', '.join(['%s'] * len(keys))})",
+                               [k[0] for k in keys])
+            else:
+                row = '(' + ', '.join(['%s'] * len(self.key)) + ')'
+                cursor.execute(f"DELETE FROM {self.table} WHERE ({cols}) IN ({', '.join([row] * len(keys))})",
+                               [v for k in keys for v in k])
+        return len(keys), len(keys) < batch_size
+
+
+class PrepareFan:
+    """撤销歌迷的统计 (调用方的 fn(cursor, fan_id))，记下评过分的专辑留到最后对账"""
+    label = '撤销统计'
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def count(self, cursor, target_id):
+        return 0
+
+    def run(self, conn, cursor, job, batch_size):
+        fan_id = job['target_id']
+        cursor.execute("SELECT album_id FROM Review WHERE fan_id=%s ORDER BY album_id", (fan_id,))
+        album_ids = ','.join(str(r['album_id']) for r in cursor.fetchall())
+        if self.fn is not None:
+            self.fn(cursor, fan_id)
+        cursor.execute("UPDATE Delete_Job SET album_ids=%s WHERE kind=%s AND target_id=%s", (album_ids, job['kind'], fan_id))
+        job['album_ids'] = album_ids
+        return 0, True
+
+
+class ReconcileAlbums:
+    """对歌迷评过分的专辑统一对账一次 (自己提交，重复执行没有副作用)"""
+    label = '专辑评分对账'
+
+    def count(self, cursor, target_id):
+        return 0
+
+    def run(self, conn, cursor, job, batch_size):
+        album_ids = [int(a) for a in (job.get('album_ids') or '').split(',') if a]
+        if album_ids:  # 空列表会对账全部专辑
+            reconcile_album_aggregates(conn, album_ids)
+        return 0, True
+
+
+def band_steps(review_days=False):
+    steps = [
+        Step('Fan_Like_Song', ('song_id', 'fan_id'), f'song_id IN ({_BAND_SONGS})', '单曲收藏'),
+        Step('Song', ('song_id',), f'album_id IN ({_BAND_ALBUMS})', '歌曲'),
+        Step('Fan_Like_Album', ('album_id', 'fan_id'), f'album_id IN ({_BAND_ALBUMS})', '专辑收藏'),
+        Step('Review', ('album_id', 'fan_id'), f'album_id IN ({_BAND_ALBUMS})', '乐评'),
+    ]
+    if review_days:
+        steps.append(Step('Album_Review_Day', ('album_id', 'day'), f'album_id IN ({_BAND_ALBUMS})', '排行榜底表'))
+    return steps + [
+        Step('Album', ('album_id',), 'band_id = %s', '专辑'),
+        Step('Fan_Attend_Concert', ('concert_id', 'fan_id'), f'concert_id IN ({_BAND_CONCERTS})', '演唱会报名'),
+        Step('Concert', ('concert_id',), 'band_id = %s', '演唱会'),
+        Step('Fan_Like_Band', ('band_id', 'fan_id'), 'band_id = %s', '关注'),
+        Step('Member', ('member_id',), 'band_id = %s', '成员'),
+        Step('Band_Stat', ('band_id', 'dim', 'bucket'), 'band_id = %s', '统计'),
+        Step('Band', ('band_id',), 'band_id = %s', '乐队'),
+    ]
+
+
+def fan_steps(prepare=None):
+    return [
+        PrepareFan(prepare),
+        Step('Fan_Like_Band', ('fan_id', 'band_id'), 'fan_id = %s', '关注'),
+        Step('Fan_Like_Album', ('fan_id', 'album_id'), 'fan_id = %s', '专辑收藏'),
+        Step('Fan_Like_Song', ('fan_id', 'song_id'), 'fan_id = %s', '单曲收藏'),
+        Step('Fan_Attend_Concert', ('fan_id', 'concert_id'), 'fan_id = %s', '演唱会报名'),
+        Step('Review', ('fan_id', 'album_id'), 'fan_id = %s', '乐评'),
+        Step('Fan', ('fan_id',), 'fan_id = %s', '歌迷'),
+        ReconcileAlbums(),
+    ]
+
+
+# 删除对象: 类型 -> (表, 主键, 显示名称的列)
+TARGETS = {'band': ('Band', 'band_id', 'name'), 'fan': ('Fan', 'fan_id', 'name')}
+
+
+class TargetDeleting(Exception):
+    """目标正在删除或已经删除，不再接受它的写入"""
+
+    def __init__(self, kind, target_id):
+        super().__init__(f'{kind} #{target_id} 正在删除或已删除')
+        self.kind = kind
+        self.target_id = target_id
+
+
+def writable_targets(cursor, kind, target_ids, lock=True):
+    """
+    返回 target_ids 中存在、且没有进行中的删除任务的 id。
+    lock=True 时锁住这些目标行直到调用方的事务结束 (写入前调用，和写入同一个事务)
+    """
+    ids = sorted(set(target_ids))
+    if not ids:
+        return set()
+    table, pk, _ = TARGETS[kind]
+    cursor.execute(f"""
+        SELECT t.{pk} AS id, j.status FROM {table} t
+        LEFT JOIN Delete_Job j ON j.kind = %s AND j.target_id = t.{pk} AND j.status = 'running'
+        WHERE t.{pk} IN ({', '.join(['%s'] * len(ids))}) ORDER BY t.{pk}{' FOR UPDATE' if lock else ''}
+    """, [kind] + ids)
+    return {r['id'] for r in cursor.fetchall() if r['status'] is None}
+
+
+def require_writable(cursor, kind, target_id):
+    """单个目标的写入前检查，不可写时抛 TargetDeleting"""
+    if target_id not in writable_targets(cursor, kind, [target_id]):
+        raise TargetDeleting(kind, target_id)
+
+
+# 关注 / 乐评目标 -> 所属乐队
+_OWNER_SQL = {
+    'band': "SELECT band_id AS id, band_id FROM Band WHERE band_id IN ({})",
+    'album': "SELECT album_id AS id, band_id FROM Album WHERE album_id IN ({})",
+    'song': "SELECT s.song_id AS id, a.band_id FROM Song s JOIN Album a ON a.album_id = s.album_id WHERE s.song_id IN ({})",
+    'concert': "SELECT concert_id AS id, band_id FROM Concert WHERE concert_id IN ({})",
+}
+
+
+def target_bands(cursor, targets):
+    """targets: {类型: id 集合} -> {类型: {id: 所属 band_id}}，不存在的目标不在结果里"""
+    owners = {}
+    for kind, ids in targets.items():
+        ids = sorted(ids)
+        if ids:
+            cursor.execute(_OWNER_SQL[kind].format(', '.join(['%s'] * len(ids))), ids)
+            owners[kind] = {r['id']: r['band_id'] for r in cursor.fetchall()}
+    return owners
+
+
+def require_bands_writable(cursor, targets):
+    """
+    歌迷写入关注 / 乐评前检查目标所属的乐队 (和 require_writable 一样锁住乐队行)，
+    有乐队正在删除时抛 TargetDeleting('band', ...)
+    """
+    band_ids = {b for owners in target_bands(cursor, targets).values() for b in owners.values()}
+    deleting = band_ids - writable_targets(cursor, 'band', band_ids)
+    if deleting:
+        raise TargetDeleting('band', min(deleting))
+
+
+class DeleteJobs:
+    """
+    batch_size: 每批 (每个事务) 最多删除的行数
+    prepare: {类型: fn(cursor, target_id)}，在删除任何行之前、和任务进度同一个事务里执行一次
+    review_days: 是否有排行榜底表 Album_Review_Day 需要清理 (LEADERBOARD_TABLE)
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, prepare=None, review_days=False):
+        self.batch_size = batch_size
+        prepare = prepare or {}
+        self.steps = {'band': band_steps(review_days), 'fan': fan_steps(prepare.get('fan'))}
+
+    def describe(self, job):
+        """任务行 -> 管理员页面 / JSON 用的进度"""
+        steps = self.steps[job['kind']]
+        step = min(job['step'], len(steps) - 1)
+        total = max(job['total'], job['deleted'])
+        return {
+            'kind': job['kind'], 'target_id': job['target_id'], 'label': job['label'],
+            'status': job['status'], 'error': job['error'],
+            'step': job['step'], 'steps': len(steps), 'step_label': steps[step].label,
+            'deleted': job['deleted'], 'total': total,
+            'percent': 100 if job['status'] == 'done' else int(job['deleted'] * 100 / total) if total else 0,
+            'updated_at': str(job['updated_at']),
+        }
+
+    # ---------- 创建 ----------
+    def start(self, conn, kind, target_id):
+        """创建删除任务并统计待删除的行数；目标不存在时返回 None，已有进行中的任务时返回它"""
+        table, pk, name_col = TARGETS[kind]
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM Delete_Job WHERE kind=%s AND target_id=%s", (kind, target_id))
+            job = cursor.fetchone()
+            if job is None or job['status'] != 'running':
+                # 锁住目标行：和 writable_targets() 互斥，任务创建之后提交的写入一定能看到任务
+                cursor.execute(f"SELECT {name_col} AS label FROM {table} WHERE {pk}=%s FOR UPDATE", (target_id,))
+                target = cursor.fetchone()
+                if target is None:
+                    conn.commit()
+                    return None
+                total = sum(step.count(cursor, target_id) for step in self.steps[kind])
+                if job is not None:  # 上一次删除留下的记录 (主键被重新使用)
+                    cursor.execute("DELETE FROM Delete_Job WHERE kind=%s AND target_id=%s", (kind, target_id))
+                cursor.execute("""
+                    INSERT IGNORE INTO Delete_Job (kind, target_id, label, total, created_at, updated_at)
+                    VALUES (%s, %s, %s, %s, NOW(), NOW())
+                """, (kind, target_id, target['label'] or '', total))
+                cursor.execute("SELECT * FROM Delete_Job WHERE kind=%s AND target_id=%s", (kind, target_id))
+                job = cursor.fetchone()
+        conn.commit()
+        return job
+
+    # ---------- 执行 ----------
+    def run(self, conn, job, deadline):
+        """推进一个任务直到完成、出错或超过 deadline (time.monotonic())，至少执行一批。返回最新的任务行"""
+        steps = self.steps[job['kind']]
+        ident = (job['kind'], job['target_id'])
+        while job['status'] == 'running':
+            index = job['step']
+            try:
+                with conn.cursor() as cursor:
+                    # 锁住任务行；step 已经被其他执行者推进时放弃，交给它继续
+                    cursor.execute("""
+                        UPDATE Delete_Job SET batches = batches + 1, updated_at = NOW()
+                        WHERE kind=%s AND target_id=%s AND step=%s AND status='running'
+                    """, ident + (index,))
+                    if cursor.rowcount != 1:
+                        conn.rollback()
+                        return self.get(conn, *ident) or job
+                    deleted, finished = steps[index].run(conn, cursor, job, self.batch_size)
+                    advance = 1 if finished else 0
+                    status = 'done' if finished and index + 1 >= len(steps) else 'running'
+                    cursor.execute("""
+                        UPDATE Delete_Job SET deleted = deleted + %s, step = step + %s, status = %s, error = NULL, updated_at = NOW()
+                        WHERE kind=%s AND target_id=%s
+                    """, (deleted, advance, status) + ident)
+                conn.commit()
+            except Exception as e:
+                # 这一批回滚，下次从同一步骤重试；错误记在任务上给管理员看
+                conn.rollback()
+                with conn.cursor() as cursor:
+                    cursor.execute("UPDATE Delete_Job SET error=%s WHERE kind=%s AND target_id=%s", (str(e)[:1000],) + ident)
+                conn.commit()
+                job['error'] = str(e)
+                return job
+            job.update(deleted=job['deleted'] + deleted, step=index + advance, status=status, error=None)
+            if time.monotonic() >= deadline:
+                break
+        return job
+
+    def run_pending(self, conn, budget):
+        """推进所有进行中的任务 (先创建的先执行)，总共约 budget 秒。返回 [(执行前的任务行, 执行后的任务行)]"""
+        deadline = time.monotonic() + budget
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM Delete_Job WHERE status='running' ORDER BY created_at, kind, target_id")
+            jobs = cursor.fetchall()
+        conn.commit()
+        touched = []
+        for job in jobs:
+            if time.monotonic() >= deadline:
+                break
+            before = dict(job)
+            touched.append((before, self.run(conn, job, deadline)))
+        return touched
+
+    # ---------- 查询 ----------
+    def get(self, conn, kind, target_id):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT * FROM Delete_Job WHERE kind=%s AND target_id=%s", (kind, target_id))
+            job = cursor.fetchone()
+        conn.commit()
+        return job
+
+    def recent(self, cursor, done_limit=5):
+        """进行中的全部任务 + 最近完成的几个"""
+        cursor.execute("SELECT * FROM Delete_Job WHERE status='running' ORDER BY created_at")
+        jobs = cursor.fetchall()
+        cursor.execute("SELECT * FROM Delete_Job WHERE status='done' ORDER BY updated_at DESC LIMIT %s", (done_limit,))
+        return [self.describe(job) for job in jobs + cursor.fetchall()]
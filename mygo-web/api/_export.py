@@ -0,0 +1,183 @@
+"""
+流式数据导出 (CSV / NDJSON，可选 gzip)。
+
+用 pymysql 的非缓冲 SSDictCursor 逐批取行，边取边写进分块响应，
+内存占用只和 fetch_size 有关，与表大小无关。
+
+    export = EXPORTS['reviews']
+    sql, args = export.build_query(columns, filters)
+    cursor = conn.cursor(pymysql.cursors.SSDictCursor); cursor.execute(sql, args)
+    Response(stream_export(conn, cursor, columns, 'csv'))
+
+结果按主键顺序输出 (直接沿索引扫描，不需要排序缓冲)。
+客户端中途断开时连接上还有没读完的结果，只能断开丢弃，不能归还到连接池。
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+from decimal import Decimal
+
+from _likes import LIKE_TABLES
+
+FETCH_SIZE = 1000
+
+
+class ExportError(ValueError):
+    """导出参数不合法 (未知的导出、列或过滤条件)"""
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+class Export:
+    """
+    一种导出。
+    columns: [(列名, SQL 表达式)]，按顺序即默认输出顺序
+    filters: {参数名: (SQL 条件 (一个 %s), 参数转换函数)}
+    """
+
+    def __init__(self, name, from_sql, columns, filters, order_by):
+        self.name = name
+        self.from_sql = from_sql
+        self.columns = dict(columns)
+        self.default_columns = [c for c, _ in columns]
+        self.filters = filters
+        self.order_by = order_by
+
+    def select_columns(self, raw):
+        """?columns=a,b,c -> 列名列表；为空时输出全部列"""
+        if not raw:
+            return list(self.default_columns)
+        columns = [c.strip() for c in raw.split(',') if c.strip()]
+        unknown = [c for c in columns if c not in self.columns]
+        if unknown:
+            raise ExportError(f"未知的列: {', '.join(unknown)} (可选: {', '.join(self.default_columns)})")
+        return columns
+
+    def parse_filters(self, params):
+        """从请求参数中取出本导出支持的过滤条件"""
+        filters = {}
+        for key, (_, convert) in self.filters.items():
+            value = params.get(key)
+            if value in (None, ''):
+                continue
+            try:
+                filters[key] = convert(value)
+            except ValueError:
+                raise ExportError(f'过滤条件 {key} 的值无效: {value}')
+        return filters
+
+    def build_query(self, columns, filters):
+        select = ', '.join(f'{self.columns[c]} AS {c}' for c in columns)
+        sql = f'SELECT {select} FROM {self.from_sql}'
+        conditions = [self.filters[key][0] for key in filters]
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        return sql + f' ORDER BY {self.order_by}', tuple(filters.values())
+
+
+def _like_export(kind):
+    table, column = LIKE_TABLES[kind]
+    return Export(
+        f'likes_{kind}', table,
+        [('fan_id', 'fan_id'), (column, column)],
+        {'fan_id': ('fan_id = %s', int), column: (f'{column} = %s', int)},
+        f'fan_id, {column}',
+    )
+
+
+EXPORTS = {
+    # 不导出 password
+    'fans': Export(
+        'fans', 'Fan',
+        [('fan_id', 'fan_id'), ('name', 'name'), ('age', 'age'), ('gender', 'gender'),
+         ('occupation', 'occupation'), ('education', 'education')],
+        {
+            'min_age': ('age >= %s', int),
+            'max_age': ('age <= %s', int),
+            'gender': ('gender = %s', str),
+            'education': ('education = %s', str),
+            'after_id': ('fan_id > %s', int),
+        },
+        'fan_id',
+    ),
+    'reviews': Export(
+        'reviews', 'Review r JOIN Album a ON a.album_id = r.album_id',
+        [('fan_id', 'r.fan_id'), ('album_id', 'r.album_id'), ('band_id', 'a.band_id'), ('album_title', 'a.title'),
+         ('score', 'r.score'), ('comment', 'r.comment'), ('review_time', 'r.review_time')],
+        {
+            'band_id': ('a.band_id = %s', int),
+            'album_id': ('r.album_id = %s', int),
+            'fan_id': ('r.fan_id = %s', int),
+            'min_score': ('r.score >= %s', float),
+            'max_score': ('r.score <= %s', float),
+            'since': ('r.review_time >= %s', _parse_date),
+            'until': ('r.review_time < %s', _parse_date),
+        },
+        'r.fan_id, r.album_id',
+    ),
+}
+EXPORTS.update({f'likes_{kind}': _like_export(kind) for kind in LIKE_TABLES})
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _encode_csv(rows, columns, header):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([row[c] for c in columns] for row in rows)
+    return buf.getvalue()
+
+
+def _encode_ndjson(rows, columns):
+    return ''.join(json.dumps({c: row[c] for c in columns}, ensure_ascii=False, default=_json_default) + '\n'
+                   for row in rows)
+
+
+def stream_export(conn, cursor, columns, fmt, compress=False, fetch_size=FETCH_SIZE):
+    """
+    逐批读取已执行的非缓冲 cursor 并编码输出。
+    读完后归还连接；中途中断 (客户端断开、编码出错) 时断开丢弃连接。
+    """
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: gzip 格式
+    finished = False
+    try:
+        first = True
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if fmt == 'csv':
+                chunk = _encode_csv(rows, columns, header=first)
+            else:
+                chunk = _encode_ndjson(rows, columns)
+            first = False
+            if chunk:
+                data = chunk.encode('utf-8')
+                data = gz.compress(data) if gz else data
+                if data:
+                    yield data
+            if len(rows) < fetch_size:
+                break
+        if gz:
+            yield gz.flush()
+        finished = True
+    finally:
+        if finished:
+            cursor.close()
+            conn.commit()
+            conn.close()
+        else:
+            conn.discard()
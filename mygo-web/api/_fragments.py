@@ -0,0 +1,108 @@
+"""
+页面片段缓存与条件请求。
+
+- DataVersions: 按数据范围 (全站曲库、某个歌迷、某支乐队...) 记录版本号和最后修改时间，
+  写路径提交后 bump()。页面的 ETag / Last-Modified 由它涉及的范围算出，
+  浏览器带着 If-None-Match / If-Modified-Since 重复访问时直接返回 304，查询和渲染都省掉。
+- {% cache key %} ... {% endcache %}: 缓存渲染好的 HTML 片段，key 里带上数据版本，
+  版本变化后自然换成新的片段，不需要主动删除。
+  视图可以先用 FragmentCache.lookup() 查看片段是否已缓存，命中时跳过对应的查询，
+  并把片段通过模板变量 fragments 传入 (渲染时优先使用，避免查完之后片段恰好被淘汰)。
+
+版本号只在本进程内递增，其他实例的写入看不到。因此 ETag 还带有按 ttl 切分的时间段，
+最长 ttl 秒后一定会重新渲染，与 BandCache 的 TTL 保持一致。
+"""
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class DataVersions:
+    """数据范围 -> (版本号, 最后修改时间)。范围可以是字符串或元组，如 'catalog'、('fan', 3)"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.started = time.time()
+        self._boot = os.urandom(4).hex()  # 区分实例/进程，避免不同进程的版本号互相冒充
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *scopes):
+        now = time.time()
+        with self._lock:
+            for scope in scopes:
+                version, _ = self._versions.get(scope, (0, self.started))
+                self._versions[scope] = (version + 1, now)
+
+    def get(self, scope):
+        return self._versions.get(scope, (0, self.started))[0]
+
+    def validators(self, scopes, extra=()):
+        """
+        返回 (etag, last_modified)。
+        scopes: 页面依赖的数据范围；extra: 其他影响输出的值 (用户 id、查询参数等)
+        """
+        now = time.time()
+        bucket = int(now // self.ttl) if self.ttl else 0
+        with self._lock:
+            entries = [(scope, *self._versions.get(scope, (0, self.started))) for scope in scopes]
+        raw = repr((self._boot, bucket, [(s, v) for s, v, _ in entries], tuple(extra)))
+        etag = hashlib.blake2b(raw.encode('utf-8'), digest_size=12).hexdigest()
+        modified = max([m for _, _, m in entries] + [self.started, bucket * self.ttl if self.ttl else 0])
+        return etag, datetime.datetime.fromtimestamp(int(modified), tz=datetime.timezone.utc)
+
+
+class FragmentCache:
+    """渲染好的 HTML 片段 (存放在 _cache 的后端里)"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def lookup(self, key):
+        return self.backend.get(('fragment', key))
+
+    def store(self, key, html):
+        self.backend.set(('fragment', key), html)
+
+    def stats(self):
+        return self.backend.stats()
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache key %} ... {% endcache %}
+
+    key 可以是任意可哈希的表达式 (通常是视图传入的元组，包含数据版本)。
+    environment.fragment_cache 为 None 时不缓存。
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        pinned = nodes.Name('fragments', 'load')
+        return nodes.CallBlock(self.call_method('_render', [key, pinned]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, pinned, caller):
+        if isinstance(pinned, dict) and key in pinned:
+            return Markup(pinned[key])
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        html = cache.lookup(key)
+        if html is None:
+            html = caller()
+            cache.store(key, str(html))
+        return Markup(html)
@@ -0,0 +1,356 @@
+"""
+批量导入 (CSV / NDJSON，可选 gzip)。
+
+    spec = IMPORTS['songs']
+    records = read_records(file_stream, 'csv', spec, compressed=False)
+    for progress, failures in import_records(conn, spec, records):
+        ...  # 每写完一块 (一个事务) 产出一次进度和这一块里出错的行
+
+- 边读边校验：每行转换成列值，不合法的行记入错误报告 (行号、原因、原始内容)，其他行照常导入
+- 外键在内存里解析：成员 / 专辑的乐队可以写 band_id 或乐队名称 band，歌曲的专辑可以写 album_id
+  或乐队 + 专辑名 (band, album)；导入开始前一次性读出名称 -> id 的映射，不逐行查询
+- 和库里已有的数据 (或文件里前面的行) 重复的行记为错误，同一个文件重复导入不会产生重复数据
+  (乐队 / 歌迷按名称，成员按乐队 + 姓名，专辑按乐队 + 专辑名，歌曲按专辑 + 歌名)
+- 每 chunk_size 行一个事务，用 executemany 写入；这一块写入失败时 (并发写入了同名数据等)
+  回滚后逐行重试，只把真正失败的行记为错误
+
+导入只写基础表，调用方负责在导入后失效相关的缓存和索引。
+"""
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import json
+
+CHUNK_SIZE = 1000
+
+FORMATS = ('csv', 'ndjson')
+
+
+class BulkImportError(ValueError):
+    """整个文件无法导入 (未知的导入或格式、缺少必填列、编码错误)"""
+
+
+class RowError(ValueError):
+    """某一行无法导入"""
+
+
+class RowFailure:
+    """错误报告中的一行"""
+    __slots__ = ('line', 'error', 'record')
+
+    def __init__(self, line, error, record):
+        self.line = line
+        self.error = error
+        self.record = record
+
+    def as_dict(self):
+        return {'line': self.line, 'error': self.error, 'row': self.record}
+
+
+# ---------- 字段转换 ----------
+def _clean(value):
+    """空字符串、只有空白、null 都视为缺失 (None)"""
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _text(value):
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError(value)
+    return str(value)
+
+
+def _int(value):
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def _age(value):
+    age = _int(value)
+    if not 0 < age < 150:
+        raise ValueError(value)
+    return age
+
+
+def _date(value):
+    return datetime.date.fromisoformat(str(value)).isoformat()
+
+
+# ---------- 外键 ----------
+class Lookups:
+    """导入开始前一次性读出的外键映射"""
+
+    def __init__(self, cursor, names):
+        self.band_ids = {}  # 乐队名称 -> band_id
+        self.bands = set()
+        self.album_ids = {}  # (band_id, 专辑名) -> album_id
+        self.albums = set()
+        if 'bands' in names:
+            cursor.execute("SELECT band_id, name FROM Band")
+            for row in cursor.fetchall():
+                self.band_ids[row['name']] = row['band_id']
+                self.bands.add(row['band_id'])
+        if 'albums' in names:
+            cursor.execute("SELECT album_id, band_id, title FROM Album")
+            for row in cursor.fetchall():
+                self.album_ids.setdefault((row['band_id'], row['title']), row['album_id'])
+                self.albums.add(row['album_id'])
+
+    def band(self, values):
+        """band_id 或乐队名称 band -> band_id"""
+        band_id = values.pop('band_id', None)
+        name = values.pop('band', None)
+        if band_id is not None:
+            if band_id not in self.bands:
+                raise RowError(f'乐队 #{band_id} 不存在')
+            return band_id
+        if name is None:
+            raise RowError('缺少 band_id 或 band')
+        if name not in self.band_ids:
+            raise RowError(f'乐队 {name} 不存在')
+        return self.band_ids[name]
+
+    def album(self, values):
+        """album_id 或乐队 + 专辑名 (band, album) -> album_id"""
+        album_id = values.pop('album_id', None)
+        title = values.pop('album', None)
+        if album_id is not None:
+            values.pop('band_id', None)
+            values.pop('band', None)
+            if album_id not in self.albums:
+                raise RowError(f'专辑 #{album_id} 不存在')
+            return album_id
+        if title is None:
+            raise RowError('缺少 album_id 或 album')
+        band_id = self.band(values)
+        if (band_id, title) not in self.album_ids:
+            raise RowError(f'专辑 {title} 不存在')
+        return self.album_ids[(band_id, title)]
+
+
+def _resolve_band(values, lookups):
+    values['band_id'] = lookups.band(values)
+
+
+def _resolve_album(values, lookups):
+    values['album_id'] = lookups.album(values)
+
+
+class Import:
+    """
+    一种导入。
+    table / columns: 写入的表和列
+    fields: [(字段名, 转换函数, 是否必填)]，文件里的其他字段忽略
+    key: 判断重复的列
+    resolve(values, lookups): 把引用字段换成外键列，引用不存在时抛 RowError
+    lookups: resolve 需要的映射 ('bands' / 'albums')
+    """
+
+    def __init__(self, name, table, columns, fields, key, resolve=None, lookups=()):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.fields = fields
+        self.key = key
+        self.resolve = resolve
+        self.lookups = lookups
+        self.required = [f for f, _, required in fields if required]
+        self.insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        self.key_sql = f"SELECT {', '.join(key)} FROM {table}"
+
+    def check_header(self, fieldnames):
+        missing = [f for f in self.required if f not in (fieldnames or ())]
+        if missing:
+            raise BulkImportError(f"缺少必填列: {', '.join(missing)} (可用的列: {', '.join(f for f, _, _ in self.fields)})")
+
+    def validate(self, record, lookups):
+        """一行原始数据 -> 列值；不合法时抛 RowError"""
+        values = {}
+        for field, convert, required in self.fields:
+            raw = _clean(record.get(field))
+            if raw is None:
+                if required:
+                    raise RowError(f'缺少 {field}')
+                continue
+            try:
+                values[field] = convert(raw)
+            except (TypeError, ValueError):
+                raise RowError(f'{field} 的值无效: {raw}')
+        if self.resolve is not None:
+            self.resolve(values, lookups)
+        return values
+
+    def load_keys(self, cursor):
+        cursor.execute(self.key_sql)
+        return {tuple(row[c] for c in self.key) for row in cursor.fetchall()}
+
+
+IMPORTS = {
+    'bands': Import(
+        'bands', 'Band', ('name', 'leader_name', 'founding_date', 'password', 'intro', 'netease_url'),
+        [('name', _text, True), ('leader_name', _text, False), ('founding_date', _date, False),
+         ('password', _text, True), ('intro', _text, False), ('netease_url', _text, False)],
+        ('name',),
+    ),
+    'fans': Import(
+        'fans', 'Fan', ('name', 'password', 'age', 'gender', 'occupation', 'education'),
+        [('name', _text, True), ('password', _text, True), ('age', _age, False),
+         ('gender', _text, False), ('occupation', _text, False), ('education', _text, False)],
+        ('name',),
+    ),
+    'members': Import(
+        'members', 'Member', ('name', 'role', 'gender', 'join_date', 'band_id'),
+        [('band_id', _int, False), ('band', _text, False), ('name', _text, True), ('role', _text, False),
+         ('gender', _text, False), ('join_date', _date, False)],
+        ('band_id', 'name'), _resolve_band, ('bands',),
+    ),
+    'albums': Import(
+        'albums', 'Album', ('title', 'release_date', 'album_intro', 'band_id'),
+        [('band_id', _int, False), ('band', _text, False), ('title', _text, True),
+         ('release_date', _date, False), ('album_intro', _text, False)],
+        ('band_id', 'title'), _resolve_band, ('bands',),
+    ),
+    'songs': Import(
+        'songs', 'Song', ('title', 'authors', 'album_id', 'netease_url'),
+        [('album_id', _int, False), ('band_id', _int, False), ('band', _text, False), ('album', _text, False),
+         ('title', _text, True), ('authors', _text, False), ('netease_url', _text, False)],
+        ('album_id', 'title'), _resolve_album, ('bands', 'albums'),
+    ),
+}
+
+
+# ---------- 读取 ----------
+def detect_format(filename, fmt=None):
+    """按参数或扩展名 (.csv / .ndjson / .jsonl，可再加 .gz) 判断格式 -> (格式, 是否 gzip)"""
+    name = (filename or '').lower()
+    compressed = name.endswith('.gz')
+    if compressed:
+        name = name[:-3]
+    if not fmt:
+        fmt = 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv'
+    if fmt not in FORMATS:
+        raise BulkImportError(f"未知的格式 {fmt} (可选: {', '.join(FORMATS)})")
+    return fmt, compressed
+
+
+def read_records(stream, fmt, spec, compressed=False):
+    """
+    二进制文件流 -> 逐行产出 (行号, 原始数据 dict) 的迭代器，不把整个文件读进内存。
+    无法解析的行产出 (行号, RowError)。CSV 的表头在这里就检查，缺少必填列时直接抛 BulkImportError。
+    """
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        with _read_errors():
+            fieldnames = reader.fieldnames
+        spec.check_header(fieldnames)
+        rows = ((reader.line_num, record) for record in reader)
+    else:
+        rows = _ndjson_records(text)
+    return _guarded(rows)
+
+
+def _ndjson_records(text):
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, RowError('不是合法的 JSON')
+            continue
+        if not isinstance(record, dict):
+            yield line_no, RowError('每行必须是一个 JSON 对象')
+            continue
+        yield line_no, record
+
+
+@contextlib.contextmanager
+def _read_errors():
+    """读文件时的解码 / 解压错误 -> BulkImportError (之后的行都读不出来了)"""
+    try:
+        yield
+    except UnicodeDecodeError:
+        raise BulkImportError('文件不是 UTF-8 编码')
+    except (OSError, EOFError, csv.Error) as e:
+        raise BulkImportError(f'文件无法读取: {e}')
+
+
+def _guarded(rows):
+    with _read_errors():
+        yield from rows
+
+
+# ---------- 写入 ----------
+def _write_chunk(conn, spec, chunk):
+    """一块一个事务；executemany 失败时回滚后逐行重试。返回写入失败的 [((行号, 原始数据, 列值), 原因)]"""
+    rows = [tuple(values.get(c) for c in spec.columns) for _, _, values in chunk]
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany(spec.insert_sql, rows)
+        conn.commit()
+        return []
+    except Exception:
+        conn.rollback()
+    failed = []
+    for item, params in zip(chunk, rows):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(spec.insert_sql, params)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            failed.append((item, f'写入失败: {e}'))
+    return failed
+
+
+def import_records(conn, spec, records, chunk_size=CHUNK_SIZE):
+    """
+    校验 records (read_records 的输出) 并分块写入。
+    每写完一块 yield 一次 (进度, 这一块里出错的 RowFailure 列表)，最后一次是读完之后的汇总。
+    进度: {'read': 已读行数, 'inserted': 已写入行数, 'failed': 出错行数}
+    """
+    with conn.cursor() as cursor:
+        lookups = Lookups(cursor, spec.lookups)
+        seen = spec.load_keys(cursor)
+    conn.commit()
+
+    progress = {'read': 0, 'inserted': 0, 'failed': 0}
+    chunk, failures = [], []
+
+    def flush():
+        failed = _write_chunk(conn, spec, chunk) if chunk else []
+        for (line_no, record, values), error in failed:
+            seen.discard(tuple(values.get(c) for c in spec.key))  # 没有写进去，后面的行还可以用
+            failures.append(RowFailure(line_no, error, record))
+        progress['inserted'] += len(chunk) - len(failed)
+        progress['failed'] += len(failures)
+        return sorted(failures, key=lambda f: f.line)
+
+    for line_no, record in records:
+        progress['read'] += 1
+        try:
+            if isinstance(record, RowError):
+                raise record
+            values = spec.validate(record, lookups)
+            key = tuple(values.get(c) for c in spec.key)
+            if key in seen:
+                raise RowError('与已有数据重复: ' + ' / '.join(str(k) for k in key))
+        except RowError as e:
+            failures.append(RowFailure(line_no, str(e), None if isinstance(record, RowError) else record))
+        else:
+            seen.add(key)
+            chunk.append((line_no, record, values))
+        if len(chunk) + len(failures) >= chunk_size:
+            reported = flush()
+            chunk, failures = [], []
+            yield dict(progress), reported
+    reported = flush()
+    yield dict(progress), reported
@@ -0,0 +1,249 @@
+"""
+专辑排行榜 (进程内物化)。
+
+原来每次打开歌迷页都要 SELECT ... FROM Album ORDER BY avg_score DESC LIMIT 10，
+没有索引时是整表排序。排行榜只在有人评分时才会变化，这里把它物化在进程内:
+- 冷启动 (或超过 refresh_interval) 时一次性加载: Album 的累计值 + 最近 N 天按天汇总的乐评
+- 评分提交后 apply_review() 增量更新内存，常见情况下读排行榜不访问数据库
+- 支持全站 / 单个乐队，以及全部时间 / 最近 7 天 / 30 天等时间窗口
+
+多实例部署时其他实例的写入在下一次刷新后可见。开启 use_table 后，
+写路径同时维护共享底表 Album_Review_Day (见 sql/004_album_review_days.sql)，
+加载时间窗口数据只需读取汇总行，不再对 Review 做 GROUP BY。
+"""
+import datetime
+import heapq
+import threading
+import time
+from decimal import Decimal
+
+from _ratings import to_date
+
+# 时间窗口: 名称 -> 天数 (None 表示全部时间)
+WINDOWS = {'all': None, '30d': 30, '7d': 7}
+SCORE_PLACES = Decimal('0.01')
+
+_DAY_UPSERT_SQL = """
+    INSERT INTO Album_Review_Day (album_id, day, cnt, total) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt), total = total + VALUES(total)
+"""
+
+
+class Leaderboard:
+    """
+    pool: 加载数据用的连接池
+    refresh_interval: 内存数据的最长使用时间 (秒)，超过后下一次读取时重新加载
+    use_table: 是否维护并从 Album_Review_Day 加载时间窗口数据
+    """
+
+    def __init__(self, pool, windows=WINDOWS, refresh_interval=60, use_table=False):
+        self.pool = pool
+        self.windows = dict(windows)
+        self.refresh_interval = refresh_interval
+        self.use_table = use_table
+        self._max_days = max([d for d in self.windows.values() if d] or [0])
+        self._albums = {}  # album_id -> [band_id, title, 乐评数, 总分] (全部时间)
+        self._days = {}  # album_id -> {date: [乐评数, 总分]} (只保留最长时间窗口内的)
+        self._top = {}  # (窗口, band_id, n, 当天) -> 排名结果
+        self._loaded_at = None
+        self._stale = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stats = {'loads': 0, 'reads': 0, 'computed': 0, 'applied': 0}
+
+    # ---------- 加载 ----------
+    def _cutoff(self, today=None):
+        return (today or datetime.date.today()) - datetime.timedelta(days=self._max_days - 1)
+
+    def load(self):
+        """从数据库重新加载全部数据 (整体替换，加载期间读取仍使用旧数据)"""
+        cutoff = self._cutoff()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT album_id, band_id, title, review_count, score_sum FROM Album WHERE review_count > 0")
+                albums = {r['album_id']: [r['band_id'], r['title'], r['review_count'], Decimal(str(r['score_sum']))]
+                          for r in cursor.fetchall()}
+                days = {}
+                if self._max_days:
+                    if self.use_table:
+                        cursor.execute("SELECT album_id, day, cnt, total FROM Album_Review_Day WHERE day >= %s AND cnt > 0", (cutoff,))
+                    else:
+                        cursor.execute("""
+                            SELECT album_id, DATE(review_time) AS day, COUNT(*) AS cnt, SUM(score) AS total
+                            FROM Review WHERE review_time >= %s
+                            GROUP BY album_id, DATE(review_time)
+                        """, (cutoff,))
+                    for r in cursor.fetchall():
+                        days.setdefault(r['album_id'], {})[to_date(r['day'])] = [r['cnt'], Decimal(str(r['total']))]
+            conn.commit()
+        with self._lock:
+            self._albums, self._days, self._top = albums, days, {}
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self._stats['loads'] += 1
+
+    def _expired(self):
+        return self._loaded_at is None or self._stale or time.monotonic() - self._loaded_at >= self.refresh_interval
+
+    def _ensure_fresh(self):
+        if not self._expired():
+            return
+        # 已有数据时只让一个请求去刷新，其余请求继续读旧数据；冷启动时等待加载完成
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._expired():
+                self.load()
+        except Exception as e:
+            if self._loaded_at is None:
+                raise
+            print(f"❌ Leaderboard refresh failed, serving previous data: {e}")
+        finally:
+            self._load_lock.release()
+
+    def warm(self):
+        """冷启动时在后台预先加载 (失败时留给第一次读取重试)"""
+        try:
+            self._ensure_fresh()
+        except Exception as e:
+            print(f"❌ Leaderboard warm-up failed: {e}")
+
+    def invalidate(self):
+        """下一次读取时重新加载 (批量删除、对账等难以增量处理的变更之后调用)"""
+        with self._lock:
+            self._stale = True
+
+    # ---------- 读取 ----------
+    def top(self, n=10, window='all', band_id=None):
+        """排名前 n 的专辑: [{album_id, band_id, title, avg_score, review_count}]"""
+        if window not in self.windows:
+            raise ValueError(f'未知的时间窗口: {window}')
+        self._ensure_fresh()
+        today = datetime.date.today()
+        key = (window, band_id, n, today)
+        with self._lock:
+            self._stats['reads'] += 1
+            cached = self._top.get(key)
+            if cached is None:
+                cached = self._top[key] = self._rank(n, self.windows[window], band_id, today)
+                self._stats['computed'] += 1
+            return cached
+
+    def _rank(self, n, days, band_id, today):
+        if days is None:
+            totals = ((album_id, a[2], a[3]) for album_id, a in self._albums.items())
+        else:
+            cutoff = today - datetime.timedelta(days=days - 1)
+            totals = []
+            for album_id, by_day in self._days.items():
+                cnt = total = 0
+                for day, (c, t) in by_day.items():
+                    if day >= cutoff:
+                        cnt += c
+                        total += t
+                totals.append((album_id, cnt, total))
+        candidates = []
+        for album_id, cnt, total in totals:
+            album = self._albums.get(album_id)
+            if cnt <= 0 or album is None or (band_id is not None and album[0] != band_id):
+                continue
+            candidates.append((Decimal(total) / cnt, cnt, -album_id, album))
+        return [{
+            'album_id': -neg_id,
+            'band_id': album[0],
+            'title': album[1],
+            'avg_score': avg.quantize(SCORE_PLACES),
+            'review_count': cnt,
+        } for avg, cnt, neg_id, album in heapq.nlargest(n, candidates, key=lambda c: c[:3])]
+
+    # ---------- 写路径 ----------
+    def _review_day_deltas(self, album_id, submitted, score):
+        """一次评分在按天汇总上的变化: [(album_id, day, cnt_delta, total_delta)]"""
+        deltas = [(album_id, submitted.day, 1, score)]
+        if submitted.old_score is not None:
+            deltas.append((album_id, submitted.old_day, -1, -submitted.old_score))
+        return deltas
+
+    def persist_review(self, cursor, album_id, submitted, score):
+        """在评分事务内维护共享底表 (未开启 use_table 时什么都不做)"""
+        if self.use_table:
+            cursor.executemany(_DAY_UPSERT_SQL, sorted(self._review_day_deltas(album_id, submitted, score)))
+
+    def apply_review(self, album_id, submitted, score):
+        """评分事务提交后更新内存 (submitted 为 submit_review 的返回值)"""
+        album_id = int(album_id)
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            album = self._albums.get(album_id)
+            if album is None:
+                if submitted.old_score is not None:
+                    # 旧乐评来自加载之后其他实例的写入，内存里没有基数，只能重新加载
+                    self._stale = True
+                    return
+                album = self._albums[album_id] = [submitted.band_id, submitted.title, 0, Decimal(0)]
+            if submitted.old_score is None:
+                album[2] += 1
+                album[3] += score
+            else:
+                album[3] += score - submitted.old_score
+            if self._max_days:
+                cutoff = self._cutoff(submitted.day)
+                by_day = self._days.setdefault(album_id, {})
+                for _, day, cnt, total in self._review_day_deltas(album_id, submitted, score):
+                    if day is not None and day >= cutoff:
+                        bucket = by_day.setdefault(day, [0, Decimal(0)])
+                        bucket[0] += cnt
+                        bucket[1] += total
+            self._top = {}
+            self._stats['applied'] += 1
+
+    def drop_album(self, cursor, album_id):
+        """删除专辑前调用 (事务内)：清理底表中的汇总行"""
+        if self.use_table:
+            cursor.execute("DELETE FROM Album_Review_Day WHERE album_id=%s", (album_id,))
+
+    def retract_fan(self, cursor, fan_id):
+        """删除歌迷前调用 (事务内)：从底表中扣除其乐评"""
+        if self.use_table:
+            cursor.execute("""
+                SELECT album_id, DATE(review_time) AS day, COUNT(*) AS cnt, SUM(score) AS total
+                FROM Review WHERE fan_id=%s GROUP BY album_id, DATE(review_time)
+            """, (fan_id,))
+            rows = [(r['album_id'], to_date(r['day']), -r['cnt'], -Decimal(str(r['total']))) for r in cursor.fetchall()]
+            if rows:
+                cursor.executemany(_DAY_UPSERT_SQL, sorted(rows))
+
+    def remove_album(self, album_id):
+        """专辑删除提交后从内存中移除"""
+        with self._lock:
+            self._albums.pop(album_id, None)
+            self._days.pop(album_id, None)
+            self._top = {}
+
+    def remove_band(self, band_id):
+        with self._lock:
+            for album_id in [a for a, v in self._albums.items() if v[0] == band_id]:
+                self._albums.pop(album_id, None)
+                self._days.pop(album_id, None)
+            self._top = {}
+
+    def rebuild_table(self, conn):
+        """按 Review 全量重建底表中最长时间窗口内的汇总行 (首次开启 use_table 或修正漂移时使用)"""
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM Album_Review_Day")
+            cursor.execute("""
+                INSERT INTO Album_Review_Day (album_id, day, cnt, total)
+                SELECT album_id, DATE(review_time), COUNT(*), SUM(score)
+                FROM Review WHERE review_time >= %s
+                GROUP BY album_id, DATE(review_time)
+            """, (self._cutoff(),))
+            rows = cursor.rowcount
+        conn.commit()
+        self.invalidate()
+        return rows
+
+    def stats(self):
+        with self._lock:
+            age = time.monotonic() - self._loaded_at if self._loaded_at is not None else -1
+            return dict(self._stats, albums=len(self._albums), age_seconds=age)
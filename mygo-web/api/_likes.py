@@ -0,0 +1,140 @@
+"""
+关注 / 收藏 / 报名关系的写入。
+
+toggle_like 原来要先 SELECT 判断是否已关注，再 DELETE 或 INSERT，之后重定向重新渲染整个页面。
+这里:
+- 明确给出 like / unlike 时只执行一条语句 (INSERT IGNORE 或 DELETE)，由影响行数判断是否真的改变
+- apply_like_ops() 一次处理多条操作：同一目标只保留最后一次操作，按表分组，
+  插入用 executemany 合并成一条多行 INSERT，删除用一条 IN 语句，在调用方的同一个事务里完成
+- apply_like_batch() 是多个歌迷的版本 (写后缓冲批量写入时用，见 _writebehind.py)
+"""
+
+# 类型 -> (关系表, 目标列)
+LIKE_TABLES = {
+    'band': ('Fan_Like_Band', 'band_id'),
+    'album': ('Fan_Like_Album', 'album_id'),
+    'song': ('Fan_Like_Song', 'song_id'),
+    'concert': ('Fan_Attend_Concert', 'concert_id')
+}
+# 类型 -> 目标表 (主键列与 LIKE_TABLES 里的目标列同名)
+LIKE_TARGETS = {'band': 'Band', 'album': 'Album', 'song': 'Song', 'concert': 'Concert'}
+LIKE_OPS = ('like', 'unlike')
+
+
+def set_like(cursor, fan_id, kind, target_id, op):
+    """单条语句设置关注状态。返回 True 表示关系确实发生了变化"""
+    table, col = LIKE_TABLES[kind]
+    if op == 'like':
+        # 从目标表里选出来再插入：目标不存在时什么都不插 (不依赖外键错误被 IGNORE)
+        cursor.execute(f"INSERT IGNORE INTO {table} (fan_id, {col}) SELECT %s, {col} FROM {LIKE_TARGETS[kind]} WHERE {col}=%s",
+                       (fan_id, target_id))
+    else:
+        cursor.execute(f"DELETE FROM {table} WHERE fan_id=%s AND {col}=%s", (fan_id, target_id))
+    return cursor.rowcount > 0
+
+
+def is_liked(cursor, fan_id, kind, target_id):
+    """当前是否已关注"""
+    table, col = LIKE_TABLES[kind]
+    cursor.execute(f"SELECT 1 FROM {table} WHERE fan_id=%s AND {col}=%s", (fan_id, target_id))
+    return cursor.fetchone() is not None
+
+
+def target_exists(cursor, kind, target_id):
+    """关注的目标是否存在 (INSERT IGNORE 没有插入时区分「已经关注」和「目标不存在」)"""
+    _, col = LIKE_TABLES[kind]
+    cursor.execute(f"SELECT 1 FROM {LIKE_TARGETS[kind]} WHERE {col}=%s", (target_id,))
+    return cursor.fetchone() is not None
+
+
+def toggle(cursor, fan_id, kind, target_id):
+    """
+    不知道当前状态时的切换：先尝试关注 (INSERT IGNORE)，插入了说明原来没有关注；
+    没插入说明已经关注或目标不存在，再删除，删掉了就是取关，什么都没删到说明目标不存在。
+    返回 (是否为关注状态, 是否发生变化)，目标不存在时为 (None, False)。
+    """
+    if set_like(cursor, fan_id, kind, target_id, 'like'):
+        return True, True
+    if set_like(cursor, fan_id, kind, target_id, 'unlike'):
+        return False, True
+    return None, False
+
+
+def parse_ops(raw_ops):
+    """
+    校验并合并请求里的操作列表: [{"type": "song", "id": 3, "op": "like"}, ...]
+    返回 ({类型: {id: op}}, 错误列表)；同一目标以最后一次操作为准。
+    """
+    ops, errors = {}, []
+    if not isinstance(raw_ops, list):
+        return ops, ['ops 必须是数组']
+    for i, item in enumerate(raw_ops):
+        if not isinstance(item, dict):
+            errors.append(f'#{i}: 必须是对象')
+            continue
+        kind, op = item.get('type'), item.get('op')
+        try:
+            target_id = int(item.get('id'))
+        except (TypeError, ValueError):
+            errors.append(f'#{i}: 无效的 id')
+            continue
+        if kind not in LIKE_TABLES:
+            errors.append(f'#{i}: 未知类型 {kind}')
+        elif op not in LIKE_OPS:
+            errors.append(f'#{i}: 未知操作 {op}')
+        else:
+            ops.setdefault(kind, {})[target_id] = op
+    return ops, errors
+
+
+def apply_like_ops(cursor, fan_id, ops):
+    """
+    在当前事务里批量应用操作。ops: {类型: {id: 'like'/'unlike'}}
+    返回 (新状态 {类型: {id: 是否关注}}, 实际变化 {类型: {id: +1/-1}})。调用方负责 commit。
+    """
+    state, changes = apply_like_batch(cursor, {fan_id: ops})
+    return state.get(fan_id, {}), changes.get(fan_id, {})
+
+
+def apply_like_batch(cursor, ops_by_fan):
+    """
+    多个歌迷的操作一起应用 (写后缓冲一次写入一批)：每张关系表一条锁定读、一条多行 INSERT、一条 DELETE。
+    ops_by_fan: {fan_id: {类型: {id: op}}}。返回 ({fan_id: 新状态}, {fan_id: 实际变化})，格式同 apply_like_ops。
+    """
+    state, changes = {}, {}
+    for kind, (table, col) in LIKE_TABLES.items():
+        pairs = sorted((fan_id, i) for fan_id, ops in ops_by_fan.items() for i in ops.get(kind) or ())
+        if not pairs:
+            continue
+        ops = {(fan_id, i): ops_by_fan[fan_id][kind][i] for fan_id, i in pairs}
+        placeholders = ', '.join(['(%s, %s)'] * len(pairs))
+        flat = [x for pair in pairs for x in pair]
+        # 锁住已有的关系行，得到精确的变化集合 (统计只计真实变化)
+        cursor.execute(f"SELECT fan_id, {col} AS id FROM {table} WHERE (fan_id, {col}) IN ({placeholders}) FOR UPDATE", flat)
+        existing = {(r['fan_id'], r['id']) for r in cursor.fetchall()}
+
+        to_insert = [p for p in pairs if ops[p] == 'like' and p not in existing]
+        to_delete = [p for p in pairs if ops[p] == 'unlike' and p in existing]
+        inserted = set()
+        if to_insert:
+            # pymysql 会把 executemany 的 INSERT ... VALUES 合并成一条多行语句
+            cursor.executemany(f"INSERT IGNORE INTO {table} (fan_id, {col}) VALUES (%s, %s)", to_insert)
+            if cursor.rowcount == len(to_insert):
+                inserted = set(to_insert)
+            else:
+                # 有目标不存在 (外键被 IGNORE 跳过)，重新读一次确定哪些插入成功
+                cursor.execute(f"SELECT fan_id, {col} AS id FROM {table} WHERE (fan_id, {col}) IN ({placeholders})", flat)
+                inserted = {(r['fan_id'], r['id']) for r in cursor.fetchall()} - existing
+        if to_delete:
+            delete_marks = ', '.join(['(%s, %s)'] * len(to_delete))
+            cursor.execute(f"DELETE FROM {table} WHERE (fan_id, {col}) IN ({delete_marks})", [x for pair in to_delete for x in pair])
+
+        deleted = set(to_delete)
+        for fan_id, i in pairs:
+            fan_changes = changes.setdefault(fan_id, {}).setdefault(kind, {})
+            if (fan_id, i) in inserted:
+                fan_changes[i] = 1
+            elif (fan_id, i) in deleted:
+                fan_changes[i] = -1
+            state.setdefault(fan_id, {}).setdefault(kind, {})[i] = ((fan_id, i) in existing or (fan_id, i) in inserted) and (fan_id, i) not in deleted
+    return state, changes
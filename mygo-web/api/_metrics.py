@@ -0,0 +1,275 @@
+"""
+SQL 与路由埋点。
+
+- 每次 cursor.execute: 语句指纹、耗时、返回行数、发起的路由 -> 直方图；超过阈值写慢查询日志
+- 每个请求: 总耗时、数据库总耗时、往返次数、模板渲染耗时
+- expose() 输出 Prometheus 文本格式，由 /admin/metrics 提供
+
+开销控制：指纹按 SQL 文本缓存 (路由里的 SQL 基本都是常量字符串)，
+每次执行只多两次 perf_counter 和一次加锁的计数。
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+slow_log = logging.getLogger('mygo.slow_query')
+error_log = logging.getLogger('mygo.db')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+# pymysql 非缓冲 cursor (SSCursor) 执行后的 rowcount (无符号 -1)
+UNKNOWN_ROWCOUNT = 2 ** 64 - 1
+
+
+# ================= 指标类型 =================
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [各桶计数 (最后一个是 +Inf), 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, c in zip(self.buckets + ('+Inf',), counts):
+                cumulative += c
+                lines.append(f'{self.name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = sorted(self._series.items())
+        lines += [f'{self.name}{_format_labels(labels)} {_format_value(v)}' for labels, v in snapshot]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []  # 导出时现取的外部数值 (连接池、缓存等)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_collector(self, prefix, help_text, fn):
+        """fn() 返回 {名称: 数值}，导出为 prefix_名称 的 gauge"""
+        self._collectors.append((prefix, help_text, fn))
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.expose()
+        for prefix, help_text, fn in self._collectors:
+            try:
+                values = fn()
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f'{prefix}_{key}'
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {_format_value(value)}']
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+query_seconds = registry.histogram('mygo_db_query_seconds', 'SQL execution latency by statement fingerprint and route')
+query_rows = registry.histogram('mygo_db_query_rows', 'Rows returned or affected per statement', ROW_BUCKETS)
+query_errors = registry.counter('mygo_db_query_errors_total', 'Failed SQL executions')
+request_seconds = registry.histogram('mygo_request_seconds', 'Total request latency')
+request_db_seconds = registry.histogram('mygo_request_db_seconds', 'Time spent in the database per request')
+request_round_trips = registry.histogram('mygo_request_db_round_trips', 'SQL round trips per request', COUNT_BUCKETS)
+render_seconds = registry.histogram('mygo_template_render_seconds', 'Jinja template render time')
+
+
+# ================= SQL 指纹 =================
+_COMMENT_RE = re.compile(r'/\*.*?\*/|--[^\n]*', re.S)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|%\(\w+\)s')
+# 单个元素的 (?) 也折叠，否则批量大小为 1 的语句会单独成一个序列
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+# 行值列表 ((?, ?), (?, ?), ...) 在内层折叠之后再折叠一次
+_ROW_LIST_RE = re.compile(r'\(\s*\(\?\+\)(?:\s*,\s*\(\?\+\))*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """把字面量和占位符替换成 ?，IN 列表折叠，空白归一化；同一条语句的不同参数得到同一个指纹"""
+    fp = _COMMENT_RE.sub(' ', sql)
+    fp = _STRING_RE.sub('?', fp)
+    fp = _PLACEHOLDER_RE.sub('?', fp)
+    fp = _NUMBER_RE.sub('?', fp)
+    fp = _IN_LIST_RE.sub('(?+)', fp)
+    fp = _ROW_LIST_RE.sub('((?+)+)', fp)
+    return _SPACE_RE.sub(' ', fp).strip()[:300]
+
+
+# ================= 请求上下文 =================
+class RequestStats:
+    """一个请求内的数据库统计 (并行查询的工作线程会共享同一个对象)"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.round_trips = 0
+        self.render_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.db_seconds += seconds
+            self.round_trips += 1
+
+
+_current = contextvars.ContextVar('mygo_request_stats', default=None)
+
+
+def begin_request(route):
+    stats = RequestStats(route)
+    _current.set(stats)
+    return stats
+
+
+def current_request():
+    return _current.get()
+
+
+def end_request(method, status):
+    """请求结束时写入直方图并返回本次的 RequestStats"""
+    stats = _current.get()
+    if stats is None:
+        return None
+    _current.set(None)
+    route = stats.route
+    request_seconds.observe(time.perf_counter() - stats.started, route=route, method=method, status=str(status))
+    request_db_seconds.observe(stats.db_seconds, route=route)
+    request_round_trips.observe(stats.round_trips, route=route)
+    return stats
+
+
+def observe_render(template, seconds):
+    render_seconds.observe(seconds, template=template)
+    stats = _current.get()
+    if stats is not None:
+        stats.render_seconds += seconds
+
+
+# ================= cursor 包装 =================
+class InstrumentedCursor:
+    """包装 pymysql cursor，记录每次 execute 的指纹、耗时、行数和路由"""
+
+    slow_query_seconds = 0.2
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _observe(self, sql, seconds, rows, failed=False):
+        stats = _current.get()
+        route = stats.route if stats is not None else '-'
+        fp = fingerprint(sql)
+        if stats is not None:
+            stats.add_query(seconds)
+        if failed:
+            query_errors.inc(query=fp, route=route)
+            return
+        query_seconds.observe(seconds, query=fp, route=route)
+        if 0 <= rows < UNKNOWN_ROWCOUNT:  # 流式 cursor 在读完前 rowcount 未知
+            query_rows.observe(rows, query=fp, route=route)
+        if seconds >= self.slow_query_seconds:
+            slow_log.warning('slow query %.1fms rows=%s route=%s: %s', seconds * 1000, rows, route, fp)
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            result = self._cursor.execute(query, args)
+        except Exception as e:
+            self._observe(query, time.perf_counter() - start, 0, failed=True)
+            error_log.error('query failed (%s): %s', e, fingerprint(query))
+            raise
+        self._observe(query, time.perf_counter() - start, self._cursor.rowcount)
+        return result
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            result = self._cursor.executemany(query, args)
+        except Exception as e:
+            self._observe(query, time.perf_counter() - start, 0, failed=True)
+            error_log.error('query failed (%s): %s', e, fingerprint(query))
+            raise
+        self._observe(query, time.perf_counter() - start, self._cursor.rowcount)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
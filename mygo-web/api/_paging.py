@@ -0,0 +1,80 @@
+"""
+键集分页 (keyset / cursor pagination)。
+
+不用 OFFSET：翻到第 N 页时数据库仍要扫过前面所有行。
+这里记住上一页最后一行的排序键，下一页用 "排序键 > 上次的值" 直接从索引定位。
+排序键的最后一列必须唯一 (通常是主键)，保证顺序稳定、不重不漏。
+"""
+import base64
+import json
+from collections import namedtuple
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), ensure_ascii=False, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """解析游标；格式不对时返回 None (当作第一页)"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def _after_predicate(columns):
+    """(a, b, c) > (x, y, z) 展开成 a > x OR (a = x AND b > y) OR ...，各数据库都能走索引"""
+    clauses = []
+    for i, col in enumerate(columns):
+        eqs = [f"{c} = %s" for c in columns[:i]]
+        clauses.append('(' + ' AND '.join(eqs + [f"{col} > %s"]) + ')')
+    return '(' + ' OR '.join(clauses) + ')'
+
+
+def _after_args(values):
+    args = []
+    for i in range(len(values)):
+        args.extend(values[:i + 1])
+    return args
+
+
+def keyset_page(cursor, select_sql, key_columns, after=None, limit=50, where=None, args=()):
+    """
+    执行一次键集分页查询。
+
+    select_sql: "SELECT ... FROM ..." (不含 WHERE / ORDER BY / LIMIT)
+    key_columns: [(SQL 列名, 结果字典中的键名)]，按顺序排序，最后一列必须唯一
+    after: 上一页返回的 next_cursor
+    where / args: 额外过滤条件及其参数
+    """
+    sql_columns = [c for c, _ in key_columns]
+    conditions, params = [], list(args)
+    if where:
+        conditions.append(f'({where})')
+    values = decode_cursor(after, len(key_columns))
+    if values is not None:
+        conditions.append(_after_predicate(sql_columns))
+        params.extend(_after_args(values))
+
+    sql = select_sql
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY ' + ', '.join(sql_columns) + ' LIMIT %s'
+    params.append(limit + 1)  # 多取一行，判断是否还有下一页
+
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][key] for _, key in key_columns)
+    return Page(rows, next_cursor)
@@ -0,0 +1,169 @@
+"""
+专辑评分聚合。
+
+Album 上维护 review_count / score_sum 两个累计值，提交乐评时 O(1) 增量更新，
+不再每次 AVG() 扫描该专辑的全部乐评。
+reconcile_album_aggregates() 用于一次性全量对账，修正累计值的漂移。
+"""
+import datetime
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+MIN_SCORE = Decimal('0')
+MAX_SCORE = Decimal('10')
+
+# avg_score 放在最前面：右侧引用的 score_sum / review_count 一定是更新前的值
+_APPLY_DELTA_SQL = """
+    UPDATE Album
+    SET avg_score = (score_sum + %s) / NULLIF(review_count + %s, 0),
+        score_sum = score_sum + %s,
+        review_count = review_count + %s
+    WHERE album_id = %s
+"""
+
+
+# submit_review 的结果：旧分数 / 旧日期在首次评价时为 None，day 为本次写入的日期 (数据库当天)
+SubmittedReview = namedtuple('SubmittedReview', ['band_id', 'title', 'old_score', 'old_day', 'day'])
+
+
+def parse_score(raw):
+    """表单里的分数 -> Decimal，超出 0~10 抛 ValueError"""
+    try:
+        score = Decimal(str(raw).strip())
+    except (InvalidOperation, AttributeError):
+        raise ValueError(f'无效的评分: {raw}')
+    if not MIN_SCORE <= score <= MAX_SCORE:
+        raise ValueError(f'评分需在 {MIN_SCORE} - {MAX_SCORE} 之间')
+    return score
+
+
+def parse_album_id(raw):
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f'无效的专辑: {raw}')
+
+
+def apply_album_delta(cursor, album_id, count_delta, sum_delta):
+    """按增量修改专辑的累计值并同步 avg_score"""
+    cursor.execute(_APPLY_DELTA_SQL, (sum_delta, count_delta, sum_delta, count_delta, album_id))
+
+
+def submit_review(cursor, fan_id, album_id, score, comment):
+    """
+    写入或覆盖一条乐评，并增量维护专辑聚合。
+    首次评价: count + 1, sum + score；重新评价: count 不变, sum + (新分 - 旧分)。
+    返回 SubmittedReview (排行榜据此增量更新)。调用方负责 commit。
+    """
+    submitted = submit_reviews(cursor, [(fan_id, album_id, score, comment)])[0]
+    if submitted is None:
+        raise ValueError('专辑不存在')
+    return submitted
+
+
+def submit_reviews(cursor, reviews):
+    """
+    批量版 submit_review (写后缓冲一次写入一批)。reviews: [(fan_id, album_id, score, comment)]，
+    同一 (歌迷, 专辑) 只能出现一次。乐评用一条多行 INSERT 写入，同一专辑的累计值变化合并成一条 UPDATE。
+    返回与 reviews 一一对应的 SubmittedReview，专辑不存在的为 None。
+    """
+    reviews = [(fan_id, parse_album_id(album_id), parse_score(score), comment) for fan_id, album_id, score, comment in reviews]
+    if not reviews:
+        return []
+    # 按主键顺序锁住专辑行和这些歌迷的乐评行，保证并发重复提交时 delta 计算正确
+    album_ids = sorted({album_id for _, album_id, _, _ in reviews})
+    cursor.execute(f"""
+        SELECT album_id, band_id, title, CURRENT_DATE AS today FROM Album
+        WHERE album_id IN ({', '.join(['%s'] * len(album_ids))}) ORDER BY album_id FOR UPDATE
+    """, album_ids)
+    albums = {r['album_id']: r for r in cursor.fetchall()}
+    pairs = sorted((fan_id, album_id) for fan_id, album_id, _, _ in reviews if album_id in albums)
+    if not pairs:
+        return [None] * len(reviews)
+    cursor.execute(f"""
+        SELECT fan_id, album_id, score, review_time FROM Review
+        WHERE (fan_id, album_id) IN ({', '.join(['(%s, %s)'] * len(pairs))}) FOR UPDATE
+    """, [x for pair in pairs for x in pair])
+    existing = {(r['fan_id'], r['album_id']): r for r in cursor.fetchall()}
+
+    cursor.executemany("""
+        INSERT INTO Review (fan_id, album_id, score, comment, review_time)
+        VALUES (%s, %s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE
+        score = VALUES(score), comment = VALUES(comment), review_time = NOW()
+    """, [r for r in reviews if r[1] in albums])
+
+    results, deltas = [], {}  # deltas: album_id -> [count, sum]
+    for fan_id, album_id, score, comment in reviews:
+        album = albums.get(album_id)
+        if album is None:
+            results.append(None)
+            continue
+        today = to_date(album['today'])
+        delta = deltas.setdefault(album_id, [0, Decimal(0)])
+        current = existing.get((fan_id, album_id))
+        if current is None or current['score'] is None:
+            delta[0] += 1
+            delta[1] += score
+            results.append(SubmittedReview(album['band_id'], album['title'], None, None, today))
+            continue
+        old_score = Decimal(str(current['score']))
+        delta[1] += score - old_score
+        results.append(SubmittedReview(album['band_id'], album['title'], old_score, to_date(current['review_time']), today))
+    changed = [(album_id, count, total) for album_id, (count, total) in sorted(deltas.items()) if count or total]
+    if changed:
+        cursor.executemany(_APPLY_DELTA_SQL, [(total, count, total, count, album_id) for album_id, count, total in changed])
+    return results
+
+
+def to_date(value):
+    """DATE / DATETIME 列的值 (驱动不同，可能是 date、datetime 或字符串) -> date"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def reconcile_album_aggregates(conn, album_ids=None):
+    """
+    全量对账：一次 GROUP BY 重新统计每张专辑的乐评数与总分，
+    只改写与累计值不一致的专辑。返回漂移列表。
+    album_ids 不为空时只对这些专辑对账。
+    """
+    where, args = '', ()
+    if album_ids:
+        album_ids = list(album_ids)
+        placeholders = ', '.join(['%s'] * len(album_ids))
+        where, args = f'WHERE a.album_id IN ({placeholders})', tuple(album_ids)
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT a.album_id, a.title, a.review_count, a.score_sum,
+                   IFNULL(r.cnt, 0) AS actual_count, IFNULL(r.total, 0) AS actual_sum
+            FROM Album a
+            LEFT JOIN (SELECT album_id, COUNT(*) AS cnt, SUM(score) AS total FROM Review GROUP BY album_id) r
+                ON r.album_id = a.album_id
+            {where}
+        """, args)
+        drift = []
+        for row in cursor.fetchall():
+            stored_sum = Decimal(str(row['score_sum'] or 0))
+            actual_sum = Decimal(str(row['actual_sum']))
+            if row['review_count'] != row['actual_count'] or stored_sum != actual_sum:
+                drift.append({
+                    'album_id': row['album_id'],
+                    'title': row['title'],
+                    'stored_count': row['review_count'],
+                    'actual_count': row['actual_count'],
+                    'stored_sum': stored_sum,
+                    'actual_sum': actual_sum,
+                })
+        if drift:
+            cursor.executemany("""
+                UPDATE Album
+                SET review_count = %s, score_sum = %s, avg_score = %s / NULLIF(%s, 0)
+                WHERE album_id = %s
+            """, [(d['actual_count'], d['actual_sum'], d['actual_sum'], d['actual_count'], d['album_id']) for d in drift])
+    conn.commit()
+    return drift
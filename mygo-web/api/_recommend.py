@@ -0,0 +1,382 @@
+"""
+"喜欢这个的歌迷也喜欢" 与个性化推荐 (物品协同过滤)。
+
+信号: 歌迷对乐队 / 专辑 / 歌曲的关注 (Fan_Like_*)，专辑另外算上 8 分及以上的乐评。
+演唱会报名不参与 (场次很快过期，推荐价值低)；低分乐评不当作喜欢。
+
+- 离线批量 (rebuild): 按类型把 (歌迷, 物品) 关系读进内存，建成两张稀疏邻接表
+  (物品 -> 歌迷, 歌迷 -> 物品)，逐个物品求共现计数 (即 AᵀA 的一行)，
+  按带收缩的余弦相似度 co / sqrt(n_i·n_j) · co / (co + SHRINK) 取前 K 个，写入 Item_Neighbor
+- 增量 (refresh): 关注变化时在同一事务里写脏标记 (Item_Neighbor_Dirty)，
+  refresh 只对被标记的物品用 GROUP BY 重新计算它自己的相似列表 (不回头更新它的邻居，邻居在自己被标记
+  或下一次全量重建时更新)
+- 在线 (Recommender): 进程内加载 Item_Neighbor (相似列表保持紧凑编码，用到时才解码)，
+  把歌迷已关注物品的相似列表加权求和，排除已关注的，几毫秒内得出推荐；没有关注的歌迷看热门
+
+相似列表编码: K 个 uint32 id 后接 K 个 uint16 相似度 (×65535)，小端序。
+"""
+import heapq
+import math
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+
+KINDS = ('band', 'album', 'song')
+# 类型 -> ((关系表, 目标列, 额外条件), ...)；多张表的关系合并去重
+SIGNALS = {
+    'band': (('Fan_Like_Band', 'band_id', None),),
+    'album': (('Fan_Like_Album', 'album_id', None), ('Review', 'album_id', 'score >= 8')),
+    'song': (('Fan_Like_Song', 'song_id', None),),
+}
+REVIEW_LIKE_SCORE = 8  # 与 SIGNALS 里的乐评条件一致
+# 类型 -> (物品表, 主键, 标题列, 链接列)
+ITEM_TABLES = {
+    'band': ('Band', 'band_id', 'name', 'netease_url'),
+    'album': ('Album', 'album_id', 'title', None),
+    'song': ('Song', 'song_id', 'title', 'netease_url'),
+}
+
+TOP_K = 20
+SHRINK = 2.0  # 共现次数很少时压低相似度 (两个冷门物品恰好被同一个人关注)
+MAX_FANS_PER_ITEM = 2000  # 热门物品只取这么多歌迷计算共现
+MAX_ITEMS_PER_FAN = 500  # 批量重建时跳过关注过多的账号 (刷关注 / 测试号)，它们让计算量平方增长
+MAX_SEEDS = 100  # 个性化推荐最多用歌迷的多少个已关注物品
+POPULAR_SIZE = 50
+FETCH_SIZE = 10000
+IN_CHUNK = 500
+
+_SCALE = 65535
+_LITTLE = sys.byteorder == 'little'
+
+
+# ---------- 相似列表编码 ----------
+def encode_neighbors(neighbors):
+    """[(item_id, 相似度 0~1)] -> bytes"""
+    ids = array('I', [i for i, _ in neighbors])
+    sims = array('H', [max(0, min(_SCALE, round(s * _SCALE))) for _, s in neighbors])
+    if not _LITTLE:
+        ids.byteswap()
+        sims.byteswap()
+    return ids.tobytes() + sims.tobytes()
+
+
+def decode_neighbors(blob):
+    """bytes -> [(item_id, 相似度)]"""
+    n = len(blob) // 6
+    ids, sims = array('I'), array('H')
+    ids.frombytes(blob[:4 * n])
+    sims.frombytes(blob[4 * n:6 * n])
+    if not _LITTLE:
+        ids.byteswap()
+        sims.byteswap()
+    return [(i, s / _SCALE) for i, s in zip(ids, sims)]
+
+
+def similarity(co, n_i, n_j):
+    return co / math.sqrt(n_i * n_j) * co / (co + SHRINK)
+
+
+def _signal_sql(kind, where=None):
+    """
+    该类型全部 (fan_id, item_id) 关系的查询；where 里的 {col} 替换成各关系表的目标列。
+    返回 (SQL, 每组参数要重复的次数)
+    """
+    parts = []
+    for table, col, cond in SIGNALS[kind]:
+        conds = [c for c in (cond, where.format(col=col) if where else None) if c]
+        parts.append(f"SELECT fan_id, {col} AS item_id FROM {table}" + (f" WHERE {' AND '.join(conds)}" if conds else ''))
+    return ' UNION '.join(parts), len(parts)
+
+
+def _top_neighbors(item_id, co, n_i, fans_of, k):
+    scored = ((similarity(c, n_i, fans_of(j)), j) for j, c in co.items() if j != item_id)
+    return [(j, s) for s, j in heapq.nlargest(k, scored, key=lambda p: (p[0], -p[1]))]
+
+
+_UPSERT_SQL = """
+    INSERT INTO Item_Neighbor (kind, item_id, fans, neighbors) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE fans = VALUES(fans), neighbors = VALUES(neighbors)
+"""
+
+
+class Recommender:
+    """
+    pool: 加载数据用的连接池
+    refresh_interval: 内存数据的最长使用时间 (秒)，超过后下一次读取时重新加载
+    k: 每个物品保存的相似物品数
+    """
+
+    def __init__(self, pool, refresh_interval=600, k=TOP_K):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self.k = k
+        self._items = {kind: {} for kind in KINDS}  # 类型 -> {id: (关注人数, 标题, 链接, 相似列表编码)}
+        self._popular = {kind: [] for kind in KINDS}  # 类型 -> 关注人数最多的 id
+        self._loaded_at = None
+        self._stale = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stats = {'loads': 0, 'reads': 0, 'load_seconds': 0.0}
+
+    # ---------- 加载 ----------
+    def load(self):
+        """从 Item_Neighbor 重新加载 (只保留物品仍然存在的行，顺带取标题和链接)"""
+        started = time.perf_counter()
+        items = {}
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                for kind, (table, col, title, url) in ITEM_TABLES.items():
+                    cursor.execute(f"""
+                        SELECT n.item_id, n.fans, n.neighbors, t.{title} AS title{f', t.{url} AS url' if url else ''}
+                        FROM Item_Neighbor n JOIN {table} t ON t.{col} = n.item_id
+                        WHERE n.kind = %s
+                    """, (kind,))
+                    items[kind] = {r['item_id']: (r['fans'], r['title'], r.get('url'), bytes(r['neighbors']))
+                                   for r in cursor.fetchall()}
+            conn.commit()
+        popular = {kind: heapq.nlargest(POPULAR_SIZE, by_id, key=lambda i, by_id=by_id: (by_id[i][0], -i))
+                   for kind, by_id in items.items()}
+        with self._lock:
+            self._items, self._popular = items, popular
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self._stats['loads'] += 1
+            self._stats['load_seconds'] = time.perf_counter() - started
+
+    def _expired(self):
+        return self._loaded_at is None or self._stale or time.monotonic() - self._loaded_at >= self.refresh_interval
+
+    def _ensure_fresh(self):
+        if not self._expired():
+            return
+        # 已有数据时只让一个请求去刷新，其余请求继续读旧数据；冷启动时等待加载完成
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._expired():
+                self.load()
+        except Exception as e:
+            if self._loaded_at is None:
+                raise
+            print(f"❌ Recommender refresh failed, serving previous data: {e}")
+        finally:
+            self._load_lock.release()
+
+    def warm(self):
+        try:
+            self._ensure_fresh()
+        except Exception as e:
+            print(f"❌ Recommender warm-up failed: {e}")
+
+    def invalidate(self):
+        """下一次读取时重新加载 (全量重建 / 增量刷新、批量删除之后调用)"""
+        with self._lock:
+            self._stale = True
+
+    def remove(self, kind, item_id):
+        """物品删除提交后从内存中移除 (别的物品相似列表里的引用在读取时跳过)"""
+        with self._lock:
+            if self._items.get(kind, {}).pop(item_id, None) is not None:
+                self._popular[kind] = [i for i in self._popular[kind] if i != item_id]
+
+    # ---------- 读取 ----------
+    def _result(self, kind, item_id, score, reason=None):
+        fans, title, url, _ = self._items[kind][item_id]
+        return {'type': kind, 'id': item_id, 'title': title, 'netease_url': url, 'fans': fans,
+                'score': round(score, 3), 'reason': reason}
+
+    def similar(self, kind, item_id, n=10):
+        """喜欢这个物品的歌迷也喜欢: [{type, id, title, netease_url, fans, score, reason}]"""
+        self._ensure_fresh()
+        with self._lock:
+            self._stats['reads'] += 1
+            items = self._items.get(kind, {})
+            entry = items.get(item_id)
+            if entry is None:
+                return []
+            return [self._result(kind, j, s) for j, s in decode_neighbors(entry[3]) if j in items][:n]
+
+    def for_fan(self, seeds, n=10):
+        """
+        个性化推荐。seeds: {类型: [已关注的 id]} (调用方已经查出来的关注列表，这里不再访问数据库)。
+        每个候选的得分是它与各个已关注物品的相似度之和；reason 是贡献最大的那个已关注物品的标题。
+        推荐不足 n 个时用 seeds 里各类型的热门物品补齐 (reason 为 None)。
+        """
+        self._ensure_fresh()
+        with self._lock:
+            self._stats['reads'] += 1
+            seeds = {kind: set(ids) for kind, ids in seeds.items() if kind in self._items}
+            scores = {}  # (类型, id) -> [得分, 最大贡献, 来源标题]
+            for kind, liked in seeds.items():
+                items = self._items[kind]
+                for seed_id in sorted(liked)[:MAX_SEEDS]:
+                    entry = items.get(seed_id)
+                    if entry is None:
+                        continue
+                    for j, sim in decode_neighbors(entry[3]):
+                        if j in liked or j not in items:
+                            continue
+                        slot = scores.get((kind, j))
+                        if slot is None:
+                            scores[(kind, j)] = [sim, sim, entry[1]]
+                            continue
+                        slot[0] += sim
+                        if sim > slot[1]:
+                            slot[1], slot[2] = sim, entry[1]
+            best = heapq.nlargest(n, scores.items(), key=lambda p: (p[1][0], -p[0][1]))
+            results = [self._result(kind, j, slot[0], slot[2]) for (kind, j), slot in best]
+            if len(results) < n:
+                taken = {(r['type'], r['id']) for r in results}
+                fill = [(self._items[kind][j][0], kind, j) for kind, liked in seeds.items()
+                        for j in self._popular[kind] if (kind, j) not in taken and j not in liked and j in self._items[kind]]
+                for _, kind, j in heapq.nlargest(n - len(results), fill, key=lambda p: (p[0], -p[2])):
+                    results.append(self._result(kind, j, 0.0))
+            return results
+
+    # ---------- 写路径 ----------
+    @staticmethod
+    def mark_dirty(cursor, changes):
+        """在关注事务内标记需要增量刷新的物品。changes: {类型: id 的集合} (未参与推荐的类型忽略)"""
+        rows = sorted((kind, int(i)) for kind, ids in changes.items() if kind in SIGNALS for i in ids)
+        if rows:
+            cursor.executemany("INSERT IGNORE INTO Item_Neighbor_Dirty (kind, item_id) VALUES (%s, %s)", rows)
+
+    @classmethod
+    def mark_review(cls, cursor, album_id, submitted, score):
+        """评分事务内调用：乐评跨过 "喜欢" 的分数线时标记专辑 (submitted 为 submit_review 的返回值)"""
+        old = submitted.old_score
+        if (score >= REVIEW_LIKE_SCORE) != (old is not None and old >= REVIEW_LIKE_SCORE):
+            cls.mark_dirty(cursor, {'album': [album_id]})
+
+    @classmethod
+    def mark_fan(cls, cursor, fan_id):
+        """删除歌迷前调用 (事务内)：标记其关注过的所有物品"""
+        changes = {}
+        for kind in SIGNALS:
+            sql, repeat = _signal_sql(kind, 'fan_id = %s')
+            cursor.execute(f"SELECT item_id FROM ({sql}) s", (fan_id,) * repeat)
+            changes[kind] = [r['item_id'] for r in cursor.fetchall()]
+        cls.mark_dirty(cursor, changes)
+
+    # ---------- 离线计算 ----------
+    def rebuild(self, conn, kinds=KINDS, cursorclass=None):
+        """
+        全量重建 Item_Neighbor。每个类型一个事务 (先删后写，其他连接在提交前读到的仍是旧数据)。
+        cursorclass: 读取关系用的 cursor (MySQL 上传非缓冲 cursor，避免一次把全部结果取进内存)。
+        返回 {类型: 写入行数}
+        """
+        written = {}
+        for kind in kinds:
+            # 先清脏标记：重建期间新产生的标记会保留下来，交给下一次增量刷新
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM Item_Neighbor_Dirty WHERE kind=%s", (kind,))
+            conn.commit()
+
+            fans_of, items_of = {}, {}
+            sql, _ = _signal_sql(kind)
+            cursor = conn.cursor(cursorclass) if cursorclass else conn.cursor()
+            try:
+                cursor.execute(sql)
+                while True:
+                    rows = cursor.fetchmany(FETCH_SIZE)
+                    if not rows:
+                        break
+                    for r in rows:
+                        fans_of.setdefault(r['item_id'], []).append(r['fan_id'])
+                        items_of.setdefault(r['fan_id'], []).append(r['item_id'])
+            finally:
+                cursor.close()
+
+            rows = []
+            for item_id, fans in fans_of.items():
+                co = Counter()
+                for fan_id in fans[:MAX_FANS_PER_ITEM]:
+                    liked = items_of[fan_id]
+                    if len(liked) <= MAX_ITEMS_PER_FAN:
+                        co.update(liked)
+                neighbors = _top_neighbors(item_id, co, len(fans), lambda j: len(fans_of[j]), self.k)
+                rows.append((kind, item_id, len(fans), encode_neighbors(neighbors)))
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM Item_Neighbor WHERE kind=%s", (kind,))
+                for start in range(0, len(rows), FETCH_SIZE):
+                    cursor.executemany("INSERT INTO Item_Neighbor (kind, item_id, fans, neighbors) VALUES (%s, %s, %s, %s)",
+                                       rows[start:start + FETCH_SIZE])
+            conn.commit()
+            written[kind] = len(rows)
+        self.invalidate()
+        return written
+
+    def refresh(self, conn, limit=500):
+        """
+        增量刷新最多 limit 个被标记的物品，返回处理的个数 (0 表示没有待刷新的)。
+        先取走标记再计算；计算失败时把标记放回去。
+        """
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT kind, item_id FROM Item_Neighbor_Dirty ORDER BY kind, item_id LIMIT %s", (limit,))
+            marks = [(r['kind'], r['item_id']) for r in cursor.fetchall()]
+            if not marks:
+                return 0
+            cursor.executemany("DELETE FROM Item_Neighbor_Dirty WHERE kind=%s AND item_id=%s", marks)
+        conn.commit()
+        try:
+            with conn.cursor() as cursor:
+                for kind, item_id in marks:
+                    if kind in SIGNALS:
+                        self._refresh_item(cursor, kind, item_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            with conn.cursor() as cursor:
+                cursor.executemany("INSERT IGNORE INTO Item_Neighbor_Dirty (kind, item_id) VALUES (%s, %s)", marks)
+            conn.commit()
+            raise
+        self.invalidate()
+        return len(marks)
+
+    def _refresh_item(self, cursor, kind, item_id):
+        table, col, _, _ = ITEM_TABLES[kind]
+        cursor.execute(f"SELECT 1 AS found FROM {table} WHERE {col}=%s", (item_id,))
+        fans = []
+        if cursor.fetchone():
+            sql, repeat = _signal_sql(kind, '{col} = %s')
+            cursor.execute(f"SELECT fan_id FROM ({sql}) s LIMIT %s", (item_id,) * repeat + (MAX_FANS_PER_ITEM + 1,))
+            fans = [r['fan_id'] for r in cursor.fetchall()]
+        if not fans:
+            # 物品已删除或没人关注了
+            cursor.execute("DELETE FROM Item_Neighbor WHERE kind=%s AND item_id=%s", (kind, item_id))
+            return
+        n_i = len(fans)
+        if n_i > MAX_FANS_PER_ITEM:
+            cursor.execute(f"SELECT COUNT(*) AS n FROM ({sql}) s", (item_id,) * repeat)
+            n_i = cursor.fetchone()['n']
+            fans = fans[:MAX_FANS_PER_ITEM]
+
+        # 这些歌迷关注的同类物品及共现次数
+        co = Counter()
+        for start in range(0, len(fans), IN_CHUNK):
+            chunk = fans[start:start + IN_CHUNK]
+            sql, repeat = _signal_sql(kind, f"fan_id IN ({', '.join(['%s'] * len(chunk))})")
+            cursor.execute(f"SELECT item_id, COUNT(*) AS co FROM ({sql}) s GROUP BY item_id", tuple(chunk) * repeat)
+            co.update({r['item_id']: r['co'] for r in cursor.fetchall()})
+        co.pop(item_id, None)
+        # 只对共现最多的候选查关注人数 (存量行里的 fans 列)；还没有行的候选用共现次数作下界
+        candidates = dict(co.most_common(self.k * 10))
+        counts = {}
+        ids = sorted(candidates)
+        for start in range(0, len(ids), IN_CHUNK):
+            chunk = ids[start:start + IN_CHUNK]
+            cursor.execute(f"SELECT item_id, fans FROM Item_Neighbor WHERE kind=%s AND item_id IN ({', '.join(['%s'] * len(chunk))})",
+                           (kind, *chunk))
+            counts.update({r['item_id']: r['fans'] for r in cursor.fetchall()})
+        neighbors = _top_neighbors(item_id, candidates, n_i, lambda j: max(counts.get(j, 0), candidates[j]), self.k)
+        cursor.execute(_UPSERT_SQL, (kind, item_id, n_i, encode_neighbors(neighbors)))
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            for kind, items in self._items.items():
+                snapshot[f'{kind}_items'] = len(items)
+        snapshot['age_seconds'] = time.monotonic() - self._loaded_at if self._loaded_at is not None else -1
+        return snapshot
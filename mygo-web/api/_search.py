@@ -0,0 +1,343 @@
+"""
+站内搜索 (进程内倒排索引)。
+
+歌迷原来只能在歌曲库表格里一页页翻；直接写 LIKE '%x%' 的话每输入一个字都要扫一遍 Song / Album / Band。
+这里把可搜索的文本在进程内建成倒排索引:
+- 歌曲: 标题、作者；专辑: 标题、简介；乐队: 名称、简介
+- 分词: 中日韩文字 (汉字 / 假名 / 谚文) 切成单字 + 相邻两字 (bigram)，不依赖词典；
+  其他文字按单词 (字母数字) 切分。统一做 NFKC 归一化和大小写折叠 (全角/半角、大小写都能匹配)
+- 查询里的每个词都必须命中 (AND)，按 idf × 字段权重打分，标题与查询相同 / 以查询开头的额外加权
+- 查询末尾的单词按前缀匹配，用于输入联想 (typeahead)
+- 写路由提交后增量更新 (put_* / remove / set_band_intro)；超过 refresh_interval 后重新加载，
+  多实例部署时其他实例的写入在那之后可见
+
+第一次搜索时才加载 (不增加冷启动时间)。
+"""
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+# 中日韩文字: 平假名/片假名、CJK 扩展 A、CJK 统一汉字、谚文、兼容汉字
+_CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'([{_CJK_CHARS}]+)|([^\\W_{_CJK_CHARS}]+)')
+
+KINDS = ('band', 'album', 'song')
+_KIND_ORDER = {kind: i for i, kind in enumerate(KINDS)}  # 同分时乐队在前、歌曲在后
+# 字段权重
+TITLE_WEIGHT = 3.0
+AUTHORS_WEIGHT = 1.5
+INTRO_WEIGHT = 1.0
+# 前缀最多展开成多少个词 (输入一个字母时不至于展开整个词表)
+PREFIX_EXPANSIONS = 64
+PREFIX_DISCOUNT = 0.8  # 前缀命中 (而不是整词命中) 的得分折扣
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text or '').casefold()
+
+
+def _runs(text):
+    """-> [(片段, 是否中日韩文字)]"""
+    return [(m.group(1) or m.group(2), m.group(1) is not None) for m in _TOKEN_RE.finditer(normalize(text))]
+
+
+def index_terms(text):
+    """建索引用的词: 单词；中日韩文字的单字和 bigram"""
+    terms = set()
+    for run, cjk in _runs(text):
+        if not cjk:
+            terms.add(run)
+            continue
+        terms.update(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def query_terms(text):
+    """
+    查询用的词 -> (必须命中的词, 末尾前缀或 None)。
+    中日韩文字片段只取 bigram (单字片段取单字)，末尾的非中日韩单词作为前缀 (查询以空白结尾时除外)。
+    """
+    runs = _runs(text)
+    prefix = None
+    if runs and not runs[-1][1] and not text[-1:].isspace():
+        prefix = runs.pop()[0]
+    terms = []
+    for run, cjk in runs:
+        if cjk and len(run) > 1:
+            terms += [run[i:i + 2] for i in range(len(run) - 1)]
+        else:
+            terms.append(run)
+    return list(dict.fromkeys(terms)), prefix
+
+
+class _Corpus:
+    """一份完整的索引数据 (重新加载时整体替换)"""
+
+    def __init__(self):
+        self.docs = {}  # (类型, id) -> (展示信息, 该文档的词, 归一化后的标题)
+        self.postings = {}  # 词 -> {(类型, id): 权重}
+        self.children = {}  # ('band', id) -> {专辑}，('album', id) -> {歌曲}
+        self.vocab = []  # 排好序的词表 (前缀查询)
+        self.sealed = False  # 加载期间先不维护 vocab，加载完一次排序
+
+    def put(self, key, info, fields, parent=None):
+        """fields: [(文本, 权重)]，第一个字段是标题"""
+        self.remove(key, cascade=False)
+        weights = {}
+        for text, weight in fields:
+            for term in index_terms(text):
+                if weights.get(term, 0) < weight:
+                    weights[term] = weight
+        for term, weight in weights.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                if self.sealed:
+                    insort(self.vocab, term)
+            posting[key] = weight
+        self.docs[key] = (info, tuple(weights), normalize(fields[0][0]))
+        if parent is not None:
+            self.children.setdefault(parent, set()).add(key)
+
+    def remove(self, key, cascade=True):
+        entry = self.docs.pop(key, None)
+        if entry is None:
+            return
+        info, terms, _ = entry
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(key, None)
+            if not posting:
+                del self.postings[term]
+                i = bisect_left(self.vocab, term)
+                if i < len(self.vocab) and self.vocab[i] == term:
+                    del self.vocab[i]
+        parent = info.get('parent')
+        if parent in self.children:
+            self.children[parent].discard(key)
+        if cascade:
+            for child in list(self.children.pop(key, ())):
+                self.remove(child)
+
+    def seal(self):
+        self.vocab = sorted(self.postings)
+        self.sealed = True
+
+    def expand(self, prefix):
+        i = bisect_left(self.vocab, prefix)
+        out = []
+        while i < len(self.vocab) and self.vocab[i].startswith(prefix) and len(out) < PREFIX_EXPANSIONS:
+            out.append(self.vocab[i])
+            i += 1
+        return out
+
+
+def _band(corpus, band_id, name, intro):
+    corpus.put(('band', band_id), {'name': name or '', 'intro': intro or ''},
+               [(name, TITLE_WEIGHT), (intro, INTRO_WEIGHT)])
+
+
+def _album(corpus, album_id, band_id, title, intro):
+    corpus.put(('album', album_id), {'title': title or '', 'band_id': band_id, 'parent': ('band', band_id)},
+               [(title, TITLE_WEIGHT), (intro, INTRO_WEIGHT)], parent=('band', band_id))
+
+
+def _song(corpus, song_id, album_id, title, authors, netease_url):
+    corpus.put(('song', song_id), {'title': title or '', 'authors': authors or '', 'album_id': album_id,
+                                   'netease_url': netease_url or '', 'parent': ('album', album_id)},
+               [(title, TITLE_WEIGHT), (authors, AUTHORS_WEIGHT)], parent=('album', album_id))
+
+
+class SearchIndex:
+    """
+    pool: 加载数据用的连接池
+    refresh_interval: 索引的最长使用时间 (秒)，超过后由下一次搜索的请求同步重新加载 (同时到达的其他搜索继续用旧索引)
+    """
+
+    def __init__(self, pool, refresh_interval=300):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self._corpus = _Corpus()
+        self._loaded_at = None
+        self._stale = False
+        self._replay = None  # 加载期间发生的增量更新，加载完后重放到新索引上
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stats = {'loads': 0, 'queries': 0, 'updates': 0, 'load_seconds': 0.0}
+
+    # ---------- 加载 ----------
+    def load(self):
+        """从数据库重建整个索引 (加载期间仍使用旧索引，期间的增量更新会重放到新索引上)"""
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            corpus = _Corpus()
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT band_id, name, intro FROM Band")
+                    for r in cursor.fetchall():
+                        _band(corpus, r['band_id'], r['name'], r['intro'])
+                    cursor.execute("SELECT album_id, band_id, title, album_intro FROM Album")
+                    for r in cursor.fetchall():
+                        _album(corpus, r['album_id'], r['band_id'], r['title'], r['album_intro'])
+                    cursor.execute("SELECT song_id, album_id, title, authors, netease_url FROM Song")
+                    for r in cursor.fetchall():
+                        _song(corpus, r['song_id'], r['album_id'], r['title'], r['authors'], r['netease_url'])
+                conn.commit()
+            corpus.seal()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            for fn, args in self._replay:
+                fn(corpus, *args)
+            self._corpus, self._replay = corpus, None
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self._stats['loads'] += 1
+            self._stats['load_seconds'] = time.perf_counter() - started
+
+    def _expired(self):
+        return self._loaded_at is None or self._stale or time.monotonic() - self._loaded_at >= self.refresh_interval
+
+    def _ensure_fresh(self):
+        if not self._expired():
+            return
+        # 在调用方 (请求) 线程里同步重建：已有索引时只让拿到锁的那个请求去重建 (它要等重建完成)，
+        # 其余请求不等待、继续用旧索引；第一次加载时都等待完成
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._expired():
+                self.load()
+        except Exception as e:
+            if self._loaded_at is None:
+                raise
+            print(f"❌ Search index refresh failed, serving previous index: {e}")
+        finally:
+            self._load_lock.release()
+
+    def invalidate(self):
+        """下一次搜索时重新加载 (批量导入等难以增量处理的变更之后调用)"""
+        with self._lock:
+            self._stale = True
+
+    # ---------- 增量更新 (写路由提交之后调用) ----------
+    def _apply(self, fn, *args):
+        with self._lock:
+            if self._loaded_at is not None:
+                fn(self._corpus, *args)
+            if self._replay is not None:
+                self._replay.append((fn, args))
+            self._stats['updates'] += 1
+
+    def put_band(self, band_id, name, intro=None):
+        self._apply(_band, band_id, name, intro)
+
+    def put_album(self, album_id, band_id, title, intro=None):
+        self._apply(_album, album_id, band_id, title, intro)
+
+    def put_song(self, song_id, album_id, title, authors=None, netease_url=None):
+        self._apply(_song, song_id, album_id, title, authors, netease_url)
+
+    def set_band_intro(self, band_id, intro):
+        def update(corpus, band_id, intro):
+            entry = corpus.docs.get(('band', band_id))
+            if entry is not None:
+                _band(corpus, band_id, entry[0]['name'], intro)
+        self._apply(update, band_id, intro)
+
+    def remove(self, kind, id):
+        """删除文档；删除乐队 / 专辑时连同下属的专辑 / 歌曲一起删除 (与外键级联一致)"""
+        self._apply(_Corpus.remove, (kind, id))
+
+    # ---------- 查询 ----------
+    def search(self, q, limit=20, kinds=KINDS):
+        """-> [{type, id, title, subtitle, score, ...}]，按得分从高到低"""
+        terms, prefix = query_terms(q)
+        if not terms and not prefix:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            self._stats['queries'] += 1
+            corpus = self._corpus
+            n = max(len(corpus.docs), 1)
+
+            def idf(term):
+                return math.log(1 + n / len(corpus.postings[term]))
+
+            # [(倒排表, 词的权重)]；前缀展开成多个词，每个文档取其中得分最高的一个
+            lists = []
+            for term in terms:
+                posting = corpus.postings.get(term)
+                if not posting:
+                    return []
+                lists.append((posting, idf(term)))
+            if prefix:
+                expanded = corpus.expand(prefix)
+                if not expanded:
+                    return []
+                if expanded == [prefix]:
+                    lists.append((corpus.postings[prefix], idf(prefix)))
+                else:
+                    merged = {}
+                    for term in expanded:
+                        w = idf(term) * (1 if term == prefix else PREFIX_DISCOUNT)
+                        for key, weight in corpus.postings[term].items():
+                            if merged.get(key, 0) < weight * w:
+                                merged[key] = weight * w
+                    lists.append((merged, 1))
+            # 从最短的倒排表开始求交集，最后只给交集里的文档打分
+            lists.sort(key=lambda item: len(item[0]))
+            candidates = [key for key in lists[0][0] if key[0] in kinds]
+            for posting, _ in lists[1:]:
+                candidates = [key for key in candidates if key in posting]
+
+            needle = normalize(q).strip()
+            docs = corpus.docs
+            ranked = []
+            for key in candidates:
+                score = 0.0
+                for posting, w in lists:
+                    score += posting[key] * w
+                title = docs[key][2]
+                if title == needle:
+                    score *= 2
+                elif title.startswith(needle):
+                    score *= 1.5
+                ranked.append((-score, _KIND_ORDER[key[0]], key[1], key))
+            return [self._result(corpus, key, -neg) for neg, _, _, key in heapq.nsmallest(limit, ranked)]
+
+    @staticmethod
+    def _result(corpus, key, score):
+        kind, id = key
+        info = corpus.docs[key][0]
+        if kind == 'band':
+            return {'type': kind, 'id': id, 'title': info['name'], 'subtitle': info['intro'][:60],
+                    'score': round(score, 3)}
+        if kind == 'album':
+            band = corpus.docs.get(('band', info['band_id']))
+            return {'type': kind, 'id': id, 'title': info['title'], 'band_id': info['band_id'],
+                    'subtitle': band[0]['name'] if band else '', 'score': round(score, 3)}
+        album = corpus.docs.get(('album', info['album_id']))
+        album_title = album[0]['title'] if album else ''
+        return {'type': kind, 'id': id, 'title': info['title'], 'album_id': info['album_id'],
+                'subtitle': ' · '.join(s for s in (album_title, info['authors']) if s),
+                'netease_url': info['netease_url'], 'score': round(score, 3)}
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['documents'] = len(self._corpus.docs)
+            snapshot['terms'] = len(self._corpus.postings)
+        snapshot['age_seconds'] = time.monotonic() - self._loaded_at if self._loaded_at is not None else -1
+        return snapshot
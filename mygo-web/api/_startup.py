@@ -0,0 +1,128 @@
+"""
+冷启动优化 (Serverless)。
+
+冷实例在回答第一个请求前要做: 导入 Flask、编译用到的模板 (Jinja 词法/语法分析 + 生成 Python 代码 + compile)、
+构建 SSL 上下文、和 TiDB 握手。这里负责模板这一块：
+
+- 构建时: flask compile-templates 把所有模板编译成字节码，写入 build/jinja/ 随部署一起发布
+- 运行时: TemplateBytecodeCache 先查构建产物 (只读)，再查本机的缓存目录 (默认是 Jinja 在临时目录下
+  按用户创建的私有目录，同一台机器上的其他进程 / 重启后的进程可以复用)，都没有才真正编译，并写回本机缓存目录
+
+缓存按模板名 + 源码校验和 + Python 版本匹配，模板改了或解释器版本不同时只会未命中，不会用错。
+构建产物旁边记录了构建时的解释器版本，与运行时不一致时启动会打警告 (构建产物全部失效，冷启动又要编译)。
+(数据库与 SSL 的一次性准备见 _db.py；其余按需导入的模块见 index.py)
+"""
+import logging
+import os
+import sys
+import threading
+
+from jinja2 import BytecodeCache, FileSystemBytecodeCache
+
+TEMPLATE_SUFFIXES = ('.html',)
+# 构建目录里记录解释器版本的文件 (字节码是 marshal 格式，只能被同一版本的解释器加载)
+VERSION_FILE = 'python-version'
+
+log = logging.getLogger('mygo.startup')
+
+
+def interpreter_tag():
+    return sys.implementation.cache_tag or sys.version.split()[0]
+
+
+def check_prebuilt_version(prebuilt_dir):
+    """构建产物与当前解释器版本一致时返回 True，否则打警告并返回 False"""
+    try:
+        with open(os.path.join(prebuilt_dir, VERSION_FILE), encoding='utf-8') as f:
+            built_with = f.read().strip()
+    except OSError:
+        built_with = None
+    if built_with != interpreter_tag():
+        log.warning('template bytecode in %s was built with %s but this is %s; prebuilt templates will not be used '
+                    '(run flask compile-templates with the deployed Python version)',
+                    prebuilt_dir, built_with or 'an unknown interpreter', interpreter_tag())
+        return False
+    return True
+
+
+class TemplateBytecodeCache(BytecodeCache):
+    """
+    两层模板字节码缓存。
+    prebuilt_dir: 构建时生成的只读目录 (不存在时忽略)
+    runtime_dir: 运行时可写目录；None 用 Jinja 的默认私有目录，False 表示不写
+    """
+
+    def __init__(self, prebuilt_dir=None, runtime_dir=None):
+        self.prebuilt = None
+        if prebuilt_dir and os.path.isdir(prebuilt_dir) and check_prebuilt_version(prebuilt_dir):
+            self.prebuilt = FileSystemBytecodeCache(prebuilt_dir)
+        self.runtime_dir = runtime_dir
+        self.runtime = None
+        if runtime_dir is not False:
+            try:
+                self.runtime = FileSystemBytecodeCache(runtime_dir)
+            except (OSError, RuntimeError):
+                pass  # 临时目录不可用 (不安全或只读)：只用构建产物
+        self._stats = {'prebuilt_hits': 0, 'runtime_hits': 0, 'compiled': 0, 'write_errors': 0}
+        self._lock = threading.Lock()
+
+    def get_cache_key(self, name, filename=None):
+        # 只按模板名计算：构建机和运行环境的模板绝对路径不同 (源码是否变化由校验和判断)
+        return super().get_cache_key(name)
+
+    def load_bytecode(self, bucket):
+        for layer, stat in ((self.prebuilt, 'prebuilt_hits'), (self.runtime, 'runtime_hits')):
+            if layer is None:
+                continue
+            layer.load_bytecode(bucket)
+            if bucket.code is not None:
+                self._count(stat)
+                return
+        self._count('compiled')
+
+    def dump_bytecode(self, bucket):
+        if self.runtime is None:
+            return
+        try:
+            if self.runtime_dir:
+                os.makedirs(self.runtime_dir, exist_ok=True)
+            self.runtime.dump_bytecode(bucket)
+        except OSError:
+            # 只读文件系统 / 磁盘满：只是少了缓存，不影响渲染
+            self._count('write_errors')
+
+    def clear(self):
+        if self.runtime is not None:
+            self.runtime.clear()
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['prebuilt'] = self.prebuilt is not None
+        return snapshot
+
+
+def compile_templates(env, target_dir):
+    """
+    把 env 能找到的所有模板编译成字节码写入 target_dir (构建时执行)。
+    返回编译的模板名列表。
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    FileSystemBytecodeCache(target_dir).clear()  # 旧模板的产物不再有用
+    builder = TemplateBytecodeCache(runtime_dir=target_dir)
+    previous = env.bytecode_cache
+    env.bytecode_cache = builder
+    try:
+        names = sorted(n for n in env.list_templates() if n.endswith(TEMPLATE_SUFFIXES))
+        for name in names:
+            # 直接经过 loader (不用 get_template，避免命中已加载模板的内存缓存)
+            env.loader.load(env, name, env.globals)
+    finally:
+        env.bytecode_cache = previous
+    with open(os.path.join(target_dir, VERSION_FILE), 'w', encoding='utf-8') as f:
+        f.write(interpreter_tag() + '\n')
+    return names
@@ -0,0 +1,321 @@
+"""
+关注 / 评分的写后缓冲 (write-behind，可选，WRITE_BEHIND=1 开启)。
+
+演唱会官宣、新专辑发布时 toggle_like 和评分集中涌入，每个请求各开一个事务，
+大量小事务在同一批热点行 (专辑的 avg_score / score_sum、Band_Stat) 上排队等锁。开启后:
+- 请求只把操作追加到本地日志 (写入并 fsync 之后才返回)、放进内存队列，不访问数据库
+- 同一歌迷对同一目标的重复操作在队列里合并，只保留最后一次 (关注 / 取关来回切换最终只写一次)
+- 队列达到 max_pending 条或每隔 flush_interval 秒，后台线程在一个事务里批量写入
+  (多行 INSERT / DELETE，同一专辑的累计值变化合并成一条 UPDATE，见 apply_like_batch / submit_reviews)
+- 整批写入失败时逐条重试 (同 _import 对失败块的处理)：数据本身有问题的操作 (is_permanent 判定，例如评论超长、
+  违反约束) 写入死信文件 dead-letter.jsonl 并计数，其余照常写入；遇到暂时性错误 (数据库不可用) 就停下，
+  剩下的放回队列下次重试。这样一条坏数据不会让整个队列卡住
+- 队列达到 max_queue 后 enqueue_* 返回 False，index.py 直接按数据库繁忙返回 503
+  (不改为同步写入：队列里同一目标更早的操作稍后写入时会把它覆盖)
+- 写入成功后删除对应的日志段；进程崩溃后，下一个启动的进程接管目录里无人持有的日志段并重放
+  (重放是幂等的：关注按最终状态写入，乐评按覆盖写入，已经写过的再写一次不产生变化)
+- 读路径通过 pending_likes / pending_reviews 看到自己尚未写入的操作 (只对发起操作的歌迷保证，
+  其他人在写入之后才看到)
+
+日志目录必须在持久化磁盘上，多个进程可以共用一个目录 (各自持有自己的日志段)。
+Serverless 实例 (Vercel) 的本地文件系统和后台线程都不可靠，不要开启。
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：不做跨进程的日志段互斥
+    fcntl = None
+
+log = logging.getLogger('mygo.write_behind')
+DEAD_LETTER_FILE = 'dead-letter.jsonl'  # 不以 .log 结尾，不会被当成日志段重放
+
+
+class WriteBehind:
+    """
+    flush_fn(likes, reviews): 在一个事务里写入一批操作 (失败时抛异常，整批留在队列里下次重试)
+        likes: {fan_id: {类型: {id: 'like'/'unlike'}}}；reviews: {fan_id: {album_id: (score, comment)}}
+    log_dir: 追加日志所在目录
+    max_pending: 队列里合并后的操作数达到这个值时立即写入
+    flush_interval: 定时写入的间隔 (秒)
+    max_queue: 队列上限 (数据库长时间不可用时)，超过后 enqueue_* 返回 False，由调用方拒绝请求
+        (不能改为同步写入：队列里同一目标更早的操作稍后写入时会把它覆盖)
+    fsync: 每次追加后 fsync (关闭后只保证进程崩溃不丢，不保证断电不丢)
+    is_permanent(exc): 单条重试仍然失败时，这个错误是否重试多少次都一样 (是则转入死信)；默认都按暂时性错误处理
+    """
+
+    def __init__(self, flush_fn, log_dir, max_pending=200, flush_interval=0.5, max_queue=5000, fsync=True,
+                 is_permanent=None):
+        self.flush_fn = flush_fn
+        self.is_permanent = is_permanent or (lambda exc: False)
+        self.log_dir = log_dir
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.fsync = fsync
+        self._likes = {}
+        self._reviews = {}
+        self._size = 0  # 合并后的操作数
+        self._inflight = ({}, {})  # 正在写入的一批 (写完之前读路径仍然要看到)
+        self._segments = []  # [(路径, 文件)] 还没写入数据库的日志段，最后一个是当前追加的
+        self._closed = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stats = {'enqueued': 0, 'coalesced': 0, 'flushes': 0, 'flushed': 0, 'errors': 0, 'rejected': 0,
+                       'recovered': 0, 'dead_lettered': 0, 'flush_seconds': 0.0}
+
+    # ---------- 启动 / 关闭 ----------
+    def start(self):
+        """接管遗留的日志段，打开新的日志段并启动后台写入线程"""
+        os.makedirs(self.log_dir, exist_ok=True)
+        with self._lock:
+            self._recover()
+            self._open_segment()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """停止后台线程并把队列写完 (正常退出时调用；写入失败时日志段留给下一个进程)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 4 + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            log.error('final flush failed, log kept for recovery: %s', e)
+        with self._lock:
+            for path, f in self._segments:
+                if not self._size:
+                    os.remove(path)  # 都已写入：不留空的日志段
+                f.close()
+            self._segments = []
+
+    def _open_segment(self):
+        # 文件名以纳秒时间戳开头：按名字排序就是创建顺序，重放时旧的操作先于新的
+        path = os.path.join(self.log_dir, f'{time.time_ns():020d}-{os.getpid()}.log')
+        f = open(path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        self._segments.append((path, f))
+
+    def _recover(self):
+        """把目录里无人持有的日志段 (上一个进程崩溃或写入失败后留下的) 接管过来，操作放回队列"""
+        for name in sorted(os.listdir(self.log_dir)):
+            if not name.endswith('.log'):
+                continue
+            path = os.path.join(self.log_dir, name)
+            f = open(path, 'a+', encoding='utf-8')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    f.close()  # 其他进程正在使用
+                    continue
+            if not os.path.exists(path):
+                f.close()  # 拿到锁之前被原来的进程写完删掉了
+                continue
+            f.seek(0)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时只写了一半的最后一行
+                self._add(record)
+                self._stats['recovered'] += 1
+            f.seek(0, os.SEEK_END)
+            self._segments.append((path, f))
+
+    # ---------- 入队 ----------
+    def enqueue_likes(self, fan_id, ops):
+        """ops: {类型: {id: 'like'/'unlike'}}。返回 False 表示队列已满 (没有入队)"""
+        return self._append(_records({fan_id: ops}, {}))
+
+    def enqueue_review(self, fan_id, album_id, score, comment):
+        """score 已经过 parse_score 校验。返回 False 表示队列已满 (没有入队)"""
+        return self._append(_records({}, {fan_id: {album_id: (score, comment)}}))
+
+    def _append(self, records):
+        if not records:
+            return True
+        with self._lock:
+            if self._closed or self._size >= self.max_queue or not self._segments:
+                self._stats['rejected'] += 1
+                return False
+            # 先落盘再进队列，两者在同一把锁里，保证日志里的顺序和内存里合并的顺序一致
+            f = self._segments[-1][1]
+            f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            for record in records:
+                self._add(record)
+            self._stats['enqueued'] += len(records)
+            if self._size >= self.max_pending:
+                self._wakeup.notify()
+        return True
+
+    def _add(self, record):
+        if record['t'] == 'like':
+            targets = self._likes.setdefault(record['f'], {}).setdefault(record['k'], {})
+            key, value = record['i'], record['o']
+        else:
+            targets = self._reviews.setdefault(record['f'], {})
+            key, value = record['a'], (Decimal(record['s']), record['c'])
+        if key in targets:
+            self._stats['coalesced'] += 1
+        else:
+            self._size += 1
+        targets[key] = value
+
+    # ---------- 读路径 ----------
+    def pending_likes(self, fan_id):
+        """该歌迷尚未写入数据库的关注操作: {类型: {id: 'like'/'unlike'}}"""
+        with self._lock:
+            merged = {}
+            for likes in (self._inflight[0], self._likes):
+                for kind, targets in likes.get(fan_id, {}).items():
+                    merged.setdefault(kind, {}).update(targets)
+            return merged
+
+    def pending_reviews(self, fan_id):
+        """该歌迷尚未写入数据库的乐评: {album_id: (score, comment)}"""
+        with self._lock:
+            merged = dict(self._inflight[1].get(fan_id, {}))
+            merged.update(self._reviews.get(fan_id, {}))
+            return merged
+
+    # ---------- 写入 ----------
+    def flush(self):
+        """把当前队列写入数据库，返回写入的操作数。失败时整批放回队列 (日志段保留) 并抛出异常"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._size:
+                    return 0
+                likes, reviews, size = self._likes, self._reviews, self._size
+                self._likes, self._reviews, self._size = {}, {}, 0
+                self._inflight = (likes, reviews)
+                # 这一批对应的日志段封存起来，新操作写到新的日志段
+                sealed = self._segments
+                self._segments = []
+                if not self._closed:
+                    self._open_segment()
+            started = time.perf_counter()
+            try:
+                self.flush_fn(likes, reviews)
+            except Exception as e:
+                log.warning('flush of %d op(s) failed, retrying one by one: %s', size, e)
+                likes, reviews, error = self._flush_singly(likes, reviews)
+                if error is not None:
+                    # 暂时性错误：没写进去的放回队列，日志段保留 (重放是幂等的，已写入的再写一次不产生变化)
+                    with self._lock:
+                        self._requeue(likes, reviews)
+                        self._segments = sealed + self._segments
+                        self._inflight = ({}, {})
+                        self._stats['errors'] += 1
+                    raise error
+            with self._lock:
+                self._inflight = ({}, {})
+                self._stats['flushes'] += 1
+                self._stats['flushed'] += size
+                self._stats['flush_seconds'] = time.perf_counter() - started
+            # 先删除再关闭 (关闭会释放文件锁，不能让别的进程在这之间把它当成遗留日志接管)
+            for path, f in sealed:
+                os.remove(path)
+                f.close()
+            return size
+
+    def _flush_singly(self, likes, reviews):
+        """
+        整批失败后逐条写入。数据本身有问题的转入死信；遇到暂时性错误时停下。
+        返回 (没写入的关注, 没写入的乐评, 暂时性错误或 None)
+        """
+        singles = [({fan_id: {kind: {target_id: op}}}, {}) for fan_id, kinds in likes.items()
+                   for kind, targets in kinds.items() for target_id, op in targets.items()]
+        singles += [({}, {fan_id: {album_id: review}}) for fan_id, albums in reviews.items()
+                    for album_id, review in albums.items()]
+        left_likes, left_reviews, error = {}, {}, None
+        for one_likes, one_reviews in singles:
+            if error is None:
+                try:
+                    self.flush_fn(one_likes, one_reviews)
+                    continue
+                except Exception as e:
+                    if self.is_permanent(e):
+                        self._dead_letter(one_likes, one_reviews, e)
+                        continue
+                    error = e
+            _merge(left_likes, left_reviews, one_likes, one_reviews)
+        return left_likes, left_reviews, error
+
+    def _dead_letter(self, likes, reviews, exc):
+        records = [dict(r, error=str(exc)[:1000], at=time.time()) for r in _records(likes, reviews)]
+        log.error('dropping %s to %s: %s', records[0], DEAD_LETTER_FILE, exc)
+        with self._lock:
+            with open(os.path.join(self.log_dir, DEAD_LETTER_FILE), 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+            self._stats['dead_lettered'] += len(records)
+
+    def _requeue(self, likes, reviews):
+        """写入失败的一批放回队列；写入期间又有新操作的目标以新操作为准"""
+        for fan_id, kinds in likes.items():
+            for kind, targets in kinds.items():
+                current = self._likes.setdefault(fan_id, {}).setdefault(kind, {})
+                for target_id, op in targets.items():
+                    if target_id not in current:
+                        current[target_id] = op
+                        self._size += 1
+        for fan_id, albums in reviews.items():
+            current = self._reviews.setdefault(fan_id, {})
+            for album_id, review in albums.items():
+                if album_id not in current:
+                    current[album_id] = review
+                    self._size += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._wakeup.wait_for(lambda: self._closed or self._size >= self.max_pending, timeout=self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                log.error('flush failed, will retry: %s', e)
+                time.sleep(self.flush_interval)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['pending'] = self._size
+            snapshot['segments'] = len(self._segments)
+        return snapshot
+
+
+def _records(likes, reviews):
+    """队列格式 -> 日志记录 (每个操作一行)"""
+    records = [{'t': 'like', 'f': fan_id, 'k': kind, 'i': target_id, 'o': op}
+               for fan_id, kinds in likes.items() for kind, targets in kinds.items() for target_id, op in targets.items()]
+    records += [{'t': 'review', 'f': fan_id, 'a': album_id, 's': str(score), 'c': comment}
+                for fan_id, albums in reviews.items() for album_id, (score, comment) in albums.items()]
+    return records
+
+
+def _merge(likes, reviews, more_likes, more_reviews):
+    for fan_id, kinds in more_likes.items():
+        for kind, targets in kinds.items():
+            likes.setdefault(fan_id, {}).setdefault(kind, {}).update(targets)
+    for fan_id, albums in more_reviews.items():
+        reviews.setdefault(fan_id, {}).update(albums)
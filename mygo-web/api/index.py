@@ -1,63 +1,290 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import pymysql
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, jsonify, Response, stream_with_context
+from flask import before_render_template, template_rendered
+import click
+import hmac
+import json
 import os
-import ssl  # 必须引入 ssl 模块以支持 TiDB Cloud
+import sys
+import threading
+import time
 
 # ================= 1. 配置路径与应用 =================
 base_dir = os.path.dirname(os.path.abspath(__file__))
 template_dir = os.path.join(base_dir, '../templates')
 static_dir = os.path.join(base_dir, '../static')
 
+# 同目录下的辅助模块 (以 _ 开头，Vercel 不会把它们当成独立函数)
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from _db import ConnectionPool, DatabaseUnavailable, connect_tidb
+from _ratings import parse_score, parse_album_id, submit_review, submit_reviews, reconcile_album_aggregates
+from _cache import BandCache, make_cache_backend
+import _band_stats as band_stats
+from _paging import keyset_page
+from _batch import QueryBatch, QueryBatchError
+from _likes import LIKE_TABLES, LIKE_OPS, set_like, is_liked, target_exists, toggle, parse_ops, apply_like_ops, apply_like_batch
+import _metrics as metrics
+from _leaderboard import Leaderboard, WINDOWS
+from _search import SearchIndex, KINDS as SEARCH_KINDS
+from _recommend import Recommender, KINDS as RECOMMEND_KINDS
+from _fragments import DataVersions, FragmentCache, FragmentCacheExtension
+from _startup import TemplateBytecodeCache, compile_templates
+from _deletes import DeleteJobs, TargetDeleting, writable_targets, require_writable, require_bands_writable, target_bands
+# 只有少数路由用到的模块 (导出用的 _export / pymysql 非缓冲 cursor) 在路由里按需导入，不拖慢冷启动；
+# 写后缓冲 (_writebehind) 只在开启时导入
+
 app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
+# 模板字节码缓存 (冷实例不必重新编译模板，见 _startup.py)
+# JINJA_PREBUILT_DIR: flask compile-templates 的构建产物；JINJA_CACHE_DIR: 本机可写缓存目录 (=0 关闭)
+TEMPLATE_BUILD_DIR = os.environ.get('JINJA_PREBUILT_DIR', os.path.join(base_dir, '../build/jinja'))
+jinja_cache_dir = os.environ.get('JINJA_CACHE_DIR') or None
+template_cache = TemplateBytecodeCache(TEMPLATE_BUILD_DIR, False if jinja_cache_dir == '0' else jinja_cache_dir)
+app.jinja_env.bytecode_cache = template_cache
 # 密钥配置
 app.secret_key = os.environ.get('SECRET_KEY', 'mygo_is_eternal_deployment_key')
+# 列表分页大小 (键集分页，见 _paging.py)
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+
+# ================= 2. 数据库连接池 =================
+# 连接在进程内复用：TLS 握手、SSL 上下文和 SET SQL_SAFE_UPDATES 只在建连时做一次
+db_pool = ConnectionPool(
+    connect_tidb,
+    min_size=int(os.environ.get('DB_POOL_MIN', 1)),
+    max_size=int(os.environ.get('DB_POOL_MAX', 10)),
+    max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    ping_interval=float(os.environ.get('DB_POOL_PING_INTERVAL', 5)),
+    # SQL 埋点 (DB_METRICS=0 关闭)：每条语句的指纹 / 耗时 / 行数 / 路由
+    cursor_wrapper=metrics.InstrumentedCursor if os.environ.get('DB_METRICS', '1') == '1' else None,
+)
+# 慢查询日志阈值 (毫秒)，超过的语句以 WARNING 写入 mygo.slow_query 日志
+metrics.InstrumentedCursor.slow_query_seconds = float(os.environ.get('SLOW_QUERY_MS', 200)) / 1000
+# 预热 (建连 + 加载排行榜) 见后面的 prepare_instance
 
-# ================= 2. 数据库连接 (强制 SSL 修复版) =================
 def get_db_connection():
     """
-    建立数据库连接。
-    强制使用 SSL 上下文，解决 TiDB Cloud Error 1105。
+    从连接池借出连接。
+    conn.close() 表示归还；也可以写成 with get_db_connection() as conn。
+    连接池耗尽或数据库不可达时抛出 DatabaseUnavailable，不再返回 None。
     """
-    # 1. 构建 SSL 配置
-    ssl_ca_path = "/etc/ssl/certs/ca-certificates.crt"
-    ssl_config = None
+    conn = db_pool.acquire()
+    # 记录到本次请求，请求结束时兜底归还 (路由异常提前退出时不会泄漏)
+    if 'db_conns' not in g:
+        g.db_conns = []
+    g.db_conns.append((conn, conn.lease))
+    return conn
+
+@app.teardown_appcontext
+def release_db_connections(exc):
+    # 只归还本次借出的那一次 (路由已归还、连接又被其他请求借走时不能再 close)
+    for conn, lease in g.pop('db_conns', []):
+        conn.close(lease)
 
-    if os.path.exists(ssl_ca_path):
-        # 使用系统证书 (Linux/Vercel)
-        ssl_config = {"ca": ssl_ca_path}
+@app.errorhandler(DatabaseUnavailable)
+def handle_db_unavailable(e):
+    if request.is_json or wants_json():
+        resp = jsonify(error=f'数据库繁忙，请稍后重试 ({e})')
+        resp.status_code = 503
     else:
-        # 本地/无证书环境：创建忽略验证的 SSL 上下文
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        ssl_config = ctx
+        flash(f'数据库繁忙，请稍后重试 ({e})', 'danger')
+        resp = app.make_response((render_template('base.html'), 503))
+    resp.headers['Retry-After'] = '3'
+    return resp
 
-    # 2. 建立连接
-    try:
-        conn = pymysql.connect(
-            host=os.environ.get('DB_HOST'),
-            port=int(os.environ.get('DB_PORT', 4000)),
-            user=os.environ.get('DB_USER'),
-            password=os.environ.get('DB_PASSWORD'),
-            database=os.environ.get('DB_NAME', 'mygo_db'),
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor,
-            ssl=ssl_config,  # [关键] 强制传入 SSL
-            autocommit=False # 关闭自动提交
-        )
-        
-        # 3. 关闭安全更新模式 (防止 DELETE/UPDATE 报错)
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SET SQL_SAFE_UPDATES = 0")
-        except Exception:
-            pass 
-            
-        return conn
+# 并行查询：每批最多同时占用的连接数
+BATCH_CONCURRENCY = int(os.environ.get('DB_BATCH_CONCURRENCY', 4))
 
-    except Exception as e:
-        print(f"❌ Database Connection Failed: {e}")
+def run_batch(batch):
+    """执行一批并行查询，并把各查询耗时记入 Server-Timing 响应头"""
+    results = batch.run()
+    timings = g.setdefault('server_timing', {})
+    for name, seconds in results.timings.items():
+        timings[name] = seconds
+    return results
+
+@app.errorhandler(QueryBatchError)
+def handle_batch_error(e):
+    # 连接池耗尽等可重试错误按 503 处理，其余错误原样记录后返回 500
+    for err in e.errors.values():
+        if isinstance(err, DatabaseUnavailable):
+            return handle_db_unavailable(err)
+    print(f"❌ Query batch failed: {e}")
+    flash(f'页面数据加载失败: {e}', 'danger')
+    return render_template('base.html'), 500
+
+@app.before_request
+def begin_request_metrics():
+    g.request_metrics = metrics.begin_request(request.endpoint or '-')
+
+@before_render_template.connect_via(app)
+def mark_render_start(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        metrics.observe_render(template.name or '-', time.perf_counter() - started.pop())
+
+@app.after_request
+def add_server_timing(resp):
+    # 结束本次请求的埋点：总耗时 / 数据库耗时 / 往返次数 / 模板渲染耗时
+    stats = metrics.end_request(request.method, resp.status_code)
+    timings = g.get('server_timing')
+    if stats is not None and stats.round_trips:
+        timings = g.setdefault('server_timing', {})
+        timings['db'] = stats.db_seconds
+        timings['render'] = stats.render_seconds
+    if timings:
+        resp.headers['Server-Timing'] = ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items())
+    return resp
+
+@app.teardown_request
+def end_request_metrics(exc):
+    # 未处理的异常不会经过 after_request，这里按 500 记一次 (已记录过时什么都不做)
+    metrics.end_request(request.method, 500)
+
+def metrics_authorized():
+    """管理员会话，或携带 METRICS_TOKEN 的抓取请求 (Authorization: Bearer ...)"""
+    if session.get('role') == 'admin':
+        return True
+    token = os.environ.get('METRICS_TOKEN')
+    supplied = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    if not metrics_authorized(): return redirect(url_for('login'))
+    return Response(metrics.registry.expose(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/pool_stats')
+def admin_pool_stats():
+    if session.get('role') != 'admin': return redirect(url_for('login'))
+    return jsonify(db_pool.stats())
+
+# 数据版本 (写路径提交后递增)：页面的 ETag / Last-Modified 和 HTML 片段缓存的 key 都由它决定
+# 范围: 'catalog' 全站曲库, 'ratings' 评分, 'directory' 管理员的乐队/歌迷列表,
+#       ('fan', id) 歌迷自己的数据, ('band', id[, 数据集]) 乐队后台 (随 band_cache 失效自动递增)
+BAND_CACHE_TTL = float(os.environ.get('BAND_CACHE_TTL', 60))
+data_versions = DataVersions(ttl=BAND_CACHE_TTL)
+fragment_cache = FragmentCache(make_cache_backend(os.environ.get('FRAGMENT_CACHE_BACKEND', 'memory'), ttl=BAND_CACHE_TTL,
+                                                  max_bytes=int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))))
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_cache = fragment_cache
+
+def bump_band_versions(band_id, datasets):
+    if band_id is None:
+        data_versions.bump('bands')
+    else:
+        data_versions.bump(('band', band_id), *[('band', band_id, name) for name in datasets])
+
+# 乐队后台的读穿透缓存 (按乐队 + 数据集缓存，写路径精确失效)
+BAND_DATASETS = ('members', 'intro', 'albums', 'songs', 'reviews', 'concerts', 'stats')
+band_cache = BandCache(
+    make_cache_backend(os.environ.get('BAND_CACHE_BACKEND', 'memory'),
+                       ttl=BAND_CACHE_TTL,
+                       max_bytes=int(os.environ.get('BAND_CACHE_MAX_BYTES', 32 * 1024 * 1024))),
+    datasets=BAND_DATASETS,
+    on_invalidate=bump_band_versions,
+)
+
+# 专辑排行榜 (进程内物化，评分时增量更新，LEADERBOARD_REFRESH 秒后重新加载以看到其他实例的写入)
+# LEADERBOARD_TABLE=1 时同时维护共享底表 Album_Review_Day (sql/004)，冷启动加载更快
+leaderboard = Leaderboard(db_pool, refresh_interval=float(os.environ.get('LEADERBOARD_REFRESH', 60)),
+                          use_table=os.environ.get('LEADERBOARD_TABLE') == '1')
+
+# 站内搜索 (进程内倒排索引，第一次搜索时加载，写路由提交后增量更新，SEARCH_REFRESH 秒后重新加载)
+search_index = SearchIndex(db_pool, refresh_interval=float(os.environ.get('SEARCH_REFRESH', 300)))
+
+# 推荐 (Item_Neighbor 由 flask rebuild-recommendations 生成，关注变化后按脏标记增量刷新，见 _recommend.py)
+# 进程内数据 RECOMMEND_REFRESH 秒后重新加载，看到其他实例触发的刷新
+recommender = Recommender(db_pool, refresh_interval=float(os.environ.get('RECOMMEND_REFRESH', 600)))
+RECOMMEND_REFRESH_LIMIT = int(os.environ.get('RECOMMEND_REFRESH_LIMIT', 500))
+RECOMMEND_SIZE = int(os.environ.get('RECOMMEND_SIZE', 10))
+
+# 删除乐队 / 歌迷是分批执行的任务 (见 _deletes.py)。删除路由先在请求里执行 DELETE_JOB_INLINE 秒，
+# 删不完的留在后台：由管理员页面轮询、定时任务 (携带 METRICS_TOKEN) 调用 /admin/delete_jobs/run
+# 或 flask run-delete-jobs 继续推进，每次约 DELETE_JOB_BUDGET 秒
+def prepare_fan_delete(cursor, fan_id):
+    """删除歌迷的任何数据之前 (和任务进度同一个事务)：撤销他对各乐队统计、排行榜底表和推荐的贡献"""
+    band_stats.retract_fan(cursor, fan_id)
+    leaderboard.retract_fan(cursor, fan_id)
+    recommender.mark_fan(cursor, fan_id)
+
+delete_jobs = DeleteJobs(batch_size=int(os.environ.get('DELETE_BATCH_SIZE', 500)), prepare={'fan': prepare_fan_delete},
+                         review_days=leaderboard.use_table)
+DELETE_JOB_INLINE = float(os.environ.get('DELETE_JOB_INLINE', 2))
+DELETE_JOB_BUDGET = float(os.environ.get('DELETE_JOB_BUDGET', 5))
+
+def prepare_instance():
+    """
+    每个实例只做一次的准备 (后台线程，不阻塞冷启动)：
+    预热连接 (顺带导入 pymysql、构建 SSL 上下文、完成 TLS 握手)，再加载排行榜和推荐数据。
+    第一个请求到来时它们若还在加载，会等加载完而不是再加载一遍。
+    """
+    db_pool.warm()
+    leaderboard.warm()
+    recommender.warm()
+
+if os.environ.get('DB_HOST') and os.environ.get('DB_POOL_PREWARM', '1') == '1':
+    threading.Thread(target=prepare_instance, name='instance-prepare', daemon=True).start()
+
+metrics.registry.gauge_collector('mygo_db_pool', 'Connection pool statistics', db_pool.stats)
+metrics.registry.gauge_collector('mygo_band_cache', 'Band dashboard cache statistics', band_cache.stats)
+metrics.registry.gauge_collector('mygo_leaderboard', 'Album leaderboard statistics', leaderboard.stats)
+metrics.registry.gauge_collector('mygo_fragment_cache', 'Rendered fragment cache statistics', fragment_cache.stats)
+metrics.registry.gauge_collector('mygo_search', 'Search index statistics', search_index.stats)
+metrics.registry.gauge_collector('mygo_recommender', 'Recommendation statistics', recommender.stats)
+metrics.registry.gauge_collector('mygo_template_cache', 'Template bytecode cache statistics', template_cache.stats)
+
+@app.route('/admin/recommendations/refresh', methods=['GET', 'POST'])
+def admin_refresh_recommendations():
+    """增量刷新被标记的推荐数据 (管理员，或定时任务携带 METRICS_TOKEN 调用)"""
+    if not metrics_authorized(): return redirect(url_for('login'))
+    limit = max(1, min(request.args.get('limit', RECOMMEND_REFRESH_LIMIT, type=int), 5000))
+    with db_pool.connection() as conn:
+        processed = recommender.refresh(conn, limit)
+    if processed:
+        data_versions.bump('recommendations')
+    return jsonify(processed=processed, more=processed == limit)
+
+@app.route('/admin/cache_stats')
+def admin_cache_stats():
+    if session.get('role') != 'admin': return redirect(url_for('login'))
+    return jsonify(band_cache.stats())
+
+def page_validators(scopes, *extra):
+    """
+    GET 页面的 (ETag, Last-Modified)。查询参数和 extra (用户 id 等) 也参与计算。
+    有待显示的 flash 消息时返回 None：这类响应不能被 304 替代。
+    """
+    if request.method != 'GET' or session.get('_flashes'):
         return None
+    return data_versions.validators(scopes, (request.full_path,) + extra)
+
+def not_modified(validators):
+    """浏览器缓存仍然有效时直接返回 304 (不查库也不渲染)，否则返回 None"""
+    if validators is None:
+        return None
+    etag, last_modified = validators
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+    return with_validators(app.response_class(status=304), validators) if fresh else None
+
+def with_validators(resp, validators):
+    resp = app.make_response(resp)
+    if validators is not None:
+        etag, last_modified = validators
+        resp.set_etag(etag)
+        resp.last_modified = last_modified
+        # 每次都回源验证 (命中时只返回 304)，只允许浏览器缓存
+        resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
 
 # ================= 3. 登录与注销 =================
 @app.route('/', methods=['GET', 'POST'])
@@ -67,8 +294,9 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        conn = get_db_connection()
-        if not conn:
+        try:
+            conn = get_db_connection()
+        except DatabaseUnavailable:
             flash('无法连接到数据库 (Error 500)', 'danger')
             return render_template('login.html')
 
@@ -88,7 +316,9 @@ def login():
                 elif role == 'band':
                     cursor.execute("SELECT band_id, name FROM Band WHERE name=%s AND password=%s", (username, password))
                     band = cursor.fetchone()
-                    if band:
+                    if band and not writable_targets(cursor, 'band', [band['band_id']], lock=False):
+                        flash('该乐队正在删除', 'warning')
+                    elif band:
                         session['role'] = 'band'
                         session['band_id'] = band['band_id']
                         session['band_name'] = band['name']
@@ -100,7 +330,9 @@ def login():
                 elif role == 'fan':
                     cursor.execute("SELECT fan_id, name FROM Fan WHERE name=%s AND password=%s", (username, password))
                     user = cursor.fetchone()
-                    if user:
+                    if user and not writable_targets(cursor, 'fan', [user['fan_id']], lock=False):
+                        flash('该账号正在注销', 'warning')
+                    elif user:
                         session['role'] = 'fan'
                         session['fan_id'] = user['fan_id']
                         session['fan_name'] = user['name']
@@ -119,38 +351,77 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
+def reject_deleted_account():
+    """已登录的乐队 / 歌迷正在被删除 (或已删除)：清掉登录状态，不再接受写入"""
+    session.clear()
+    if request.is_json or wants_json(): return jsonify(error='账号正在注销或已删除'), 403
+    flash('账号正在注销或已删除', 'warning')
+    return redirect(url_for('login'))
+
+def reject_deleting(e):
+    """写入被删除任务拒绝：自己的账号正在删除时退出登录，关注 / 评价的目标所属乐队正在删除时只拒绝这一次"""
+    if e.kind == session.get('role'):
+        return reject_deleted_account()
+    if request.is_json or wants_json(): return jsonify(error='目标乐队正在删除'), 409
+    flash('目标乐队正在删除，暂时不能关注或评价', 'warning')
+    return redirect(url_for('fan_dashboard'))
+
 # ================= 4. 管理员功能模块 =================
 @app.route('/admin', methods=['GET', 'POST'])
 def admin_dashboard():
     if session.get('role') != 'admin': return redirect(url_for('login'))
+    validators = page_validators(['directory'])
+    cached = not_modified(validators)
+    if cached: return cached
     
     conn = get_db_connection()
     if request.method == 'POST':
         action = request.form.get('action')
+        new_band = None
         try:
             with conn.cursor() as cursor:
                 if action == 'add_band':
                     cursor.execute("INSERT INTO Band (name, leader_name, founding_date, password, intro) VALUES (%s, %s, %s, %s, %s)",
                                    (request.form.get('name'), request.form.get('leader'), request.form.get('date'), request.form.get('password'), request.form.get('intro')))
+                    new_band = (cursor.lastrowid, request.form.get('name'), request.form.get('intro'))
                     flash('乐队创建成功', 'success')
                 elif action == 'add_fan':
                     cursor.execute("INSERT INTO Fan (name, password, age) VALUES (%s, %s, %s)", 
                                    (request.form.get('name'), request.form.get('password'), request.form.get('age')))
                     flash('歌迷添加成功', 'success')
+                elif action == 'reconcile_ratings':
+                    drift = reconcile_album_aggregates(conn)
+                    leaderboard.invalidate()
+                    if drift:
+                        names = '、'.join(d['title'] for d in drift[:5])
+                        flash(f'评分对账完成：修正了 {len(drift)} 张专辑 ({names}{" 等" if len(drift) > 5 else ""})', 'warning')
+                    else:
+                        flash('评分对账完成：所有专辑的累计值均一致', 'success')
             conn.commit()
+            data_versions.bump('directory' if action in ('add_band', 'add_fan') else 'ratings')
+            if new_band:
+                search_index.put_band(*new_band)
         except Exception as e:
             conn.rollback()
             flash(f'操作失败: {e}', 'danger')
 
+    # 乐队和歌迷列表各自按主键翻页，只取模板用到的列
+    bands_after = request.args.get('bands_after')
+    fans_after = request.args.get('fans_after')
     try:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM Band")
-            bands = cursor.fetchall()
-            cursor.execute("SELECT * FROM Fan")
-            fans = cursor.fetchall()
+            bands = keyset_page(cursor, "SELECT band_id, name, leader_name, founding_date FROM Band",
+                                [('band_id', 'band_id')], after=bands_after, limit=PAGE_SIZE)
+            fans = keyset_page(cursor, "SELECT fan_id, name, age FROM Fan",
+                               [('fan_id', 'fan_id')], after=fans_after, limit=PAGE_SIZE)
+            jobs = delete_jobs.recent(cursor)
     finally:
         conn.close()
-    return render_template('admin.html', bands=bands, fans=fans)
+    deleting = {(j['kind'], j['target_id']) for j in jobs if j['status'] == 'running'}
+    return with_validators(render_template('admin.html', bands=bands.items, fans=fans.items,
+                                           bands_after=bands_after, fans_after=fans_after,
+                                           bands_next=bands.next_cursor, fans_next=fans.next_cursor,
+                                           delete_jobs=jobs, deleting=deleting), validators)
 
 @app.route('/admin/band_detail/<int:band_id>', methods=['GET', 'POST'])
 def admin_band_detail(band_id):
@@ -162,6 +433,7 @@ def admin_band_detail(band_id):
                 cursor.execute("INSERT INTO Member (name, role, gender, join_date, band_id) VALUES (%s, %s, %s, %s, %s)",
                                (request.form.get('name'), request.form.get('role'), request.form.get('gender'), request.form.get('join_date'), band_id))
             conn.commit()
+            band_cache.invalidate(band_id, 'members')
             flash('成员添加成功', 'success')
         except Exception as e:
             conn.rollback()
@@ -178,31 +450,77 @@ def admin_band_detail(band_id):
         conn.close()
     return render_template('admin_band_members.html', band=band, members=members)
 
-@app.route('/admin/delete_band/<int:band_id>')
-def admin_delete_band(band_id):
-    if session.get('role') != 'admin': return redirect(url_for('login'))
+def after_delete_batches(before, job):
+    """删除任务推进之后失效缓存：删除过程中数据就在逐批消失，完成时再更新推荐和排行榜"""
+    if (job['step'], job['deleted'], job['status']) == (before['step'], before['deleted'], before['status']):
+        return
+    target_id = job['target_id']
+    if job['kind'] == 'band':
+        band_cache.invalidate(target_id)
+        leaderboard.remove_band(target_id)
+        search_index.remove('band', target_id)
+        data_versions.bump('directory', 'catalog', 'ratings')
+        if job['status'] == 'done':
+            recommender.invalidate()  # 乐队的专辑、歌曲也一起删掉了
+    else:
+        # 歌迷的乐评分散在各个乐队，直接清空缓存
+        band_cache.clear()
+        data_versions.bump('directory', 'ratings', ('fan', target_id))
+        if job['status'] == 'done':
+            leaderboard.invalidate()
+
+def delete_in_background(kind, target_id, done_message):
+    """创建删除任务并在本次请求里先执行一小段，删不完的转入后台"""
     conn = get_db_connection()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("DELETE FROM Band WHERE band_id=%s", (band_id,))
-        conn.commit()
-        flash('乐队已删除', 'warning')
+        before = delete_jobs.start(conn, kind, target_id)
+        if before is None:
+            flash('要删除的数据不存在', 'warning')
+            return
+        job = delete_jobs.run(conn, dict(before), time.monotonic() + DELETE_JOB_INLINE)
     finally:
         conn.close()
+    after_delete_batches(before, job)
+    if job['status'] == 'done':
+        flash(done_message, 'warning')
+    elif job['error']:
+        flash(f'删除「{job["label"]}」出错，稍后会从中断处继续: {job["error"]}', 'danger')
+    else:
+        flash(f'「{job["label"]}」的数据较多，已转入后台分批删除，进度见页面顶部', 'info')
+
+@app.route('/admin/delete_band/<int:band_id>')
+def admin_delete_band(band_id):
+    if session.get('role') != 'admin': return redirect(url_for('login'))
+    delete_in_background('band', band_id, '乐队已删除')
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/delete_fan/<int:fan_id>')
 def admin_delete_fan(fan_id):
     if session.get('role') != 'admin': return redirect(url_for('login'))
-    conn = get_db_connection()
-    try:
+    delete_in_background('fan', fan_id, '歌迷已注销')
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/delete_jobs')
+def admin_delete_job_status():
+    """分批删除任务的进度 (进行中的 + 最近完成的)"""
+    if not metrics_authorized(): return redirect(url_for('login'))
+    with db_pool.connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("DELETE FROM Fan WHERE fan_id=%s", (fan_id,))
+            jobs = delete_jobs.recent(cursor)
         conn.commit()
-        flash('歌迷已注销', 'warning')
-    finally:
-        conn.close()
-    return redirect(url_for('admin_dashboard'))
+    return jsonify(jobs=jobs, running=sum(j['status'] == 'running' for j in jobs))
+
+@app.route('/admin/delete_jobs/run', methods=['GET', 'POST'])
+def admin_run_delete_jobs():
+    """推进进行中的删除任务约 DELETE_JOB_BUDGET 秒并返回进度 (管理员页面轮询，或定时任务携带 METRICS_TOKEN 调用)"""
+    if not metrics_authorized(): return redirect(url_for('login'))
+    with db_pool.connection() as conn:
+        for before, job in delete_jobs.run_pending(conn, DELETE_JOB_BUDGET):
+            after_delete_batches(before, job)
+        with conn.cursor() as cursor:
+            jobs = delete_jobs.recent(cursor)
+        conn.commit()
+    return jsonify(jobs=jobs, running=sum(j['status'] == 'running' for j in jobs))
 
 @app.route('/admin/delete_member/<int:member_id>/<int:band_id>')
 def admin_delete_member(member_id, band_id):
@@ -212,40 +530,178 @@ def admin_delete_member(member_id, band_id):
         with conn.cursor() as cursor:
             cursor.execute("DELETE FROM Member WHERE member_id=%s", (member_id,))
         conn.commit()
+        band_cache.invalidate(band_id, 'members')
         flash('成员已移除', 'success')
     finally:
         conn.close()
     return redirect(url_for('admin_band_detail', band_id=band_id))
 
+@app.route('/admin/export/<name>')
+def admin_export(name):
+    """
+    流式导出: /admin/export/fans?format=csv&columns=fan_id,name&min_age=18&gzip=1
+    可导出 fans / reviews / likes_band / likes_album / likes_song / likes_concert
+    """
+    if session.get('role') != 'admin': return redirect(url_for('login'))
+    import pymysql
+    from _export import EXPORTS, FORMATS, ExportError, stream_export
+    export = EXPORTS.get(name)
+    fmt = request.args.get('format', 'csv')
+    if export is None or fmt not in FORMATS:
+        return jsonify(error=f'未知的导出 {name} 或格式 {fmt}', exports=sorted(EXPORTS), formats=sorted(FORMATS)), 404
+    try:
+        columns = export.select_columns(request.args.get('columns'))
+        sql, args = export.build_query(columns, export.parse_filters(request.args))
+    except ExportError as e:
+        return jsonify(error=str(e)), 400
+
+    compress = request.args.get('gzip') == '1'
+    conn = get_db_connection()
+    try:
+        # 非缓冲 cursor：查询在这里执行 (出错时还能返回错误页)，结果由响应生成器逐批读取
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        cursor.execute(sql, args)
+    except Exception:
+        conn.discard()
+        raise
+    content_type, ext = FORMATS[fmt]
+    filename = f'{name}.{ext}' + ('.gz' if compress else '')
+    resp = Response(stream_with_context(stream_export(conn, cursor, columns, fmt, compress)),
+                    content_type='application/gzip' if compress else content_type)
+    resp.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+# 批量导入：每个事务写入的行数；导入后要递增的数据版本 (成员、专辑、歌曲另外清空乐队后台缓存)
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+IMPORT_VERSION_SCOPES = {'bands': ('directory', 'catalog'), 'fans': ('directory',), 'members': (),
+                         'albums': ('catalog',), 'songs': ('catalog',)}
+
+def finish_import(name):
+    """导入写入了数据之后失效相关的缓存；搜索索引整体重新加载 (逐行增量更新不划算)"""
+    if name in ('members', 'albums', 'songs'):
+        band_cache.clear()
+    if name in ('bands', 'albums', 'songs'):
+        search_index.invalidate()
+    if IMPORT_VERSION_SCOPES[name]:
+        data_versions.bump(*IMPORT_VERSION_SCOPES[name])
+
+@app.route('/admin/import/<name>', methods=['POST'])
+def admin_import(name):
+    """
+    批量导入: curl -F file=@songs.csv /admin/import/songs (格式按扩展名判断或 ?format=csv/ndjson，可以 .gz 压缩)
+    可导入 bands / members / fans / albums / songs，各自的列见 _import.py
+    响应是 NDJSON 流：出错的行各一行 {"line", "error", "row"}，每写完一块一行 {"progress"}，最后一行 {"done"} 汇总
+    """
+    if session.get('role') != 'admin': return redirect(url_for('login'))
+    from _import import IMPORTS, BulkImportError, detect_format, import_records, read_records
+    spec = IMPORTS.get(name)
+    upload = request.files.get('file')
+    if spec is None or upload is None:
+        return jsonify(error=f'未知的导入 {name} 或没有上传文件 (字段 file)', imports=sorted(IMPORTS)), 404
+    try:
+        fmt, compressed = detect_format(upload.filename, request.values.get('format'))
+        records = read_records(upload.stream, fmt, spec, compressed)
+    except BulkImportError as e:
+        return jsonify(error=str(e)), 400
+
+    conn = get_db_connection()
+
+    def generate():
+        progress, error = {'read': 0, 'inserted': 0, 'failed': 0}, None
+        try:
+            for progress, failures in import_records(conn, spec, records, IMPORT_CHUNK_SIZE):
+                lines = [f.as_dict() for f in failures] + [{'progress': progress}]
+                yield ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines)
+        except BulkImportError as e:
+            error = str(e)  # 文件后面的部分读不出来，已经写入的块保留
+        except Exception as e:
+            # 响应头早已发出，只能在流里报错；同样带上已写入的进度
+            error = f'导入中断: {e}'
+        finally:
+            conn.close()
+            if progress['inserted']:
+                finish_import(name)
+        yield json.dumps(dict(progress, done=error is None, error=error), ensure_ascii=False) + '\n'
+
+    resp = Response(stream_with_context(generate()), content_type='text/plain; charset=utf-8')
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
 # ================= 5. 乐队功能模块 (全功能修复版) =================
+# 乐队后台的写操作 -> 需要失效的缓存数据集
+BAND_ACTION_DATASETS = {
+    'update_intro': ('intro',),
+    'add_album': ('albums',),
+    'add_song': ('songs',),
+    'add_concert': ('concerts',),
+}
+# 会改变歌迷页面 (曲库、关注的乐队链接) 的乐队操作
+CATALOG_ACTIONS = ('update_intro', 'add_album', 'add_song')
+
+def band_dataset_queries(band_id):
+    """乐队后台的各个数据集：名称 -> (SQL, 参数, 'one' 取一行 / 'all' 取全部)"""
+    queries = {
+        # 成员 (直接查 Member 表，解决成员删除报错问题)
+        'members': ("SELECT * FROM Member WHERE band_id=%s", (band_id,), 'all'),
+        # 乐队基本信息 (包含 netease_url)
+        'intro': ("SELECT intro, netease_url FROM Band WHERE band_id=%s", (band_id,), 'one'),
+        # 专辑和歌曲列表
+        'albums': ("SELECT * FROM Album WHERE band_id=%s", (band_id,), 'all'),
+        'songs': ("SELECT s.song_id, s.title, s.authors, a.title as album_title FROM Song s JOIN Album a ON s.album_id = a.album_id WHERE a.band_id = %s", (band_id,), 'all'),
+        # 乐评和演唱会
+        'reviews': ("SELECT r.score, r.comment, r.review_time, a.title as album_title, f.name as fan_name FROM Review r JOIN Album a ON r.album_id = a.album_id JOIN Fan f ON r.fan_id = f.fan_id WHERE a.band_id = %s ORDER BY r.review_time DESC", (band_id,), 'all'),
+        'concerts': ("SELECT * FROM Concert WHERE band_id=%s ORDER BY hold_time DESC", (band_id,), 'all'),
+        # 统计汇总行 (Band_Stat 按主键前缀读取，任何乐队都一样)
+        'stats': ("SELECT dim, bucket, cnt, total FROM Band_Stat WHERE band_id=%s", (band_id,), 'all'),
+    }
+    return queries
+
+def load_band_datasets(band_id):
+    """读穿透：先查缓存，只对未命中的数据集查库并写回缓存"""
+    queries = band_dataset_queries(band_id)
+    data = band_cache.get_many(band_id, queries)
+    missing = [name for name in queries if name not in data]
+    if missing:
+        generation = band_cache.generation(band_id)
+        # 未命中的数据集并行查询
+        batch = QueryBatch(db_pool, max_concurrency=BATCH_CONCURRENCY)
+        for name in missing:
+            sql, args, mode = queries[name]
+            batch.add(name, sql, args, fetch=mode)
+        data.update(run_batch(batch))
+        for name in missing:
+            band_cache.set(band_id, name, data[name], generation)
+    return data
+
 @app.route('/band', methods=['GET', 'POST'])
 def band_dashboard():
     if session.get('role') != 'band': return redirect(url_for('login'))
-    conn = get_db_connection()
     band_id = session['band_id']
     band_name = session['band_name']
-
-    # 视图映射 (仅用于统计图表)
-    view_map = {
-        'MyGO!!!!!': ("view_mygo_info", "view_mygo_fan_stats", "view_mygo_song_stats", "view_mygo_concert_stats"),
-        'Ave Mujica': ("view_avemujica_info", "view_avemujica_fan_stats", "view_avemujica_song_stats", "view_avemujica_concert_stats")
-    }
-    has_views = band_name in view_map
+    validators = page_validators([('band', band_id), 'bands'], band_id)
+    cached = not_modified(validators)
+    if cached: return cached
 
     # POST 操作
     if request.method == 'POST':
         action = request.form.get('action')
+        search_update = None  # 提交后应用到搜索索引的增量更新: (方法, 参数)
+        conn = get_db_connection()
         try:
             with conn.cursor() as cursor:
+                require_writable(cursor, 'band', band_id)
                 if action == 'update_intro':
                     # [新功能] 同时更新简介和网易云链接
                     cursor.execute("UPDATE Band SET intro=%s, netease_url=%s WHERE band_id=%s", 
                                    (request.form.get('intro'), request.form.get('netease_url'), band_id))
+                    search_update = (search_index.set_band_intro, (band_id, request.form.get('intro')))
                     flash('简介与链接更新成功', 'success')
                 
                 elif action == 'add_album':
                     cursor.execute("INSERT INTO Album (title, release_date, album_intro, band_id) VALUES (%s, %s, %s, %s)",
                                    (request.form.get('title'), request.form.get('release_date'), request.form.get('intro'), band_id))
+                    search_update = (search_index.put_album, (cursor.lastrowid, band_id, request.form.get('title'), request.form.get('intro')))
                     flash('新专辑发布成功', 'success')
                 
                 elif action == 'add_song':
@@ -255,6 +711,8 @@ def band_dashboard():
                                     request.form.get('authors'), 
                                     request.form.get('album_id'),
                                     request.form.get('netease_url'))) # <--- 新增这行
+                    search_update = (search_index.put_song, (cursor.lastrowid, request.form.get('album_id', type=int), request.form.get('title'),
+                                                             request.form.get('authors'), request.form.get('netease_url')))
                     flash('新歌录入成功', 'success')
                 
                 elif action == 'add_concert': 
@@ -262,56 +720,40 @@ def band_dashboard():
                                    (request.form.get('name'), request.form.get('hold_time'), request.form.get('location'), band_id))
                     flash('演唱会发布成功', 'success')
             conn.commit()
+            # 提交之后再失效，避免并发读把提交前的数据写回缓存
+            band_cache.invalidate(band_id, *BAND_ACTION_DATASETS.get(action, ()))
+            if action in CATALOG_ACTIONS:
+                data_versions.bump('catalog')
+            if search_update:
+                method, args = search_update
+                method(*args)
+        except TargetDeleting:
+            conn.rollback()
+            return reject_deleted_account()
         except Exception as e:
             conn.rollback()
             flash(f'操作失败: {e}', 'danger')
+        finally:
+            conn.close()
 
-    # GET 页面渲染
-    try:
-        with conn.cursor() as cursor:
-            # 1. 获取成员 (直接查 Member 表，解决成员删除报错问题)
-            cursor.execute("SELECT * FROM Member WHERE band_id=%s", (band_id,))
-            members = cursor.fetchall()
+    # GET 页面渲染 (缓存命中的数据集不再查库)
+    # 作品列表和乐评列表的 HTML 片段按数据集版本缓存 (先取版本再读数据，片段不会比版本旧)
+    works_fragment = ('band-works', band_id, data_versions.get('bands'),
+                      data_versions.get(('band', band_id, 'albums')), data_versions.get(('band', band_id, 'songs')))
+    reviews_fragment = ('band-reviews', band_id, data_versions.get('bands'), data_versions.get(('band', band_id, 'reviews')))
+    data = load_band_datasets(band_id)
+    res = data['intro']
+    current_intro = res['intro'] if res else ""
+    current_url = res['netease_url'] if res else "" # [新功能]
+    # 统计图表 (歌曲/演唱会名称直接取自已加载的列表)
+    stats, song_stats, concert_stats = band_stats.summarize(data['stats'], data['songs'], data['concerts'])
 
-            # 2. 获取统计数据 (如果有视图)
-            if has_views:
-                _, v_stats, v_song, v_concert = view_map[band_name]
-                cursor.execute(f"SELECT * FROM {v_stats}")
-                stats = cursor.fetchone()
-                cursor.execute(f"SELECT * FROM {v_song}")
-                song_stats = cursor.fetchall()
-                cursor.execute(f"SELECT * FROM {v_concert}")
-                concert_stats = cursor.fetchall()
-            else:
-                stats, song_stats, concert_stats = None, [], []
-
-            # 3. 获取乐队基本信息 (包含 netease_url)
-            cursor.execute("SELECT intro, netease_url FROM Band WHERE band_id=%s", (band_id,))
-            res = cursor.fetchone()
-            current_intro = res['intro'] if res else ""
-            current_url = res['netease_url'] if res else "" # [新功能]
-            
-            # 4. 专辑和歌曲列表
-            cursor.execute("SELECT * FROM Album WHERE band_id=%s", (band_id,))
-            my_albums = cursor.fetchall()
-            
-            cursor.execute("SELECT s.song_id, s.title, s.authors, a.title as album_title FROM Song s JOIN Album a ON s.album_id = a.album_id WHERE a.band_id = %s", (band_id,))
-            my_songs = cursor.fetchall()
-            
-            # 5. 乐评和演唱会
-            cursor.execute("SELECT r.score, r.comment, r.review_time, a.title as album_title, f.name as fan_name FROM Review r JOIN Album a ON r.album_id = a.album_id JOIN Fan f ON r.fan_id = f.fan_id WHERE a.band_id = %s ORDER BY r.review_time DESC", (band_id,))
-            reviews = cursor.fetchall()
-
-            cursor.execute("SELECT * FROM Concert WHERE band_id=%s ORDER BY hold_time DESC", (band_id,))
-            my_concerts = cursor.fetchall()
-    finally:
-        conn.close()
-
-    return render_template('band.html', band_name=band_name, members=members, stats=stats, 
+    return with_validators(render_template('band.html', band_name=band_name, members=data['members'], stats=stats, 
                            intro=current_intro, netease_url=current_url, # 传给模板
-                           my_albums=my_albums, my_songs=my_songs, 
-                           reviews=reviews, my_concerts=my_concerts, 
-                           song_stats=song_stats, concert_stats=concert_stats)
+                           my_albums=data['albums'], my_songs=data['songs'], 
+                           reviews=data['reviews'], my_concerts=data['concerts'], 
+                           song_stats=song_stats, concert_stats=concert_stats,
+                           works_fragment=works_fragment, reviews_fragment=reviews_fragment), validators)
 
 # 乐队资源删除接口
 @app.route('/band/delete_album/<int:album_id>')
@@ -320,8 +762,22 @@ def delete_album(album_id):
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
+            require_writable(cursor, 'band', session['band_id'])
+            band_stats.retract_album(cursor, session['band_id'], album_id)
             cursor.execute("DELETE FROM Album WHERE album_id=%s AND band_id=%s", (album_id, session['band_id']))
+            deleted = cursor.rowcount > 0
+            if deleted:
+                leaderboard.drop_album(cursor, album_id)
         conn.commit()
+        band_cache.invalidate(session['band_id'], 'albums', 'songs', 'reviews', 'stats')
+        if deleted:
+            leaderboard.remove_album(album_id)
+            search_index.remove('album', album_id)
+            recommender.invalidate()  # 专辑的歌曲也一起删掉了
+            data_versions.bump('catalog', 'ratings')
+    except TargetDeleting:
+        conn.rollback()
+        return reject_deleted_account()
     finally: conn.close()
     return redirect(url_for('band_dashboard'))
 
@@ -331,8 +787,19 @@ def delete_song(song_id):
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
+            require_writable(cursor, 'band', session['band_id'])
+            band_stats.retract_song(cursor, session['band_id'], song_id)
             cursor.execute("DELETE FROM Song WHERE song_id=%s AND album_id IN (SELECT album_id FROM Album WHERE band_id=%s)", (song_id, session['band_id']))
+            deleted = cursor.rowcount > 0
         conn.commit()
+        band_cache.invalidate(session['band_id'], 'songs', 'stats')
+        data_versions.bump('catalog')
+        if deleted:
+            search_index.remove('song', song_id)
+            recommender.remove('song', song_id)
+    except TargetDeleting:
+        conn.rollback()
+        return reject_deleted_account()
     finally: conn.close()
     return redirect(url_for('band_dashboard'))
 
@@ -342,8 +809,14 @@ def delete_concert(concert_id):
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
+            require_writable(cursor, 'band', session['band_id'])
+            band_stats.retract_concert(cursor, session['band_id'], concert_id)
             cursor.execute("DELETE FROM Concert WHERE concert_id=%s AND band_id=%s", (concert_id, session['band_id']))
         conn.commit()
+        band_cache.invalidate(session['band_id'], 'concerts', 'stats')
+    except TargetDeleting:
+        conn.rollback()
+        return reject_deleted_account()
     finally: conn.close()
     return redirect(url_for('band_dashboard'))
 
@@ -353,8 +826,13 @@ def delete_member(member_id):
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
+            require_writable(cursor, 'band', session['band_id'])
             cursor.execute("DELETE FROM Member WHERE member_id=%s AND band_id=%s", (member_id, session['band_id']))
         conn.commit()
+        band_cache.invalidate(session['band_id'], 'members')
+    except TargetDeleting:
+        conn.rollback()
+        return reject_deleted_account()
     finally: conn.close()
     return redirect(url_for('band_dashboard'))
 
@@ -362,113 +840,526 @@ def delete_member(member_id):
 @app.route('/fan', methods=['GET', 'POST'])
 def fan_dashboard():
     if session.get('role') != 'fan': return redirect(url_for('login'))
-    conn = get_db_connection()
     fan_id = session['fan_id']
+    validators = page_validators([('fan', fan_id), 'catalog', 'ratings', 'recommendations'], fan_id)
+    cached = not_modified(validators)
+    if cached: return cached
 
-    if request.method == 'POST':
+    # 写后缓冲开启时评分只入队，不在请求里开事务
+    if request.method == 'POST' and not (request.form.get('action') == 'rate' and queue_review(fan_id)):
         action = request.form.get('action')
+        stale_bands = {}  # band_id -> 需要失效的缓存数据集
+        ranked = None  # 提交后要计入排行榜的评分
+        conn = get_db_connection()
         try:
             with conn.cursor() as cursor:
+                require_writable(cursor, 'fan', fan_id)
                 if action == 'rate':
-                    album_id = request.form.get('album_id')
-                    score = request.form.get('score')
+                    album_id = parse_album_id(request.form.get('album_id'))
+                    score = parse_score(request.form.get('score'))
+                    require_bands_writable(cursor, {'album': {album_id}})
                     comment = request.form.get('comment')
                     
-                    # 1. 插入评论
-                    sql = """
-                        INSERT INTO Review (fan_id, album_id, score, comment, review_time) 
-                        VALUES (%s, %s, %s, %s, NOW()) 
-                        ON DUPLICATE KEY UPDATE 
-                        score = VALUES(score), comment = VALUES(comment), review_time = NOW()
-                    """
-                    cursor.execute(sql, (fan_id, album_id, score, comment))
-
-                    # 2. [手动更新] 计算平均分并写入 Album 表 (替代 Trigger)
-                    update_avg_sql = """
-                        UPDATE Album 
-                        SET avg_score = (SELECT AVG(score) FROM Review WHERE album_id = %s) 
-                        WHERE album_id = %s
-                    """
-                    cursor.execute(update_avg_sql, (album_id, album_id))
-                    
+                    # 写入乐评，并以增量方式维护专辑的 review_count / score_sum / avg_score
+                    submitted = submit_review(cursor, fan_id, album_id, score, comment)
+                    if submitted.old_score is None:
+                        band_stats.record_review(cursor, submitted.band_id, 1, score)
+                    else:
+                        band_stats.record_review(cursor, submitted.band_id, 0, score - submitted.old_score)
+                    leaderboard.persist_review(cursor, album_id, submitted, score)
+                    recommender.mark_review(cursor, album_id, submitted, score)
+                    stale_bands[submitted.band_id] = ('reviews', 'stats')
+                    ranked = (album_id, submitted, score)
+
                     flash('评价已提交，专辑分数已更新！', 'success')
                 
                 elif action == 'update_profile':
+                    age = band_stats.parse_age(request.form.get('age'))
+                    cursor.execute("SELECT age, gender, education FROM Fan WHERE fan_id=%s FOR UPDATE", (fan_id,))
+                    old_profile = cursor.fetchone()
                     cursor.execute("UPDATE Fan SET occupation=%s, education=%s, age=%s WHERE fan_id=%s",
-                                   (request.form.get('occupation'), request.form.get('education'), request.form.get('age'), fan_id))
+                                   (request.form.get('occupation'), request.form.get('education'), age, fan_id))
+                    # 年龄段/学历变化时，同步所关注乐队的粉丝构成统计
+                    new_profile = dict(old_profile, education=request.form.get('education'), age=age)
+                    for band_id in band_stats.update_fan_profile(cursor, fan_id, old_profile, new_profile):
+                        stale_bands[band_id] = ('stats',)
                     flash('资料已更新', 'success')
             conn.commit()
+            for band_id, datasets in stale_bands.items():
+                band_cache.invalidate(band_id, *datasets)
+            if ranked:
+                leaderboard.apply_review(*ranked)
+                data_versions.bump('ratings')
+            elif action == 'update_profile':
+                data_versions.bump(('fan', fan_id), 'directory')
+        except TargetDeleting as e:
+            conn.rollback()
+            return reject_deleting(e)
         except Exception as e:
             conn.rollback()
             flash(f'操作失败: {e}', 'danger')
+        finally:
+            conn.close()
+
+    # 以下查询互不依赖，分到多个连接上并行执行
+    songs_after = request.args.get('songs_after')
+    batch = QueryBatch(db_pool, max_concurrency=BATCH_CONCURRENCY)
+    batch.add('my_profile', "SELECT fan_id, occupation, education, age FROM Fan WHERE fan_id=%s", (fan_id,), fetch='one')
+    # (评分表单的专辑下拉框改为通过 /fan/albums 按需加载)
+    # 关注列表 (这里也要加上链接)
+    batch.add('like_bands', """
+        SELECT b.name, b.band_id, b.netease_url 
+        FROM Band b 
+        JOIN Fan_Like_Band f ON b.band_id=f.band_id 
+        WHERE f.fan_id=%s
+    """, (fan_id,))
+    batch.add('like_songs', "SELECT s.title, s.song_id FROM Song s JOIN Fan_Like_Song f ON s.song_id=f.song_id WHERE f.fan_id=%s", (fan_id,))
+    # 写后缓冲里还没写入的关注：新关注的条目一起查出来，叠加到上面两个列表上 (自己的操作立刻可见)
+    pending = write_behind.pending_likes(fan_id) if write_behind is not None else {}
+    for kind, sql in (('band', "SELECT name, band_id, netease_url FROM Band WHERE band_id IN ({})"),
+                      ('song', "SELECT title, song_id FROM Song WHERE song_id IN ({})")):
+        added = sorted(i for i, op in pending.get(kind, {}).items() if op == 'like')
+        if added:
+            batch.add(f'pending_{kind}s', sql.format(', '.join(['%s'] * len(added))), added)
+    # 还没计入专辑分数的乐评 (显示在评分表单下面)
+    queued_reviews = write_behind.pending_reviews(fan_id) if write_behind is not None else {}
+    if queued_reviews:
+        batch.add('pending_albums', f"SELECT album_id, title FROM Album WHERE album_id IN ({', '.join(['%s'] * len(queued_reviews))})",
+                  sorted(queued_reviews))
+    # [新功能] 获取歌曲库时，带上网易云链接 (按 song_id 键集分页)
+    # 歌曲库表格对所有歌迷都一样：渲染好的片段按曲库版本缓存，命中时连查询也省掉
+    songs_fragment = ('fan-songs', data_versions.get('catalog'), songs_after)
+    fragments = {}
+    songs_html = fragment_cache.lookup(songs_fragment)
+    if songs_html is not None:
+        fragments[songs_fragment] = songs_html
+    else:
+        batch.add('songs', lambda cursor: keyset_page(cursor, """
+            SELECT s.song_id, s.title, s.authors, s.netease_url, a.title as album_title 
+            FROM Song s JOIN Album a ON s.album_id = a.album_id
+        """, [('s.song_id', 'song_id')], after=songs_after, limit=PAGE_SIZE))
+    data = run_batch(batch)
+    songs = data.get('songs')
+    like_bands = overlay_pending(data['like_bands'], 'band_id', pending.get('band'), data.get('pending_bands'))
+    like_songs = overlay_pending(data['like_songs'], 'song_id', pending.get('song'), data.get('pending_songs'))
+    pending_reviews = [{'title': r['title'], 'score': queued_reviews[r['album_id']][0]} for r in data.get('pending_albums') or ()]
+    # 排行榜由进程内物化的 leaderboard 提供，通常不访问数据库
+    rank_window = request.args.get('rank_window', 'all')
+    if rank_window not in WINDOWS:
+        rank_window = 'all'
+    ranks = leaderboard.top(10, rank_window)
+    # 猜你喜欢：以页面上已经查出的关注列表为种子，在进程内的相似表上计算 (不再访问数据库)
+    recommendations = recommender.for_fan({'song': [s['song_id'] for s in like_songs],
+                                           'band': [b['band_id'] for b in like_bands]}, RECOMMEND_SIZE)
 
+    return with_validators(render_template('fan.html', user_name=session['fan_name'], my_profile=data['my_profile'], 
+                           ranks=ranks, rank_window=rank_window, recommendations=recommendations, pending_reviews=pending_reviews,
+                           like_bands=like_bands, like_songs=like_songs, 
+                           all_songs=songs.items if songs else [], songs_after=songs_after,
+                           songs_next=songs.next_cursor if songs else None,
+                           songs_fragment=songs_fragment, fragments=fragments), validators)
+
+@app.route('/fan/leaderboard')
+def fan_leaderboard():
+    """专辑排行榜 JSON: ?window=all|30d|7d&band_id=&limit="""
+    if session.get('role') not in ('fan', 'band', 'admin'): return redirect(url_for('login'))
+    window = request.args.get('window', 'all')
+    if window not in WINDOWS:
+        return jsonify(error=f'未知的时间窗口 {window}', windows=list(WINDOWS)), 400
+    band_id = request.args.get('band_id', type=int)
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    return jsonify(window=window, band_id=band_id, items=leaderboard.top(limit, window, band_id))
+
+@app.route('/fan/similar/<kind>/<int:item_id>')
+def similar_items(kind, item_id):
+    """喜欢这个的歌迷也喜欢 (JSON): ?limit="""
+    if session.get('role') not in ('fan', 'band', 'admin'): return redirect(url_for('login'))
+    if kind not in RECOMMEND_KINDS:
+        return jsonify(error=f'未知类型 {kind}', types=list(RECOMMEND_KINDS)), 400
+    limit = max(1, min(request.args.get('limit', RECOMMEND_SIZE, type=int), 50))
+    return jsonify(type=kind, id=item_id, items=recommender.similar(kind, item_id, limit))
+
+@app.route('/search')
+def search():
+    """
+    站内搜索 JSON: ?q=&type=song,album,band&limit=
+    q 的最后一个单词按前缀匹配 (输入联想)；中日文按单字 / 两字片段匹配
+    """
+    if session.get('role') not in ('fan', 'band', 'admin'): return redirect(url_for('login'))
+    q = (request.args.get('q') or '')[:100]
+    kinds = tuple(k for k in (request.args.get('type') or ','.join(SEARCH_KINDS)).split(',') if k)
+    unknown = [k for k in kinds if k not in SEARCH_KINDS]
+    if unknown:
+        return jsonify(error=f'未知的类型 {", ".join(unknown)}', types=list(SEARCH_KINDS)), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    return jsonify(q=q, items=search_index.search(q, limit, kinds))
+
+@app.route('/fan/albums')
+def fan_album_lookup():
+    """评分表单的专辑下拉框：按标题前缀过滤，按 (title, album_id) 键集分页，返回 JSON"""
+    if session.get('role') != 'fan': return redirect(url_for('login'))
+    q = (request.args.get('q') or '').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    where, args = None, ()
+    if q:
+        # 只做前缀匹配，可以走 title 索引
+        escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        where, args = "title LIKE %s", (escaped + '%',)
+    conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM Fan WHERE fan_id=%s", (fan_id,))
-            my_profile = cursor.fetchone()
-            
-            # 排行榜
-            cursor.execute("SELECT * FROM Album ORDER BY avg_score DESC LIMIT 10")
-            ranks = cursor.fetchall()
-            
-            cursor.execute("SELECT * FROM Album")
-            albums = cursor.fetchall()
-            
-            # 关注列表 (这里也要加上链接)
-            cursor.execute("""
-                SELECT b.name, b.band_id, b.netease_url 
-                FROM Band b 
-                JOIN Fan_Like_Band f ON b.band_id=f.band_id 
-                WHERE f.fan_id=%s
-            """, (fan_id,))
-            like_bands = cursor.fetchall()
-            
-            cursor.execute("SELECT s.title, s.song_id FROM Song s JOIN Fan_Like_Song f ON s.song_id=f.song_id WHERE f.fan_id=%s", (fan_id,))
-            like_songs = cursor.fetchall()
-            
-            # [新功能] 获取所有歌曲时，带上网易云链接
-            cursor.execute("""
-                SELECT s.song_id, s.title, s.authors, s.netease_url, a.title as album_title 
-                FROM Song s JOIN Album a ON s.album_id = a.album_id
-            """)
-            all_songs = cursor.fetchall()
+            page = keyset_page(cursor, "SELECT album_id, title FROM Album",
+                               [('title', 'title'), ('album_id', 'album_id')],
+                               after=request.args.get('after'), limit=limit, where=where, args=args)
     finally:
         conn.close()
+    return jsonify(items=page.items, next=page.next_cursor)
 
-    return render_template('fan.html', user_name=session['fan_name'], my_profile=my_profile, 
-                           ranks=ranks, albums=albums, 
-                           like_bands=like_bands, like_songs=like_songs, 
-                           all_songs=all_songs)
+def wants_json():
+    return request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+
+def refresh_like_stats(cursor, fan_id, changes):
+    """把实际发生的关注变化计入乐队统计，返回需要失效统计缓存的 band_id"""
+    stale = set()
+    for kind, kind_changes in changes.items():
+        stale |= band_stats.record_likes(cursor, fan_id, kind, kind_changes)
+    return stale
 
 @app.route('/fan/toggle_like/<type>/<int:id>')
 def toggle_like(type, id):
     if session.get('role') != 'fan': return redirect(url_for('login'))
-    conn = get_db_connection()
     fan_id = session['fan_id']
+    # 页面上的按钮会带上 op=like/unlike，此时只需一条语句；不带 op 时按原语义切换
+    op = request.args.get('op')
     
-    config = {
-        'band': ('Fan_Like_Band', 'band_id'),
-        'album': ('Fan_Like_Album', 'album_id'),
-        'song': ('Fan_Like_Song', 'song_id'),
-        'concert': ('Fan_Attend_Concert', 'concert_id')
-    }
-    
-    if type in config:
-        table, col = config[type]
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(f"SELECT * FROM {table} WHERE fan_id=%s AND {col}=%s", (fan_id, id))
-                if cursor.fetchone():
-                    cursor.execute(f"DELETE FROM {table} WHERE fan_id=%s AND {col}=%s", (fan_id, id))
-                    flash('已取消关注', 'warning')
-                else:
-                    cursor.execute(f"INSERT INTO {table} (fan_id, {col}) VALUES (%s, %s)", (fan_id, id))
-                    flash('关注成功', 'success')
-            conn.commit()
-        finally:
-            conn.close()
-            
+    if type not in LIKE_TABLES:
+        if wants_json(): return jsonify(error=f'未知类型 {type}'), 400
+        return redirect(url_for('fan_dashboard'))
+
+    # 写后缓冲开启时一律入队 (见 queue_likes)
+    if write_behind is not None:
+        if op not in LIKE_OPS:
+            op = 'unlike' if current_like_state(fan_id, type, id) else 'like'
+        queue_likes(fan_id, {type: {id: op}})
+        return like_response(type, id, op == 'like', True, queued=True)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            require_writable(cursor, 'fan', fan_id)
+            require_bands_writable(cursor, {type: {id}})
+            if op in LIKE_OPS:
+                liked, changed = op == 'like', set_like(cursor, fan_id, type, id, op)
+                # 要关注却没有插入：已经关注，或者目标不存在 (只有这时才多查一次)
+                found = changed or not liked or target_exists(cursor, type, id)
+            else:
+                liked, changed = toggle(cursor, fan_id, type, id)
+                found = liked is not None
+            stale = set()
+            if changed:
+                stale = refresh_like_stats(cursor, fan_id, {type: {id: 1 if liked else -1}})
+                recommender.mark_dirty(cursor, {type: [id]})
+        conn.commit()
+        for band_id in stale:
+            band_cache.invalidate(band_id, 'stats')
+        if changed:
+            data_versions.bump(('fan', fan_id))
+    except TargetDeleting as e:
+        conn.rollback()
+        return reject_deleting(e)
+    except Exception as e:
+        conn.rollback()
+        if wants_json(): return jsonify(error=str(e)), 500
+        flash(f'操作失败: {e}', 'danger')
+        return redirect(url_for('fan_dashboard'))
+    finally:
+        conn.close()
+    if not found:
+        if wants_json(): return jsonify(error=f'{type} #{id} 不存在'), 404
+        flash('要关注的目标不存在', 'warning')
+        return redirect(url_for('fan_dashboard'))
+    return like_response(type, id, liked, changed)
+
+def like_response(type, id, liked, changed, queued=False):
+    if wants_json():
+        return jsonify(type=type, id=id, liked=liked, changed=changed, queued=queued)
+    if liked:
+        flash('关注成功', 'success')
+    else:
+        flash('已取消关注', 'warning')
     return redirect(url_for('fan_dashboard'))
 
+@app.route('/fan/likes', methods=['POST'])
+def batch_likes():
+    """
+    批量关注 / 取关 / 报名 (JSON)。
+    请求: {"ops": [{"type": "song", "id": 3, "op": "like"}, ...]}
+    响应: {"state": {"song": {"3": true}}, "changed": 变化条数}，全部操作在一个事务中完成
+    (写后缓冲开启时只入队，changed 为请求的操作数，另带 "queued": true)
+    """
+    if session.get('role') != 'fan': return jsonify(error='请先以歌迷身份登录'), 401
+    fan_id = session['fan_id']
+    payload = request.get_json(silent=True) or {}
+    ops, errors = parse_ops(payload.get('ops'))
+    if errors:
+        return jsonify(error='请求格式错误', details=errors), 400
+    if queue_likes(fan_id, ops):
+        return jsonify(state={kind: {i: op == 'like' for i, op in targets.items()} for kind, targets in ops.items()},
+                       changed=sum(len(t) for t in ops.values()), queued=True)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            require_writable(cursor, 'fan', fan_id)
+            require_bands_writable(cursor, ops)
+            state, changes = apply_like_ops(cursor, fan_id, ops)
+            stale = refresh_like_stats(cursor, fan_id, changes)
+            recommender.mark_dirty(cursor, changes)
+        conn.commit()
+        for band_id in stale:
+            band_cache.invalidate(band_id, 'stats')
+        if any(changes.values()):
+            data_versions.bump(('fan', fan_id))
+    except TargetDeleting as e:
+        conn.rollback()
+        return reject_deleting(e)
+    except Exception as e:
+        conn.rollback()
+        return jsonify(error=str(e)), 500
+    finally:
+        conn.close()
+
+    return jsonify(state=state, changed=sum(len(c) for c in changes.values()))
+
+# ================= 7. 写后缓冲 (可选) =================
+# WRITE_BEHIND=1 时关注 / 评分先写本地日志并入队，由后台线程批量写入数据库 (见 _writebehind.py)。
+# 只适合常驻进程部署 (gunicorn 等)，日志目录 WRITE_BEHIND_DIR 要在持久化磁盘上
+def flush_interactions(likes, reviews):
+    """一个事务写入一批关注和乐评 (后台线程调用)，提交后再更新缓存和进程内数据"""
+    stale_bands = {}  # band_id -> 需要失效的缓存数据集
+    ranked = []
+    conn = db_pool.acquire()
+    try:
+        with conn.cursor() as cursor:
+            # 入队之后被删除 / 正在注销的歌迷、被删除的目标、所属乐队正在删除的目标直接丢弃
+            # (否则外键错误会让整批一直重试)
+            alive = writable_targets(cursor, 'fan', set(likes) | set(reviews))
+            targets = {kind: {i for f, ops in likes.items() if f in alive for i in ops.get(kind) or ()} for kind in LIKE_TABLES}
+            targets['album'] |= {album_id for f, albums in reviews.items() if f in alive for album_id in albums}
+            owners = target_bands(cursor, targets)
+            open_bands = writable_targets(cursor, 'band', {b for o in owners.values() for b in o.values()})
+            writable = {kind: {i for i, b in o.items() if b in open_bands} for kind, o in owners.items()}
+            ops_by_fan = {}
+            for kind in LIKE_TABLES:
+                for fan_id, ops in likes.items():
+                    kind_ops = {i: op for i, op in (ops.get(kind) or {}).items() if i in writable.get(kind, ())}
+                    if fan_id in alive and kind_ops:
+                        ops_by_fan.setdefault(fan_id, {})[kind] = kind_ops
+
+            _, changes = apply_like_batch(cursor, ops_by_fan)
+            for fan_id, fan_changes in changes.items():
+                for band_id in refresh_like_stats(cursor, fan_id, fan_changes):
+                    stale_bands.setdefault(band_id, set()).add('stats')
+                recommender.mark_dirty(cursor, fan_changes)
+
+            batch = [(fan_id, album_id, score, comment) for fan_id, albums in reviews.items() if fan_id in alive
+                     for album_id, (score, comment) in albums.items() if album_id in writable.get('album', ())]
+            review_deltas = {}  # band_id -> [新增乐评数, 总分变化]
+            for (fan_id, album_id, score, _), submitted in zip(batch, submit_reviews(cursor, batch)):
+                if submitted is None:
+                    continue  # 专辑已删除
+                delta = review_deltas.setdefault(submitted.band_id, [0, 0])
+                delta[0] += submitted.old_score is None
+                delta[1] += score - (submitted.old_score or 0)
+                leaderboard.persist_review(cursor, album_id, submitted, score)
+                recommender.mark_review(cursor, album_id, submitted, score)
+                stale_bands.setdefault(submitted.band_id, set()).update(('reviews', 'stats'))
+                ranked.append((album_id, submitted, score))
+            # 同一乐队的统计变化合并成一次更新
+            for band_id, (count, total) in sorted(review_deltas.items()):
+                band_stats.record_review(cursor, band_id, count, total)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    for band_id, datasets in stale_bands.items():
+        band_cache.invalidate(band_id, *datasets)
+    for args in ranked:
+        leaderboard.apply_review(*args)
+    if ranked:
+        data_versions.bump('ratings')
+    data_versions.bump(*[('fan', fan_id) for fan_id in set(likes) | set(reviews)])
+
+def permanent_write_error(e):
+    """逐条重试仍然失败时，数据本身有问题 (违反约束、超长、越界，或目标正在删除) 的操作重试也没用，转入死信"""
+    import pymysql
+    return isinstance(e, (pymysql.err.IntegrityError, pymysql.err.DataError, TargetDeleting))
+
+write_behind = None
+if os.environ.get('WRITE_BEHIND') == '1':
+    from _writebehind import WriteBehind
+    write_behind = WriteBehind(flush_interactions, os.environ.get('WRITE_BEHIND_DIR', os.path.join(base_dir, '../var/write-behind')),
+                               max_pending=int(os.environ.get('WRITE_BEHIND_BATCH', 200)),
+                               flush_interval=float(os.environ.get('WRITE_BEHIND_INTERVAL', 0.5)),
+                               max_queue=int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', 5000)),
+                               fsync=os.environ.get('WRITE_BEHIND_FSYNC', '1') == '1',
+                               is_permanent=permanent_write_error)
+    write_behind.start()
+    metrics.registry.gauge_collector('mygo_write_behind', 'Write-behind queue statistics', write_behind.stats)
+
+# 开启后关注 / 评分只能走队列：队列已满时也不能改为同步写入 (同一目标在队列里更早的操作稍后写入会覆盖它)，
+# 直接按数据库繁忙返回 503
+def queue_likes(fan_id, ops):
+    """写后缓冲开启时把关注操作入队 (返回 True)；未开启时返回 False，由调用方同步写入"""
+    if write_behind is None:
+        return False
+    if not write_behind.enqueue_likes(fan_id, ops):
+        raise DatabaseUnavailable('写入队列已满')
+    data_versions.bump(('fan', fan_id))
+    return True
+
+def queue_review(fan_id):
+    """同上，处理评分表单 (校验失败时提示错误，同样返回 True)"""
+    if write_behind is None:
+        return False
+    try:
+        album_id, score = parse_album_id(request.form.get('album_id')), parse_score(request.form.get('score'))
+    except ValueError as e:
+        flash(f'操作失败: {e}', 'danger')
+        return True
+    if not write_behind.enqueue_review(fan_id, album_id, score, request.form.get('comment')):
+        raise DatabaseUnavailable('写入队列已满')
+    data_versions.bump(('fan', fan_id))
+    flash('评价已提交，专辑分数稍后更新！', 'success')
+    return True
+
+def current_like_state(fan_id, kind, target_id):
+    """不带 op 的切换要知道当前状态：队列里有这个目标时以队列为准 (数据库里还是旧状态)，否则查数据库"""
+    pending = write_behind.pending_likes(fan_id).get(kind, {}).get(target_id)
+    if pending is not None:
+        return pending == 'like'
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            return is_liked(cursor, fan_id, kind, target_id)
+    finally:
+        conn.close()
+
+def overlay_pending(rows, key, ops, added_rows):
+    """把尚未写入的关注操作叠加到从数据库读出的列表上：取关的去掉，新关注的追加"""
+    if not ops:
+        return rows
+    rows = [r for r in rows if ops.get(r[key]) != 'unlike']
+    have = {r[key] for r in rows}
+    return rows + [r for r in added_rows or () if r[key] not in have]
+
+# ================= 8. 命令行维护任务 =================
+@app.cli.command('reconcile-ratings')
+def reconcile_ratings_command():
+    """全量重算所有专辑的评分累计值并输出漂移"""
+    with db_pool.connection() as conn:
+        drift = reconcile_album_aggregates(conn)
+    for d in drift:
+        print(f"album #{d['album_id']} {d['title']}: count {d['stored_count']} -> {d['actual_count']}, "
+              f"sum {d['stored_sum']} -> {d['actual_sum']}")
+    print(f"{len(drift)} album(s) corrected")
+
+@app.cli.command('rebuild-band-stats')
+@click.argument('band_ids', nargs=-1, type=int)
+def rebuild_band_stats_command(band_ids):
+    """全量重建 Band_Stat 统计 (不指定 band_id 则重建所有乐队)"""
+    with db_pool.connection() as conn:
+        count = band_stats.rebuild_band_stats(conn, list(band_ids) or None)
+    band_cache.clear()
+    print(f"rebuilt stats for {count} band(s)")
+
+@app.cli.command('rebuild-leaderboard')
+def rebuild_leaderboard_command():
+    """按 Review 重建排行榜底表 Album_Review_Day (开启 LEADERBOARD_TABLE 前执行一次)"""
+    with db_pool.connection() as conn:
+        rows = leaderboard.rebuild_table(conn)
+    print(f"rebuilt {rows} album/day row(s)")
+
+@app.cli.command('rebuild-recommendations')
+def rebuild_recommendations_command():
+    """全量重算所有物品的相似列表 (Item_Neighbor)"""
+    import pymysql
+    with db_pool.connection() as conn:
+        written = recommender.rebuild(conn, cursorclass=pymysql.cursors.SSDictCursor)
+    data_versions.bump('recommendations')
+    for kind, rows in written.items():
+        print(f"{kind}: {rows} item(s)")
+
+@app.cli.command('refresh-recommendations')
+@click.option('--limit', default=RECOMMEND_REFRESH_LIMIT, show_default=True, help='每批处理的物品数')
+def refresh_recommendations_command(limit):
+    """增量刷新所有被标记的物品 (直到没有待处理的标记)"""
+    total = 0
+    with db_pool.connection() as conn:
+        while True:
+            processed = recommender.refresh(conn, limit)
+            total += processed
+            if processed < limit:
+                break
+    print(f"refreshed {total} item(s)")
+
+@app.cli.command('import-data')
+@click.argument('name')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', help='csv / ndjson (默认按扩展名判断)')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), help='出错的行写入这个 CSV 文件 (默认输出到终端)')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='每个事务写入的行数')
+def import_data_command(name, path, fmt, errors_path, chunk_size):
+    """批量导入乐队 / 成员 / 歌迷 / 专辑 / 歌曲 (bands / members / fans / albums / songs)"""
+    import csv
+    from _import import IMPORTS, BulkImportError, detect_format, import_records, read_records
+    if name not in IMPORTS:
+        raise click.BadParameter(f"可选: {', '.join(sorted(IMPORTS))}", param_hint='NAME')
+    report = open(errors_path, 'w', newline='', encoding='utf-8') if errors_path else None
+    writer = csv.writer(report) if report else None
+    if writer:
+        writer.writerow(['line', 'error', 'row'])
+    progress = {'inserted': 0}
+    try:
+        with open(path, 'rb') as f, db_pool.connection() as conn:
+            fmt, compressed = detect_format(path, fmt)
+            for progress, failures in import_records(conn, IMPORTS[name], read_records(f, fmt, IMPORTS[name], compressed), chunk_size):
+                for failure in failures:
+                    if writer:
+                        writer.writerow([failure.line, failure.error, json.dumps(failure.record, ensure_ascii=False)])
+                    else:
+                        print(f"line {failure.line}: {failure.error}")
+                print(f"read {progress['read']}, inserted {progress['inserted']}, failed {progress['failed']}")
+    except BulkImportError as e:
+        raise click.ClickException(str(e))
+    finally:
+        if report:
+            report.close()
+        if progress['inserted']:
+            finish_import(name)
+
+@app.cli.command('run-delete-jobs')
+def run_delete_jobs_command():
+    """把进行中的分批删除任务执行完 (中断后重新执行会从记录的进度继续)"""
+    with db_pool.connection() as conn:
+        while True:
+            progressed = False
+            for before, job in delete_jobs.run_pending(conn, DELETE_JOB_BUDGET):
+                after_delete_batches(before, job)
+                progressed |= (job['step'], job['deleted']) != (before['step'], before['deleted'])
+                print(f"{job['kind']} #{job['target_id']} {job['label']}: {job['deleted']} row(s) deleted, "
+                      f"step {job['step']}, {job['status']}" + (f" ({job['error']})" if job['error'] else ''))
+            if not progressed:
+                break
+
+@app.cli.command('compile-templates')
+@click.option('--output', default=TEMPLATE_BUILD_DIR, show_default=True, help='字节码输出目录')
+def compile_templates_command(output):
+    """构建时预编译所有模板 (产物随部署发布，冷启动直接加载字节码)"""
+    names = compile_templates(app.jinja_env, output)
+    print(f"compiled {len(names)} template(s) into {os.path.abspath(output)}")
+
 if __name__ == '__main__':
     app.run(debug=True, port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
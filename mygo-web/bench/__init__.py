@@ -0,0 +1,14 @@
+"""
+本地基准测试。
+
+    python -m bench.seed --db /tmp/mygo-bench.db --scale 0.01
+    python -m bench.run --db /tmp/mygo-bench.db --sessions 16 --duration 30
+
+seed 按给定规模生成可复现的测试数据 (SQLite，或 DB_* 环境变量指向的 MySQL/TiDB)，
+run 用并发会话直接驱动 Flask 路由，输出 p50/p95/p99、吞吐和每请求查询数，
+结果按提交保存在 bench/results/，并与上一次相同配置的结果对比。
+
+    python -m bench.startup --db /tmp/mygo-bench.db --runs 5
+
+startup 每次起新进程，测量冷实例的首字节时间和热实例的响应时间 (按模板缓存方式分组对比)。
+"""
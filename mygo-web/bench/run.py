@@ -0,0 +1,300 @@
+"""
+并发压测：直接驱动 Flask 路由 (不经过网络)，统计延迟分位数、吞吐和每请求查询数。
+
+    python -m bench.run --db /tmp/mygo-bench.db --sessions 16 --duration 30
+    python -m bench.run --backend mysql --sessions 8 --duration 60
+
+每个会话是一个独立的 test_client (带自己的登录 session)，按 --mix 分配角色：
+- fan:   GET /fan、toggle_like (JSON)、POST /fan action=rate
+- band:  GET /band
+- admin: GET /admin
+设置 WRITE_BEHIND=1 (及 WRITE_BEHIND_DIR) 可以对比写后缓冲模式，压测结束时把队列写完。
+结果写入 bench/results/<时间>-<提交>.json，并与上一份相同配置的结果对比。
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# 场景权重 (同一角色内按权重随机选择)
+FAN_SCENARIOS = (('GET /fan', 5), ('toggle_like', 3), ('POST rate', 2))
+
+
+def percentile(sorted_values, p):
+    """最近秩法分位数"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        mix[role.strip()] = int(weight or 1)
+    unknown = set(mix) - {'fan', 'band', 'admin'}
+    if unknown:
+        raise SystemExit(f'未知角色: {", ".join(sorted(unknown))}')
+    return mix
+
+
+def assign_roles(mix, sessions):
+    """按比例把会话分给各角色 (最大余数法)，每个角色至少一个会话"""
+    roles = [role for role, weight in mix.items() if weight > 0]
+    if sessions < len(roles):
+        raise SystemExit(f'--sessions 至少要有 {len(roles)} 个 (每个角色一个会话)')
+    total = sum(mix[role] for role in roles)
+    shares = {role: sessions * mix[role] / total for role in roles}
+    allotted = {role: max(1, int(shares[role])) for role in roles}
+    by_remainder = sorted(roles, key=lambda role: (round(shares[role] % 1, 6), mix[role]), reverse=True)
+    for role in by_remainder[:max(0, sessions - sum(allotted.values()))]:
+        allotted[role] += 1
+    # 保底的会话从分得最多的角色里扣回来
+    while sum(allotted.values()) > sessions:
+        allotted[max(roles, key=allotted.get)] -= 1
+    return [role for role in roles for _ in range(allotted[role])]
+
+
+def git_revision():
+    try:
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCH_DIR, text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return sha, dirty
+
+
+class Session:
+    """一个模拟用户：独立的 test_client，按角色循环发请求"""
+
+    def __init__(self, app, role, rng, counts):
+        self.role = role
+        self.rng = rng
+        self.counts = counts
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['role'] = role
+            if role == 'fan':
+                sess['fan_id'] = rng.randint(1, counts['fans'])
+                sess['fan_name'] = f"fan-{sess['fan_id']}"
+            elif role == 'band':
+                sess['band_id'] = rng.randint(1, counts['bands'])
+                sess['band_name'] = f"band-{sess['band_id']}"
+            else:
+                sess['user_name'] = 'Administrator'
+
+    def step(self):
+        """发一个请求，返回 (场景名, 响应)"""
+        rng = self.rng
+        if self.role == 'band':
+            return 'GET /band', self.client.get('/band')
+        if self.role == 'admin':
+            return 'GET /admin', self.client.get('/admin')
+        scenario = rng.choices([s for s, _ in FAN_SCENARIOS], [w for _, w in FAN_SCENARIOS])[0]
+        if scenario == 'GET /fan':
+            return scenario, self.client.get('/fan')
+        if scenario == 'toggle_like':
+            # 和页面上的按钮一样带上 op (写后缓冲模式下可以直接入队)
+            song_id = rng.randint(1, self.counts['songs'])
+            op = rng.choice(('like', 'unlike'))
+            return scenario, self.client.get(f'/fan/toggle_like/song/{song_id}?op={op}&format=json')
+        album_id = rng.randint(1, self.counts['albums'])
+        return scenario, self.client.post('/fan', data={
+            'action': 'rate', 'album_id': album_id, 'score': rng.randint(0, 100) / 10, 'comment': 'bench'})
+
+
+def load_app(args):
+    """导入应用并把连接池指向压测数据库"""
+    os.environ.setdefault('DB_POOL_PREWARM', '0')
+    sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'api'))
+    import index
+    from _db import ConnectionPool
+    if args.backend == 'sqlite':
+        import bench.sqlite_db as sqlite_db
+        connect = sqlite_db.connector(args.db)
+    else:
+        from _db import connect_tidb as connect
+    # 路由通过模块全局变量取连接池，替换后所有请求都走新池
+    index.db_pool = ConnectionPool(connect, min_size=1, max_size=args.pool_size or max(10, args.sessions),
+                                   timeout=30, cursor_wrapper=index.metrics.InstrumentedCursor)
+    index.leaderboard.pool = index.db_pool
+    index.search_index.pool = index.db_pool
+    index.recommender.pool = index.db_pool
+    index.app.testing = True
+    return index
+
+
+def table_counts(index):
+    """从库里读出各表规模 (seed 生成的主键连续，压测时在 1..N 里挑 id)"""
+    counts = {}
+    conn = index.db_pool.acquire()
+    try:
+        with conn.cursor() as cursor:
+            for key, table in (('bands', 'Band'), ('fans', 'Fan'), ('albums', 'Album'), ('songs', 'Song')):
+                cursor.execute(f"SELECT COUNT(*) AS n FROM {table}")
+                counts[key] = cursor.fetchone()['n']
+    finally:
+        conn.close()
+    if not all(counts.values()):
+        raise SystemExit(f'压测库为空，请先运行 python -m bench.seed ({counts})')
+    return counts
+
+
+def run_load(index, args, counts):
+    """并发执行，返回 ({场景: [(延迟秒, 查询数, 状态码)]}, 实际持续秒数)"""
+    from flask import g, request_finished
+
+    local = threading.local()
+
+    # 测试客户端在调用线程里同步处理请求，请求结束时把本次查询数记到线程局部变量
+    @request_finished.connect_via(index.app)
+    def remember_round_trips(sender, response, **extra):
+        stats = g.get('request_metrics')
+        local.round_trips = stats.round_trips if stats is not None else 0
+
+    roles = assign_roles(parse_mix(args.mix), args.sessions)
+    master = random.Random(args.seed)
+    sessions = [Session(index.app, role, random.Random(master.random()), counts) for role in roles]
+
+    samples = {}
+    lock = threading.Lock()
+    stop_at = [0.0]
+    measuring = threading.Event()
+
+    def worker(session):
+        mine = {}
+        while time.perf_counter() < stop_at[0]:
+            start = time.perf_counter()
+            scenario, resp = session.step()
+            elapsed = time.perf_counter() - start
+            if measuring.is_set():
+                mine.setdefault(scenario, []).append((elapsed, getattr(local, 'round_trips', 0), resp.status_code))
+        with lock:
+            for scenario, values in mine.items():
+                samples.setdefault(scenario, []).extend(values)
+
+    start = time.perf_counter()
+    stop_at[0] = start + args.warmup + args.duration
+    threads = [threading.Thread(target=worker, args=(s,), daemon=True) for s in sessions]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    measuring.set()
+    measured_from = time.perf_counter()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - measured_from
+
+
+def summarize(samples, wall):
+    def describe(values):
+        latencies = sorted(v[0] for v in values)
+        return {
+            'requests': len(values),
+            'errors': sum(1 for v in values if v[2] >= 500),
+            'throughput': len(values) / wall if wall else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'queries_per_request': sum(v[1] for v in values) / len(values) if values else 0.0,
+        }
+    scenarios = {name: describe(values) for name, values in sorted(samples.items())}
+    total = describe([v for values in samples.values() for v in values])
+    return scenarios, total
+
+
+def print_report(result, previous=None):
+    cols = ('requests', 'errors', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+    print(f"\n{'场景':<14}" + ''.join(f'{c:>20}' for c in cols))
+    rows = list(result['scenarios'].items()) + [('TOTAL', result['total'])]
+    for name, stats in rows:
+        line = f'{name:<14}'
+        for c in cols:
+            cell = f'{stats[c]:.1f}' if isinstance(stats[c], float) else str(stats[c])
+            if previous is not None and c != 'errors':
+                old = (previous['scenarios'].get(name) if name != 'TOTAL' else previous['total']) or {}
+                if old.get(c):
+                    cell += f' ({(stats[c] - old[c]) / old[c] * 100:+.0f}%)'
+            line += f'{cell:>20}'
+        print(line)
+    if previous is not None:
+        print(f"\n对比基线: {previous['commit']} ({previous['timestamp']})")
+
+
+def find_previous(result, results_dir):
+    """最近一份配置相同、提交不同的结果"""
+    if not os.path.isdir(results_dir):
+        return None
+    for name in sorted(os.listdir(results_dir), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(results_dir, name), encoding='utf-8') as f:
+            candidate = json.load(f)
+        if candidate.get('config') == result['config'] and candidate.get('commit') != result['commit']:
+            return candidate
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='并发压测 Flask 路由')
+    parser.add_argument('--backend', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--db', default='/tmp/mygo-bench.db', help='SQLite 文件路径 (先用 bench.seed 生成)')
+    parser.add_argument('--sessions', type=int, default=16, help='并发会话数')
+    parser.add_argument('--duration', type=float, default=30, help='计入统计的秒数')
+    parser.add_argument('--warmup', type=float, default=3, help='预热秒数 (不计入统计)')
+    parser.add_argument('--mix', default='fan=6,band=3,admin=1', help='各角色会话的比例')
+    parser.add_argument('--pool-size', type=int, help='连接池上限，默认 max(10, sessions)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', default='', help='附加在结果里的说明')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--baseline', help='指定对比的结果文件 (默认取上一份相同配置的结果)')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args(argv)
+
+    index = load_app(args)
+    counts = table_counts(index)
+    print(f"数据规模: {counts}，{args.sessions} 个会话 ({args.mix})，预热 {args.warmup}s + 统计 {args.duration}s")
+    samples, wall = run_load(index, args, counts)
+    if index.write_behind is not None:
+        index.write_behind.close()
+        print(f'写后缓冲: {index.write_behind.stats()}')
+    scenarios, total = summarize(samples, wall)
+
+    commit, dirty = git_revision()
+    result = {
+        'commit': commit + ('-dirty' if dirty else ''),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'label': args.label,
+        'config': {'backend': args.backend, 'counts': counts, 'sessions': args.sessions,
+                   'duration': args.duration, 'mix': args.mix, 'seed': args.seed},
+        'scenarios': scenarios,
+        'total': total,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            previous = json.load(f)
+    else:
+        previous = find_previous(result, args.results_dir)
+    print_report(result, previous)
+
+    if not args.no_save:
+        os.makedirs(args.results_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(args.results_dir, f"{stamp}-{result['commit']}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f'结果已保存: {path}')
+
+
+if __name__ == '__main__':
+    main()
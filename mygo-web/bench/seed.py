@@ -0,0 +1,183 @@
+"""
+生成可复现的基准测试数据。
+
+    python -m bench.seed --db /tmp/mygo-bench.db --scale 0.01
+    python -m bench.seed --backend mysql --scale 0.1 --reset   # 使用 DB_* 环境变量指向的库
+
+--scale 1 对应 1k 乐队 / 500k 歌迷 / 5M 乐评 / 2M 关注，也可以用 --bands 等参数单独指定。
+同一个 --seed 总是生成同样的数据；主键从 1 连续编号，压测脚本据此直接挑选 id。
+数据写完后用应用自己的 reconcile_album_aggregates / rebuild_band_stats / rebuild_table 生成聚合列和统计表，
+再用 Recommender.rebuild 生成推荐用的相似表。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'api'))
+
+from _ratings import reconcile_album_aggregates
+import _band_stats as band_stats
+from _leaderboard import Leaderboard
+from _recommend import Recommender
+
+FULL_SCALE = {'bands': 1000, 'fans': 500_000, 'reviews': 5_000_000, 'likes': 2_000_000}
+# 每支乐队的成员 / 专辑 / 演唱会数，每张专辑的歌曲数
+MEMBERS_PER_BAND = 5
+ALBUMS_PER_BAND = 8
+SONGS_PER_ALBUM = 10
+CONCERTS_PER_BAND = 6
+# 关注总数在四张关系表之间的分配
+LIKE_SHARES = (('Fan_Like_Song', 'song_id', 0.5), ('Fan_Like_Album', 'album_id', 0.2),
+               ('Fan_Like_Band', 'band_id', 0.2), ('Fan_Attend_Concert', 'concert_id', 0.1))
+
+GENDERS = ('女', '男', '女', '')
+EDUCATIONS = ('高中', '本科', '本科', '硕士', '博士', '')
+OCCUPATIONS = ('学生', '工程师', '设计师', '教师', '自由职业')
+ROLES = ('主唱', '吉他', '贝斯', '鼓', '键盘')
+CHUNK = 5000
+# 删除顺序 (先子表后父表)
+TABLES = ('Delete_Job', 'Item_Neighbor_Dirty', 'Item_Neighbor', 'Album_Review_Day', 'Band_Stat', 'Fan_Attend_Concert', 'Fan_Like_Song', 'Fan_Like_Album', 'Fan_Like_Band', 'Review',
+          'Song', 'Concert', 'Album', 'Member', 'Fan', 'Band')
+
+
+def scale_counts(scale, **overrides):
+    counts = {k: max(1, int(v * scale)) for k, v in FULL_SCALE.items()}
+    counts.update({k: v for k, v in overrides.items() if v is not None})
+    counts['albums'] = counts['bands'] * ALBUMS_PER_BAND
+    counts['songs'] = counts['albums'] * SONGS_PER_ALBUM
+    counts['concerts'] = counts['bands'] * CONCERTS_PER_BAND
+    return counts
+
+
+def _insert(conn, sql, rows, label):
+    """分块 executemany，每块一个事务"""
+    start, total, chunk = time.perf_counter(), 0, []
+    with conn.cursor() as cursor:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK:
+                cursor.executemany(sql, chunk)
+                conn.commit()
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            cursor.executemany(sql, chunk)
+            conn.commit()
+            total += len(chunk)
+    print(f'  {label:<20} {total:>10} 行  {time.perf_counter() - start:6.1f}s')
+
+
+def _per_fan_samples(rng, fans, targets, total):
+    """把 total 条 (fan_id, target_id) 分给各歌迷，同一歌迷不重复；目标 id 从 1..targets 中抽取"""
+    base, extra = divmod(total, fans)
+    for fan_id in range(1, fans + 1):
+        n = min(targets, base + (1 if fan_id <= extra else 0))
+        for target_id in rng.sample(range(1, targets + 1), n):
+            yield fan_id, target_id
+
+
+def seed(conn, counts, seed=42):
+    rng = random.Random(seed)
+    bands, fans = counts['bands'], counts['fans']
+    print(f"生成数据: {counts}")
+
+    _insert(conn, "INSERT INTO Band (band_id, name, leader_name, founding_date, password, intro, netease_url) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            ((i, f'band-{i}', f'leader-{i}', f'20{rng.randint(0, 24):02d}-01-01', 'pw', f'乐队 {i} 的简介', '') for i in range(1, bands + 1)),
+            'Band')
+    _insert(conn, "INSERT INTO Member (member_id, name, role, gender, join_date, band_id) VALUES (%s, %s, %s, %s, %s, %s)",
+            ((i, f'member-{i}', ROLES[i % len(ROLES)], rng.choice(GENDERS), '2020-01-01', (i - 1) // MEMBERS_PER_BAND + 1)
+             for i in range(1, bands * MEMBERS_PER_BAND + 1)),
+            'Member')
+    _insert(conn, "INSERT INTO Fan (fan_id, name, password, age, gender, occupation, education) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            ((i, f'fan-{i}', 'pw', rng.randint(12, 60), rng.choice(GENDERS), rng.choice(OCCUPATIONS), rng.choice(EDUCATIONS))
+             for i in range(1, fans + 1)),
+            'Fan')
+    _insert(conn, "INSERT INTO Album (album_id, title, release_date, album_intro, band_id, avg_score) VALUES (%s, %s, %s, %s, %s, NULL)",
+            ((i, f'album-{i}', f'20{rng.randint(10, 25)}-06-01', '', (i - 1) // ALBUMS_PER_BAND + 1)
+             for i in range(1, counts['albums'] + 1)),
+            'Album')
+    _insert(conn, "INSERT INTO Song (song_id, title, authors, album_id, netease_url) VALUES (%s, %s, %s, %s, %s)",
+            ((i, f'song-{i}', 'authors', (i - 1) // SONGS_PER_ALBUM + 1, '') for i in range(1, counts['songs'] + 1)),
+            'Song')
+    _insert(conn, "INSERT INTO Concert (concert_id, name, hold_time, location, band_id) VALUES (%s, %s, %s, %s, %s)",
+            ((i, f'concert-{i}', '2025-08-01 19:00:00', 'Tokyo', (i - 1) // CONCERTS_PER_BAND + 1)
+             for i in range(1, counts['concerts'] + 1)),
+            'Concert')
+    _insert(conn, "INSERT INTO Review (fan_id, album_id, score, comment, review_time) VALUES (%s, %s, %s, %s, NOW())",
+            ((fan_id, album_id, rng.randint(0, 100) / 10, '') for fan_id, album_id in
+             _per_fan_samples(rng, fans, counts['albums'], counts['reviews'])),
+            'Review')
+    targets = {'song_id': counts['songs'], 'album_id': counts['albums'], 'band_id': bands, 'concert_id': counts['concerts']}
+    for table, column, share in LIKE_SHARES:
+        _insert(conn, f"INSERT INTO {table} (fan_id, {column}) VALUES (%s, %s)",
+                _per_fan_samples(rng, fans, targets[column], int(counts['likes'] * share)),
+                table)
+
+    start = time.perf_counter()
+    reconcile_album_aggregates(conn)
+    band_stats.rebuild_band_stats(conn)
+    Leaderboard(None).rebuild_table(conn)
+    print(f'  {"聚合列 / Band_Stat":<20} {"":>10}     {time.perf_counter() - start:6.1f}s')
+
+    start = time.perf_counter()
+    written = Recommender(None).rebuild(conn)
+    print(f'  {"Item_Neighbor":<20} {sum(written.values()):>10} 行  {time.perf_counter() - start:6.1f}s')
+
+
+def reset(conn):
+    with conn.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f"DELETE FROM {table}")
+    conn.commit()
+
+
+def open_database(args):
+    """返回 (建连函数, 说明)；SQLite 模式下会重新建库"""
+    if args.backend == 'mysql':
+        from _db import connect_tidb, setup_session
+        def connect():
+            raw = connect_tidb()
+            setup_session(raw)
+            return raw
+        return connect, f"mysql://{os.environ.get('DB_HOST')}/{os.environ.get('DB_NAME')}"
+    import bench.sqlite_db as sqlite_db
+    return sqlite_db.connector(args.db), f'sqlite://{args.db}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成基准测试数据')
+    parser.add_argument('--backend', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--db', default='/tmp/mygo-bench.db', help='SQLite 文件路径')
+    parser.add_argument('--scale', type=float, default=0.01, help='相对 1k 乐队 / 500k 歌迷 / 5M 乐评 / 2M 关注的比例')
+    parser.add_argument('--bands', type=int)
+    parser.add_argument('--fans', type=int)
+    parser.add_argument('--reviews', type=int)
+    parser.add_argument('--likes', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='MySQL 模式下先清空各表')
+    args = parser.parse_args(argv)
+
+    if args.backend == 'sqlite':
+        import bench.sqlite_db as sqlite_db
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        sqlite_db.create_schema(args.db)
+
+    connect, target = open_database(args)
+    counts = scale_counts(args.scale, bands=args.bands, fans=args.fans, reviews=args.reviews, likes=args.likes)
+    conn = connect()
+    try:
+        if args.reset:
+            reset(conn)
+        seed(conn, counts, args.seed)
+    finally:
+        conn.close()
+    print(f'✅ 已写入 {target}')
+
+
+if __name__ == '__main__':
+    main()
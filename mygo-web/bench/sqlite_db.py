@@ -0,0 +1,186 @@
+"""
+SQLite 替身数据库：提供与 pymysql (DictCursor) 相同的 connection / cursor 接口。
+
+应用里的 SQL 按 MySQL 书写，这里做最小的语法转换：
+INSERT IGNORE、ON DUPLICATE KEY UPDATE / VALUES()、NOW()、GREATEST / LEAST、
+FOR UPDATE、CURRENT_DATE - INTERVAL n DAY、%s 占位符；SET 会话变量语句忽略。
+出错时抛出对应的 pymysql.err 异常 (IntegrityError / OperationalError 等)，调用方按线上的异常类型处理。
+SQLite 只有库级写锁：事务里第一条写语句或 FOR UPDATE 查询会先 BEGIN IMMEDIATE 拿写锁，
+避免并发事务从读升级为写时直接报 database is locked。
+只用于基准测试和本地排查，结果用于同一台机器上不同提交之间的相对比较。
+"""
+import os
+import re
+import sqlite3
+from decimal import Decimal
+
+import pymysql
+
+sqlite3.register_adapter(Decimal, float)
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql')
+
+# 路由用到的基础表 (线上库由 TiDB 控制台建表，这里按应用的读写方式还原)
+BASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Band (band_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, leader_name TEXT, founding_date TEXT, password TEXT, intro TEXT, netease_url TEXT);
+CREATE TABLE IF NOT EXISTS Fan (fan_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, password TEXT, age INTEGER, gender TEXT, occupation TEXT, education TEXT);
+CREATE TABLE IF NOT EXISTS Member (member_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, role TEXT, gender TEXT, join_date TEXT, band_id INTEGER REFERENCES Band(band_id) ON DELETE CASCADE);
+CREATE TABLE IF NOT EXISTS Album (album_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, release_date TEXT, album_intro TEXT, band_id INTEGER REFERENCES Band(band_id) ON DELETE CASCADE, avg_score REAL);
+CREATE TABLE IF NOT EXISTS Song (song_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, authors TEXT, album_id INTEGER REFERENCES Album(album_id) ON DELETE CASCADE, netease_url TEXT);
+CREATE TABLE IF NOT EXISTS Review (fan_id INTEGER REFERENCES Fan(fan_id) ON DELETE CASCADE, album_id INTEGER REFERENCES Album(album_id) ON DELETE CASCADE, score REAL, comment TEXT, review_time TEXT, PRIMARY KEY (fan_id, album_id));
+CREATE TABLE IF NOT EXISTS Concert (concert_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, hold_time TEXT, location TEXT, band_id INTEGER REFERENCES Band(band_id) ON DELETE CASCADE);
+CREATE TABLE IF NOT EXISTS Fan_Like_Band (fan_id INTEGER REFERENCES Fan(fan_id) ON DELETE CASCADE, band_id INTEGER REFERENCES Band(band_id) ON DELETE CASCADE, PRIMARY KEY (fan_id, band_id));
+CREATE TABLE IF NOT EXISTS Fan_Like_Album (fan_id INTEGER REFERENCES Fan(fan_id) ON DELETE CASCADE, album_id INTEGER REFERENCES Album(album_id) ON DELETE CASCADE, PRIMARY KEY (fan_id, album_id));
+CREATE TABLE IF NOT EXISTS Fan_Like_Song (fan_id INTEGER REFERENCES Fan(fan_id) ON DELETE CASCADE, song_id INTEGER REFERENCES Song(song_id) ON DELETE CASCADE, PRIMARY KEY (fan_id, song_id));
+CREATE TABLE IF NOT EXISTS Fan_Attend_Concert (fan_id INTEGER REFERENCES Fan(fan_id) ON DELETE CASCADE, concert_id INTEGER REFERENCES Concert(concert_id) ON DELETE CASCADE, PRIMARY KEY (fan_id, concert_id));
+CREATE INDEX IF NOT EXISTS idx_member_band ON Member (band_id);
+CREATE INDEX IF NOT EXISTS idx_album_band ON Album (band_id);
+CREATE INDEX IF NOT EXISTS idx_song_album ON Song (album_id);
+CREATE INDEX IF NOT EXISTS idx_review_album ON Review (album_id);
+CREATE INDEX IF NOT EXISTS idx_concert_band ON Concert (band_id);
+CREATE INDEX IF NOT EXISTS idx_like_band ON Fan_Like_Band (band_id);
+CREATE INDEX IF NOT EXISTS idx_like_album ON Fan_Like_Album (album_id);
+CREATE INDEX IF NOT EXISTS idx_like_song ON Fan_Like_Song (song_id);
+CREATE INDEX IF NOT EXISTS idx_attend_concert ON Fan_Attend_Concert (concert_id);
+"""
+
+_REWRITES = [
+    (re.compile(r'INSERT\s+IGNORE', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r'\bNOW\(\)', re.I), "datetime('now')"),
+    (re.compile(r'\bFOR\s+UPDATE\b', re.I), ''),
+    (re.compile(r'\bFROM\s+DUAL\b', re.I), ''),
+    (re.compile(r'ON\s+DUPLICATE\s+KEY\s+UPDATE', re.I), 'ON CONFLICT DO UPDATE SET'),
+    (re.compile(r'\bVALUES\((\w+)\)', re.I), r'excluded.\1'),
+    (re.compile(r'\bGREATEST\(', re.I), 'MAX('),
+    (re.compile(r'\bLEAST\(', re.I), 'MIN('),
+    (re.compile(r'\bCURRENT_DATE\s*-\s*INTERVAL\s+(\d+)\s+DAY\b', re.I), r"date('now', '-\1 day')"),
+]
+_SET_RE = re.compile(r'\s*SET\s', re.I)
+_LOCKING_RE = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b|\bFOR\s+UPDATE\b', re.I)
+
+
+def translate_error(e):
+    """sqlite3 异常 -> 同名的 pymysql.err 异常 (两边都按 DB-API 分类)"""
+    cls = getattr(pymysql.err, type(e).__name__, pymysql.err.DatabaseError)
+    return cls(str(e))
+
+
+def translate(sql):
+    """MySQL 语句 -> SQLite 语句；会话设置类语句返回 None (不执行)"""
+    if _SET_RE.match(sql):
+        return None
+    for rx, rep in _REWRITES:
+        sql = rx.sub(rep, sql)
+    return sql.replace('%%', '\0').replace('%s', '?').replace('\0', '%')
+
+
+class Cursor:
+    """pymysql DictCursor 的子集：execute / executemany / fetch* / rowcount / lastrowid"""
+
+    def __init__(self, db):
+        self._db = db
+        self._cur = db.cursor()
+        self.rowcount = -1
+        self.lastrowid = None
+        self.description = None
+
+    def _begin(self, query):
+        if not self._db.in_transaction and _LOCKING_RE.search(query):
+            self._db.execute('BEGIN IMMEDIATE')
+
+    def execute(self, query, args=None):
+        sql = translate(query)
+        if sql is None:
+            self.rowcount = 0
+            return 0
+        self._begin(query)
+        if args is not None and not isinstance(args, (list, tuple, dict)):
+            args = (args,)
+        try:
+            self._cur.execute(sql, args or ())
+        except sqlite3.Error as e:
+            raise translate_error(e) from e
+        self.rowcount = self._cur.rowcount
+        self.lastrowid = self._cur.lastrowid
+        self.description = self._cur.description
+        return self.rowcount
+
+    def executemany(self, query, args):
+        self._begin(query)
+        try:
+            self._cur.executemany(translate(query), [tuple(a) for a in args])
+        except sqlite3.Error as e:
+            raise translate_error(e) from e
+        self.rowcount = self._cur.rowcount
+        return self.rowcount
+
+    def _row(self, row):
+        if row is None:
+            return None
+        return {d[0]: v for d, v in zip(self._cur.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchmany(self, size=1000):
+        return [self._row(r) for r in self._cur.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Connection:
+    """pymysql Connection 的子集；多线程借用由连接池保证同一时刻只有一个使用者"""
+
+    def __init__(self, path):
+        # 事务由 Cursor 显式开启 (见 _begin)，不用 sqlite3 模块的隐式 BEGIN
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self.open = True
+
+    def cursor(self, cursorclass=None):
+        return Cursor(self._db)
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def ping(self, reconnect=False):
+        self._db.execute('SELECT 1')
+
+    def close(self):
+        self._db.close()
+        self.open = False
+
+
+def connector(path):
+    """给 ConnectionPool 用的建连函数"""
+    return lambda: Connection(path)
+
+
+def create_schema(path):
+    """建基础表并按顺序执行 sql/ 下的迁移"""
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA journal_mode = WAL')  # 读写并发时读者不被写者阻塞
+    db.executescript(BASE_SCHEMA)
+    for name in sorted(os.listdir(SQL_DIR)):
+        if name.endswith('.sql'):
+            with open(os.path.join(SQL_DIR, name), encoding='utf-8') as f:
+                db.executescript(translate(f.read()))
+    db.commit()
+    db.close()
@@ -0,0 +1,147 @@
+"""
+冷启动基准：每次起一个新的 Python 进程，测量从进程启动到第一个响应的时间 (TTFB)，
+以及同一进程里后续请求的耗时 (热实例)。
+
+    python -m bench.startup --db /tmp/mygo-bench.db --runs 5
+
+按模板缓存方式分三组对比:
+- nocache:  不用字节码缓存，每个冷实例都重新编译模板
+- runtime:  本机缓存目录已经有字节码 (同机其他进程 / 上一个实例编译过)
+- prebuilt: flask compile-templates 的构建产物 (Vercel 上冷实例的情况)
+本地没有 TLS 握手，数据库连接的耗时不计入 (SQLite)；TiDB 上冷实例还要再加一次握手。
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+
+# 场景 -> (路径, 登录角色)
+SCENARIOS = {
+    'GET /': ('/', None),
+    'GET /fan': ('/fan', 'fan'),
+    'GET /band': ('/band', 'band'),
+    'GET /admin': ('/admin', 'admin'),
+}
+MODES = ('nocache', 'runtime', 'prebuilt')
+
+
+def child(args):
+    """在新进程里执行：导入应用，发第一个请求，再发若干个热请求，输出 JSON"""
+    started = time.time()
+    t0 = time.perf_counter()
+    from bench.run import load_app
+    index = load_app(argparse.Namespace(backend=args.backend, db=args.db, pool_size=None, sessions=1))
+    imported = time.perf_counter()
+
+    path, role = SCENARIOS[args.scenario]
+    client = index.app.test_client()
+    if role:
+        with client.session_transaction() as sess:
+            sess['role'] = role
+            sess.update({'fan': {'fan_id': 1, 'fan_name': 'fan-1'},
+                         'band': {'band_id': 1, 'band_name': 'band-1'},
+                         'admin': {'user_name': 'Administrator'}}[role])
+    resp = client.get(path)
+    resp.get_data()
+    first = time.perf_counter()
+    warm = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        client.get(path).get_data()
+        warm.append(time.perf_counter() - start)
+    print(json.dumps({
+        'status': resp.status_code,
+        'interpreter_ms': (started - args.spawned) * 1000,
+        'import_ms': (imported - t0) * 1000,
+        'first_ms': (first - imported) * 1000,
+        'ttfb_ms': (started - args.spawned) * 1000 + (first - t0) * 1000,
+        'warm_ms': statistics.median(warm) * 1000 if warm else 0.0,
+        'templates': index.template_cache.stats(),
+    }))
+
+
+def spawn(args, scenario, env):
+    cmd = [sys.executable, '-m', 'bench.startup', '--child', '--scenario', scenario, '--backend', args.backend,
+           '--db', args.db, '--requests', str(args.requests), '--spawned', repr(time.time())]
+    out = subprocess.run(cmd, cwd=APP_DIR, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f'子进程失败 ({scenario}):\n{out.stderr}')
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def mode_env(mode, workdir):
+    env = dict(os.environ, DB_POOL_PREWARM='0')
+    env['JINJA_PREBUILT_DIR'] = os.path.join(workdir, 'prebuilt') if mode == 'prebuilt' else os.path.join(workdir, 'none')
+    env['JINJA_CACHE_DIR'] = os.path.join(workdir, 'runtime') if mode == 'runtime' else '0'
+    return env
+
+
+def prepare(mode, args, workdir, env):
+    """runtime: 先跑一遍填充本机缓存目录；prebuilt: 执行构建命令"""
+    if mode == 'runtime':
+        for scenario in args.scenarios:
+            spawn(args, scenario, env)
+    elif mode == 'prebuilt':
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'api/index.py', 'compile-templates',
+                        '--output', env['JINJA_PREBUILT_DIR']], cwd=APP_DIR, env=env, check=True,
+                       capture_output=True)
+
+
+def print_report(results):
+    cols = ('ttfb_ms', 'interpreter_ms', 'import_ms', 'first_ms', 'warm_ms')
+    print(f"\n{'场景':<14}{'模式':<10}" + ''.join(f'{c:>16}' for c in cols))
+    for scenario, modes in results.items():
+        for mode, runs in modes.items():
+            line = f'{scenario:<14}{mode:<10}'
+            for c in cols:
+                line += f'{statistics.median(r[c] for r in runs):>16.1f}'
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='冷启动 / 热实例响应时间')
+    parser.add_argument('--backend', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--db', default='/tmp/mygo-bench.db', help='SQLite 文件路径 (先用 bench.seed 生成)')
+    parser.add_argument('--runs', type=int, default=5, help='每组冷启动次数 (取中位数)')
+    parser.add_argument('--requests', type=int, default=20, help='每个进程里的热请求数')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='逗号分隔，可选: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--spawned', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return child(args)
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f'未知的场景: {unknown}')
+    workdir = tempfile.mkdtemp(prefix='mygo-startup-')
+    results = {scenario: {} for scenario in args.scenarios}
+    try:
+        for mode in args.modes.split(','):
+            env = mode_env(mode, workdir)
+            prepare(mode, args, workdir, env)
+            for scenario in args.scenarios:
+                runs = [spawn(args, scenario, env) for _ in range(args.runs)]
+                bad = [r['status'] for r in runs if r['status'] >= 500]
+                if bad:
+                    raise SystemExit(f'{scenario} ({mode}) 返回 {bad}')
+                results[scenario][mode] = runs
+            print(f'{mode}: 模板缓存 {runs[-1]["templates"]}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+-- 专辑评分的增量聚合列 (替代每次提交乐评都 AVG() 全量重算)
+-- avg_score 仍然保留，供排行榜和模板直接读取
+
+ALTER TABLE Album ADD COLUMN review_count INT NOT NULL DEFAULT 0;
+ALTER TABLE Album ADD COLUMN score_sum DECIMAL(12, 1) NOT NULL DEFAULT 0;
+
+-- 用现有乐评回填一次 (之后由应用增量维护，管理员可随时触发对账)
+UPDATE Album
+SET review_count = (SELECT COUNT(*) FROM Review r WHERE r.album_id = Album.album_id),
+    score_sum = (SELECT IFNULL(SUM(r.score), 0) FROM Review r WHERE r.album_id = Album.album_id),
+    avg_score = (SELECT AVG(r.score) FROM Review r WHERE r.album_id = Album.album_id);
@@ -0,0 +1,20 @@
+-- 通用的乐队统计汇总表 (替代按乐队手写的 view_xxx_fan_stats / song_stats / concert_stats 视图)
+-- 关注、报名、乐评变化时由应用增量维护；flask rebuild-band-stats 可全量重建
+--
+-- dim      含义                     bucket              cnt        total
+-- fans     粉丝总数                 ''                  人数       -
+-- age      年龄段分布               '<18' / '18-24' ... 人数       年龄之和
+-- gender   性别分布                 Fan.gender          人数       -
+-- education 学历分布                Fan.education       人数       -
+-- song     单曲收藏数               song_id             收藏数     -
+-- concert  演唱会报名数             concert_id          报名数     -
+-- review   乐评                     ''                  乐评数     评分之和
+
+CREATE TABLE IF NOT EXISTS Band_Stat (
+    band_id INT NOT NULL,
+    dim VARCHAR(16) NOT NULL,
+    bucket VARCHAR(64) NOT NULL DEFAULT '',
+    cnt INT NOT NULL DEFAULT 0,
+    total DECIMAL(14, 1) NOT NULL DEFAULT 0,
+    PRIMARY KEY (band_id, dim, bucket)
+);
@@ -0,0 +1,4 @@
+-- 键集分页用到的索引
+-- Song / Band / Fan 按主键翻页，不需要额外索引；
+-- 评分表单的专辑查找按 (title, album_id) 排序并做标题前缀匹配
+CREATE INDEX idx_album_title ON Album (title);
@@ -0,0 +1,22 @@
+-- 专辑排行榜的共享底表 (可选，设置 LEADERBOARD_TABLE=1 后由应用维护)
+-- 按 (专辑, 日期) 记录乐评数与评分之和；各实例冷启动时只需读最近 N 天的汇总行，
+-- 不用再扫描 Review 做 GROUP BY，并据此定期刷新进程内的排行榜
+-- 乐评被覆盖时记在新的日期下 (旧日期扣回)，与 Review.review_time 保持一致
+
+CREATE TABLE IF NOT EXISTS Album_Review_Day (
+    album_id INT NOT NULL,
+    day DATE NOT NULL,
+    cnt INT NOT NULL DEFAULT 0,
+    total DECIMAL(14, 1) NOT NULL DEFAULT 0,
+    PRIMARY KEY (album_id, day)
+);
+
+-- 没有底表时按 review_time 聚合最近的乐评
+CREATE INDEX idx_review_time ON Review (review_time);
+
+-- 回填 (只需覆盖排行榜最长的时间窗口)
+INSERT INTO Album_Review_Day (album_id, day, cnt, total)
+SELECT album_id, DATE(review_time), COUNT(*), SUM(score)
+FROM Review
+WHERE review_time >= CURRENT_DATE - INTERVAL 30 DAY
+GROUP BY album_id, DATE(review_time);
@@ -0,0 +1,19 @@
+-- 推荐用的相似物品表 (见 api/_recommend.py)
+-- 每个被关注过的乐队 / 专辑 / 歌曲一行: 关注人数 + 最相似的前 K 个同类物品
+-- neighbors 是紧凑编码: K 个 uint32 物品 id 后接 K 个 uint16 相似度 (×65535)，小端序，K=20 时 120 字节
+-- 由 flask rebuild-recommendations 全量生成，此后 refresh-recommendations 按脏标记增量刷新
+
+CREATE TABLE IF NOT EXISTS Item_Neighbor (
+    kind VARCHAR(16) NOT NULL,
+    item_id INT NOT NULL,
+    fans INT NOT NULL DEFAULT 0,
+    neighbors BLOB NOT NULL,
+    PRIMARY KEY (kind, item_id)
+);
+
+-- 关注关系变化过、等待增量刷新的物品 (关注 / 取关 / 高分乐评的事务里写入)
+CREATE TABLE IF NOT EXISTS Item_Neighbor_Dirty (
+    kind VARCHAR(16) NOT NULL,
+    item_id INT NOT NULL,
+    PRIMARY KEY (kind, item_id)
+);
@@ -0,0 +1,27 @@
+-- 分批后台删除的任务 (见 api/_deletes.py)
+-- 每个乐队 / 歌迷最多一个任务；完成后保留记录，管理员后台可以看到最近完成的删除
+-- 进度 (下一个步骤、已删除行数) 和每一批删除在同一个事务里提交，中断后从 step 继续
+--
+-- label      乐队名 / 歌迷名 (删完之后仍可显示)
+-- step       下一个要执行的步骤 (步骤列表见 _deletes.py 的 band_steps / fan_steps)
+-- total      创建任务时统计的待删除行数，deleted 为已删除的行数，两者用于显示进度
+-- album_ids  歌迷评过分的专辑 (逗号分隔)，全部删完后对这些专辑的累计评分统一对账
+-- status     running / done；error 为最近一次失败的原因 (下次从同一步骤重试)
+
+CREATE TABLE IF NOT EXISTS Delete_Job (
+    kind VARCHAR(8) NOT NULL,
+    target_id INT NOT NULL,
+    label VARCHAR(255) NOT NULL DEFAULT '',
+    step INT NOT NULL DEFAULT 0,
+    batches INT NOT NULL DEFAULT 0,
+    deleted INT NOT NULL DEFAULT 0,
+    total INT NOT NULL DEFAULT 0,
+    album_ids MEDIUMTEXT,
+    status VARCHAR(8) NOT NULL DEFAULT 'running',
+    error TEXT,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (kind, target_id)
+);
+
+CREATE INDEX idx_delete_job_status ON Delete_Job (status, updated_at);
@@ -0,0 +1,100 @@
+"""
+测试夹具：每个测试一个新的 SQLite 替身库 (bench/sqlite_db.py，建表并执行 sql/ 下的迁移)，
+index 的连接池和进程内组件都换成连到它的新实例。
+运行: python -m pytest mygo-web/tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+os.environ.setdefault('DB_POOL_PREWARM', '0')
+
+import bench.sqlite_db as sqlite_db  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'mygo.db')
+    sqlite_db.create_schema(path)
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    """直接读写测试库的连接 (每条语句后自行 commit)"""
+    conn = sqlite_db.Connection(db_path)
+    yield conn
+    conn.close()
+
+
+def query(db, sql, *args):
+    with db.cursor() as cursor:
+        cursor.execute(sql, args)
+        rows = cursor.fetchall()
+    db.commit()
+    return rows
+
+
+def execute(db, sql, *args):
+    with db.cursor() as cursor:
+        cursor.execute(sql, args)
+        lastrowid = cursor.lastrowid
+    db.commit()
+    return lastrowid
+
+
+@pytest.fixture
+def catalog(db):
+    """两支乐队、各两张专辑 (每张两首歌)、一场演唱会，三个歌迷"""
+    ids = {'bands': [], 'albums': [], 'songs': [], 'concerts': [], 'fans': []}
+    for b in (1, 2):
+        ids['bands'].append(execute(db, "INSERT INTO Band (name, password, intro) VALUES (%s, 'pw', %s)", f'band-{b}', f'乐队 {b}'))
+        for a in (1, 2):
+            album_id = execute(db, "INSERT INTO Album (title, band_id, release_date) VALUES (%s, %s, '2024-01-01')",
+                               f'album-{b}-{a}', ids['bands'][-1])
+            ids['albums'].append(album_id)
+            for s in (1, 2):
+                ids['songs'].append(execute(db, "INSERT INTO Song (title, album_id) VALUES (%s, %s)", f'song-{b}-{a}-{s}', album_id))
+        ids['concerts'].append(execute(db, "INSERT INTO Concert (name, band_id) VALUES (%s, %s)", f'live-{b}', ids['bands'][-1]))
+    for f, (age, gender) in enumerate(((20, '女'), (35, '男'), (50, '女')), 1):
+        ids['fans'].append(execute(db, "INSERT INTO Fan (name, password, age, gender, education) VALUES (%s, 'pw', %s, %s, '本科')",
+                                   f'fan-{f}', age, gender))
+    return ids
+
+
+@pytest.fixture
+def index(db_path, monkeypatch):
+    """导入应用，连接池和进程内缓存 / 排行榜 / 搜索 / 推荐都换成新的"""
+    import index as module
+    from _cache import MemoryCache
+    from _fragments import DataVersions, FragmentCache
+    pool = module.ConnectionPool(sqlite_db.connector(db_path), min_size=1, max_size=4, timeout=5,
+                                 cursor_wrapper=module.metrics.InstrumentedCursor)
+    monkeypatch.setattr(module, 'db_pool', pool)
+    for component in (module.leaderboard, module.search_index, module.recommender):
+        monkeypatch.setattr(component, 'pool', pool)
+        component.invalidate()
+    monkeypatch.setattr(module, 'data_versions', DataVersions())
+    fragments = FragmentCache(MemoryCache())
+    monkeypatch.setattr(module, 'fragment_cache', fragments)
+    monkeypatch.setattr(module.app.jinja_env, 'fragment_cache', fragments)
+    module.band_cache.clear()
+    module.app.testing = True
+    yield module
+    pool.close_all()
+
+
+@pytest.fixture
+def client(index):
+    """client(role, **session) -> 已登录的 test_client"""
+    def make(role, **values):
+        c = index.app.test_client()
+        with c.session_transaction() as s:
+            s['role'] = role
+            s.update(values)
+        return c
+    return make
@@ -0,0 +1,36 @@
+"""乐队统计：增量维护的结果和全量重建一致；资料修改的校验"""
+from conftest import query
+
+
+def stat_rows(db, band_id):
+    return sorted((r['dim'], r['bucket'], r['cnt'], float(r['total']))
+                  for r in query(db, "SELECT dim, bucket, cnt, total FROM Band_Stat WHERE band_id=%s", band_id) if r['cnt'])
+
+
+def rebuilt_rows(index, db, band_id):
+    with index.db_pool.connection() as conn:
+        index.band_stats.rebuild_band_stats(conn, [band_id])
+    return stat_rows(db, band_id)
+
+
+def test_likes_and_profile_edits_match_a_full_rebuild(index, db, catalog, client):
+    band_id = catalog['bands'][0]
+    for fan_id in catalog['fans']:
+        client('fan', fan_id=fan_id).get(f'/fan/toggle_like/band/{band_id}?op=like&format=json')
+    client('fan', fan_id=catalog['fans'][0]).get(f"/fan/toggle_like/song/{catalog['songs'][0]}?op=like&format=json")
+    fan = client('fan', fan_id=catalog['fans'][1], fan_name='fan-2')
+    fan.post('/fan', data={'action': 'update_profile', 'age': '17', 'education': '硕士', 'occupation': ''})
+    client('fan', fan_id=catalog['fans'][2]).get(f'/fan/toggle_like/band/{band_id}?op=unlike&format=json')
+
+    incremental = stat_rows(db, band_id)
+    assert ('age', '<18', 1, 17.0) in incremental
+    assert incremental == rebuilt_rows(index, db, band_id)
+
+
+def test_invalid_age_is_rejected_without_touching_the_profile(index, db, catalog, client):
+    fan_id = catalog['fans'][0]
+    fan = client('fan', fan_id=fan_id, fan_name='fan-1')
+    resp = fan.post('/fan', data={'action': 'update_profile', 'age': 'abc', 'education': '硕士', 'occupation': ''})
+    assert resp.status_code == 200
+    assert '无效的年龄' in resp.get_data(as_text=True)
+    assert query(db, "SELECT age, education FROM Fan WHERE fan_id=%s", fan_id) == [{'age': 20, 'education': '本科'}]
@@ -0,0 +1,37 @@
+"""乐队缓存：加载期间发生过失效的结果不能写回缓存"""
+import threading
+
+from _cache import BandCache, MemoryCache
+
+
+def test_set_after_invalidate_is_dropped():
+    cache = BandCache(MemoryCache(), datasets=('albums', 'stats'))
+    generation = cache.generation(1)
+    cache.invalidate(1, 'albums')
+    cache.set(1, 'albums', 'stale', generation)
+    assert cache.get_many(1, ['albums']) == {}
+    cache.set(1, 'albums', 'fresh', cache.generation(1))
+    assert cache.get_many(1, ['albums']) == {'albums': 'fresh'}
+
+    generation = cache.generation(1)
+    cache.clear()
+    cache.set(1, 'stats', 'stale', generation)
+    assert cache.get_many(1, ['stats']) == {}
+
+
+def test_invalidate_racing_with_set_wins():
+    """校验代数之后、写入后端之前插进来的 invalidate() 不能被旧值覆盖"""
+    class RacingBackend(MemoryCache):
+        racer = None
+
+        def set(self, key, value):
+            self.racer = threading.Thread(target=cache.invalidate, args=(1, 'albums'))
+            self.racer.start()
+            self.racer.join(0.2)  # set 持有锁时 invalidate 要等 set 完成
+            super().set(key, value)
+
+    backend = RacingBackend()
+    cache = BandCache(backend, datasets=('albums',))
+    cache.set(1, 'albums', 'stale', cache.generation(1))
+    backend.racer.join()
+    assert cache.get_many(1, ['albums']) == {}
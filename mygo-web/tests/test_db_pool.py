@@ -0,0 +1,50 @@
+"""连接池：lease 防止兜底 close 归还别人的连接；discard 断开而不归还；归还时回滚未提交的事务"""
+import pytest
+
+import bench.sqlite_db as sqlite_db
+from _db import ConnectionPool, PoolExhausted
+from conftest import query
+
+
+@pytest.fixture
+def pool(db_path):
+    pool = ConnectionPool(sqlite_db.connector(db_path), min_size=0, max_size=1, timeout=0.05)
+    yield pool
+    pool.close_all()
+
+
+def test_stale_lease_does_not_release_the_next_checkout(pool):
+    conn = pool.acquire()
+    lease = conn.lease
+    conn.close()
+    again = pool.acquire()
+    assert again is conn  # 同一条物理连接借给了下一个请求
+    conn.close(lease)  # 上一个请求结束时的兜底 close
+    assert pool.stats()['in_use'] == 1
+    with pytest.raises(PoolExhausted):
+        pool.acquire()
+    again.close(again.lease)
+    assert pool.stats()['in_use'] == 0
+
+
+def test_discard_closes_the_connection_and_frees_the_slot(pool):
+    conn = pool.acquire()
+    raw = conn._raw
+    conn.discard()
+    assert not raw.open
+    assert pool.stats()['size'] == 0
+    fresh = pool.acquire()
+    assert fresh._raw is not raw
+    fresh.close()
+
+
+def test_release_rolls_back_an_unfinished_transaction(pool, db):
+    conn = pool.acquire()
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO Band (name, password) VALUES ('uncommitted', 'pw')")
+    conn.close()
+    assert query(db, "SELECT * FROM Band") == []
+    with pool.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS n FROM Band")
+            assert cursor.fetchone()['n'] == 0
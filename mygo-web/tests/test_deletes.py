@@ -0,0 +1,86 @@
+"""分批删除：中断后从记录的步骤继续，结果和一次删完一致；任务进行中乐队自己和其他歌迷对它的写入都被拒绝"""
+from _deletes import DeleteJobs
+from _ratings import reconcile_album_aggregates
+from conftest import execute, query
+
+
+def start_band_delete(index, band_id):
+    with index.db_pool.connection() as conn:
+        return index.delete_jobs.start(conn, 'band', band_id)
+
+
+def test_band_delete_routes_are_rejected_while_the_band_is_deleting(index, db, catalog, client):
+    band_id = catalog['bands'][0]
+    start_band_delete(index, band_id)
+    band = client('band', band_id=band_id, band_name='band-1')
+
+    resp = band.get(f"/band/delete_song/{catalog['songs'][0]}")
+    assert resp.status_code == 302 and resp.headers['Location'].endswith('/')
+    assert query(db, "SELECT song_id FROM Song WHERE song_id=%s", catalog['songs'][0])
+    with band.session_transaction() as s:
+        assert 'band_id' not in s
+
+
+def test_likes_and_reviews_on_a_deleting_band_are_rejected(index, db, catalog, client):
+    band_id, other_band = catalog['bands']
+    start_band_delete(index, band_id)
+    fan = client('fan', fan_id=catalog['fans'][0], fan_name='fan-1')
+
+    resp = fan.get(f"/fan/toggle_like/song/{catalog['songs'][0]}?op=like&format=json")
+    assert resp.status_code == 409
+    resp = fan.post('/fan', data={'action': 'rate', 'album_id': catalog['albums'][0], 'score': '8', 'comment': 'x'})
+    assert resp.status_code == 302
+    assert query(db, "SELECT * FROM Fan_Like_Song") == [] and query(db, "SELECT * FROM Review") == []
+    # 歌迷自己的登录状态不受影响，其他乐队照常
+    resp = fan.get(f"/fan/toggle_like/band/{other_band}?op=like&format=json")
+    assert resp.get_json()['changed'] is True
+
+
+def test_write_behind_flush_drops_ops_on_a_deleting_band(index, db, catalog):
+    start_band_delete(index, catalog['bands'][0])
+    fan = catalog['fans'][0]
+    deleting_song, open_song = catalog['songs'][0], catalog['songs'][4]
+    index.flush_interactions({fan: {'song': {deleting_song: 'like', open_song: 'like'}}}, {})
+    assert query(db, "SELECT song_id FROM Fan_Like_Song") == [{'song_id': open_song}]
+
+
+def test_fan_delete_resumes_after_a_failed_batch(index, db, catalog, client):
+    fan_id, other = catalog['fans'][0], catalog['fans'][1]
+    for who in (fan_id, other):
+        fan = client('fan', fan_id=who, fan_name='fan')
+        fan.get(f"/fan/toggle_like/band/{catalog['bands'][0]}?op=like&format=json")
+        for song in catalog['songs'][:3]:
+            fan.get(f'/fan/toggle_like/song/{song}?op=like&format=json')
+        for album in catalog['albums'][:3]:
+            fan.post('/fan', data={'action': 'rate', 'album_id': album, 'score': '8', 'comment': ''})
+    jobs = DeleteJobs(batch_size=2, prepare={'fan': index.prepare_fan_delete})
+    execute(db, """
+        CREATE TRIGGER fail_review_delete BEFORE DELETE ON Review
+        BEGIN SELECT RAISE(ABORT, 'Lock wait timeout exceeded'); END
+    """)
+
+    with index.db_pool.connection() as conn:
+        job = jobs.start(conn, 'fan', fan_id)
+        stale = dict(job)
+        job = jobs.run(conn, job, deadline=0)  # 只执行一批：准备步骤
+        assert job['step'] == 1
+        # 拿着旧任务行的另一个执行者放弃这一批，不会重复撤销统计
+        assert jobs.run(conn, stale, deadline=0)['step'] == 1
+        while job['status'] == 'running' and not job['error']:
+            job = jobs.run(conn, job, deadline=0)
+        assert 'Lock wait timeout' in job['error'] and jobs.steps['fan'][job['step']].table == 'Review'
+        failed_at = job['step']
+
+        execute(db, "DROP TRIGGER fail_review_delete")
+        for _, job in jobs.run_pending(conn, budget=5):
+            pass
+        assert (job['status'], job['error']) == ('done', None)
+        assert job['step'] > failed_at and job['deleted'] == job['total']
+
+    assert query(db, "SELECT fan_id FROM Fan WHERE fan_id=%s", fan_id) == []
+    assert query(db, "SELECT DISTINCT fan_id FROM Review") == [{'fan_id': other}]
+    with index.db_pool.connection() as conn:
+        assert reconcile_album_aggregates(conn) == []
+        before = query(db, "SELECT band_id, dim, bucket, cnt, total FROM Band_Stat WHERE cnt <> 0 ORDER BY band_id, dim, bucket")
+        index.band_stats.rebuild_band_stats(conn)
+    assert query(db, "SELECT band_id, dim, bucket, cnt, total FROM Band_Stat WHERE cnt <> 0 ORDER BY band_id, dim, bucket") == before
@@ -0,0 +1,29 @@
+"""页面 ETag：数据没有变化时返回 304，相关数据版本变化或有待显示的消息时重新渲染"""
+
+
+def test_fan_page_revalidates_until_its_data_changes(index, catalog, client):
+    fan = client('fan', fan_id=catalog['fans'][0], fan_name='fan-1')
+    first = fan.get('/fan')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'private, no-cache'
+    assert fan.get('/fan', headers={'If-None-Match': etag}).status_code == 304
+    assert fan.get('/fan', headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 304
+
+    # 其他歌迷的关注不影响这个页面
+    client('fan', fan_id=catalog['fans'][1]).get(f"/fan/toggle_like/band/{catalog['bands'][0]}?op=like&format=json")
+    assert fan.get('/fan', headers={'If-None-Match': etag}).status_code == 304
+    # 自己的关注让页面过期
+    fan.get(f"/fan/toggle_like/band/{catalog['bands'][0]}?op=like&format=json")
+    again = fan.get('/fan', headers={'If-None-Match': etag})
+    assert again.status_code == 200 and again.headers['ETag'] != etag
+
+
+def test_pending_flash_and_other_users_never_get_304(index, catalog, client):
+    fan = client('fan', fan_id=catalog['fans'][0], fan_name='fan-1')
+    etag = fan.get('/fan').headers['ETag']
+    other = client('fan', fan_id=catalog['fans'][1], fan_name='fan-2')
+    assert other.get('/fan', headers={'If-None-Match': etag}).status_code == 200
+
+    fan.get(f"/fan/toggle_like/song/{catalog['songs'][0]}?op=like")  # 非 JSON：留下一条 flash
+    etag = fan.get('/fan').headers.get('ETag')
+    assert etag is None
@@ -0,0 +1,63 @@
+"""批量导入：重复行 (库里已有或文件里前面出现过) 记为错误；一块写入失败时逐行重试，只有坏行失败"""
+import gzip
+import io
+import json
+
+from _import import IMPORTS, import_records, read_records
+from conftest import execute, query
+
+
+def run_import(index, name, data, fmt='csv', chunk_size=1000, compressed=False):
+    records = read_records(io.BytesIO(data.encode('utf-8')) if not compressed else io.BytesIO(gzip.compress(data.encode('utf-8'))),
+                           fmt, IMPORTS[name], compressed)
+    reports, failures = [], []
+    with index.db_pool.connection() as conn:
+        for progress, failed in import_records(conn, IMPORTS[name], records, chunk_size):
+            reports.append(progress)
+            failures += [(f.line, f.error) for f in failed]
+    return reports[-1], failures
+
+
+def test_duplicates_and_invalid_rows_are_reported(index, db, catalog):
+    csv_data = 'name,password,intro\nA,pw,\nband-1,pw,\nB,pw,\nA,pw,again\nC,,\n'
+    progress, failures = run_import(index, 'bands', csv_data)
+    assert progress == {'read': 5, 'inserted': 2, 'failed': 3}
+    assert failures == [(3, '与已有数据重复: band-1'), (5, '与已有数据重复: A'), (6, '缺少 password')]
+    assert sorted(r['name'] for r in query(db, "SELECT name FROM Band")) == ['A', 'B', 'band-1', 'band-2']
+    # 同一个文件再导一次不会产生重复数据
+    progress, _ = run_import(index, 'bands', csv_data)
+    assert progress['inserted'] == 0
+
+
+def test_failed_chunk_is_retried_row_by_row(index, db, catalog):
+    # 模拟块写入期间并发写入了同名数据：这一行的 INSERT 失败
+    execute(db, """
+        CREATE TRIGGER reject_taken BEFORE INSERT ON Album WHEN NEW.title = 'taken'
+        BEGIN SELECT RAISE(ABORT, 'Duplicate entry'); END
+    """)
+    ndjson = '\n'.join(['{"band": "band-1", "title": "x1"}', '{"band": "band-1", "title": "taken"}',
+                        'not json', '{"band": "nobody", "title": "x2"}', '{"band_id": %d, "title": "x3"}' % catalog['bands'][1]])
+    progress, failures = run_import(index, 'albums', ndjson, fmt='ndjson', chunk_size=2, compressed=True)
+    assert progress == {'read': 5, 'inserted': 2, 'failed': 3}
+    assert [line for line, _ in failures] == [2, 3, 4]
+    assert 'Duplicate entry' in failures[0][1]
+    assert {r['title'] for r in query(db, "SELECT title FROM Album WHERE title LIKE 'x%%'")} == {'x1', 'x3'}
+
+
+def test_songs_resolve_albums_by_band_and_title(index, db, catalog):
+    progress, failures = run_import(index, 'songs', 'band,album,title\nband-2,album-2-1,new song\nband-2,album-1-1,lost\n')
+    assert progress['inserted'] == 1 and len(failures) == 1
+    assert query(db, "SELECT album_id FROM Song WHERE title='new song'") == [{'album_id': catalog['albums'][2]}]
+
+
+def test_import_stream_ends_with_the_summary_even_when_the_file_breaks(index, db, catalog, client):
+    admin = client('admin')
+    data = gzip.compress('name,password\nA,pw\n'.encode('utf-8'))[:-8]  # gzip 尾部被截断
+    resp = admin.post('/admin/import/bands', data={'file': (io.BytesIO(data), 'bands.csv.gz')})
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert lines[-1]['done'] is False and '文件无法读取' in lines[-1]['error']
+
+    resp = admin.post('/admin/import/bands', data={'file': (io.BytesIO(b'name,password\nA,pw\nband-1,pw\n'), 'bands.csv')})
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert lines[0]['line'] == 3
+    assert lines[-1] == {'read': 2, 'inserted': 1, 'failed': 1, 'done': True, 'error': None}
@@ -0,0 +1,27 @@
+"""排行榜：平均分高的在前，同分时乐评多的在前，再按 album_id；增量更新和重新加载的结果一致"""
+from _leaderboard import Leaderboard
+
+
+def rate(client, fan_id, album_id, score):
+    client('fan', fan_id=fan_id, fan_name='fan').post('/fan', data={'action': 'rate', 'album_id': album_id, 'score': score, 'comment': ''})
+
+
+def test_ordering_and_incremental_updates(index, catalog, client):
+    assert index.leaderboard.top(10) == []  # 先加载，之后的评分走增量更新
+    albums, (f1, f2, f3) = catalog['albums'], catalog['fans']
+    rate(client, f1, albums[0], '8')
+    rate(client, f2, albums[0], '8')
+    rate(client, f1, albums[1], '8')
+    rate(client, f3, albums[2], '6')
+    rate(client, f3, albums[2], '9')  # 重新评分
+    rate(client, f2, albums[3], '8')
+
+    top = index.leaderboard.top(10)
+    assert [a['album_id'] for a in top] == [albums[2], albums[0], albums[1], albums[3]]
+    assert [(str(a['avg_score']), a['review_count']) for a in top] == [('9.00', 1), ('8.00', 2), ('8.00', 1), ('8.00', 1)]
+    assert index.leaderboard.top(2) == top[:2]
+    assert [a['album_id'] for a in index.leaderboard.top(10, band_id=catalog['bands'][1])] == [albums[2], albums[3]]
+
+    reloaded = Leaderboard(index.db_pool)
+    for window in ('all', '7d'):
+        assert reloaded.top(10, window) == index.leaderboard.top(10, window)
@@ -0,0 +1,33 @@
+"""关注切换：INSERT IGNORE 的影响行数决定结果，目标不存在时返回 404"""
+from conftest import query
+
+
+def like(fan, kind, target_id, op=None):
+    resp = fan.get(f"/fan/toggle_like/{kind}/{target_id}?format=json" + (f'&op={op}' if op else ''))
+    return resp.status_code, resp.get_json()
+
+
+def test_toggle_without_op_flips_the_state(index, db, catalog, client):
+    fan_id, song = catalog['fans'][0], catalog['songs'][0]
+    fan = client('fan', fan_id=fan_id)
+    states = [like(fan, 'song', song)[1] for _ in range(3)]
+    assert [(s['liked'], s['changed']) for s in states] == [(True, True), (False, True), (True, True)]
+    assert query(db, "SELECT fan_id, song_id FROM Fan_Like_Song") == [{'fan_id': fan_id, 'song_id': song}]
+
+
+def test_explicit_ops_are_idempotent(index, db, catalog, client):
+    fan = client('fan', fan_id=catalog['fans'][0])
+    band = catalog['bands'][0]
+    assert like(fan, 'band', band, 'like')[1]['changed'] is True
+    assert like(fan, 'band', band, 'like') == (200, {'type': 'band', 'id': band, 'liked': True, 'changed': False, 'queued': False})
+    assert like(fan, 'band', band, 'unlike')[1]['changed'] is True
+    assert like(fan, 'band', band, 'unlike')[1]['changed'] is False
+    assert query(db, "SELECT cnt FROM Band_Stat WHERE band_id=%s AND dim='fans'", band) == [{'cnt': 0}]
+
+
+def test_missing_target_is_not_found(index, db, catalog, client):
+    fan = client('fan', fan_id=catalog['fans'][0])
+    assert like(fan, 'song', 9999, 'like')[0] == 404
+    assert like(fan, 'song', 9999)[0] == 404
+    assert like(fan, 'song', 9999, 'unlike') == (200, {'type': 'song', 'id': 9999, 'liked': False, 'changed': False, 'queued': False})
+    assert query(db, "SELECT * FROM Fan_Like_Song") == []
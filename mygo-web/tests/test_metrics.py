@@ -0,0 +1,33 @@
+"""
+SQL 指纹：同一条语句不管批量多大都要落到同一个指标序列上。
+运行: python -m pytest mygo-web/tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from _metrics import fingerprint  # noqa: E402
+
+
+def in_list(n):
+    return ', '.join(['%s'] * n)
+
+
+def row_list(n):
+    return ', '.join(['(%s, %s)'] * n)
+
+
+def test_in_list_batch_sizes_share_one_fingerprint():
+    fps = {fingerprint(f"SELECT song_id AS id FROM Song WHERE song_id IN ({in_list(n)})") for n in (1, 2, 50)}
+    assert fps == {'SELECT song_id AS id FROM Song WHERE song_id IN (?+)'}
+
+
+def test_row_value_list_batch_sizes_share_one_fingerprint():
+    fps = {fingerprint(f"DELETE FROM Fan_Like_Song WHERE (fan_id, song_id) IN ({row_list(n)})") for n in (1, 2, 50)}
+    assert fps == {'DELETE FROM Fan_Like_Song WHERE (fan_id, song_id) IN ((?+)+)'}
+
+
+def test_literals_and_whitespace_are_normalised():
+    assert fingerprint("SELECT * FROM Fan  WHERE name = 'x' -- 注释\n AND age > 18") == \
+        fingerprint("SELECT * FROM Fan WHERE name = %s AND age > %s")
@@ -0,0 +1,48 @@
+"""键集分页：重复标题按 (title, album_id) 排序，翻页不重不漏，恰好整页时没有多余的空页"""
+import pytest
+
+from conftest import execute
+
+
+@pytest.fixture
+def albums(db, catalog):
+    band = catalog['bands'][0]
+    for title in ('a', 'b', 'b', 'b_x', 'b%'):
+        execute(db, "INSERT INTO Album (title, band_id) VALUES (%s, %s)", title, band)
+    return band
+
+
+def pages(fan, limit, q=''):
+    items, after, calls = [], '', 0
+    while True:
+        data = fan.get(f'/fan/albums?limit={limit}&q={q}&after={after}').get_json()
+        calls += 1
+        items += [(a['title'], a['album_id']) for a in data['items']]
+        if data['next'] is None:
+            return items, calls
+        after = data['next']
+
+
+def test_every_page_size_walks_the_same_order(index, client, albums):
+    fan = client('fan', fan_id=1)
+    everything, _ = pages(fan, 100)
+    assert everything == sorted(everything) and len(everything) == 9
+    for limit in (1, 2, 3, 4):
+        items, calls = pages(fan, limit)
+        assert items == everything
+        assert calls == -(-len(everything) // limit)  # 9 行每页 3 行正好 3 页，没有空的第 4 页
+
+
+def test_prefix_filter_pages_within_the_matches(index, client, albums):
+    fan = client('fan', fan_id=1)
+    assert [t for t, _ in pages(fan, 1, 'b')[0]] == ['b', 'b', 'b%', 'b_x']
+    assert pages(fan, 2, 'album-1')[0] == pages(fan, 100, 'album-1')[0]
+
+
+def test_bad_cursor_and_limits_are_clamped(index, client, albums):
+    fan = client('fan', fan_id=1)
+    first = fan.get('/fan/albums?limit=2').get_json()
+    assert fan.get('/fan/albums?limit=2&after=not-a-cursor').get_json() == first
+    assert len(fan.get('/fan/albums?limit=0').get_json()['items']) == 1
+    assert len(fan.get('/fan/albums?limit=-5').get_json()['items']) == 1
+    assert len(fan.get('/fan/albums?limit=1000').get_json()['items']) == 9
@@ -0,0 +1,38 @@
+"""专辑累计评分：评分 / 重新评分 / 删除专辑 / 注销歌迷之后，增量维护的值和全量对账一致"""
+from _ratings import reconcile_album_aggregates
+from conftest import execute, query
+
+
+def rate(client, fan_id, album_id, score):
+    client('fan', fan_id=fan_id, fan_name='fan').post('/fan', data={'action': 'rate', 'album_id': album_id, 'score': score, 'comment': ''})
+
+
+def drift(index):
+    with index.db_pool.connection() as conn:
+        return reconcile_album_aggregates(conn)
+
+
+def test_incremental_aggregates_match_reconcile(index, db, catalog, client):
+    albums, (f1, f2, f3) = catalog['albums'], catalog['fans']
+    rate(client, f1, albums[0], '8')
+    rate(client, f2, albums[0], '6.5')
+    rate(client, f1, albums[0], '9')  # 重新评分只改总分
+    rate(client, f3, albums[1], '7')
+    rate(client, f3, albums[2], '10')
+    assert query(db, "SELECT review_count, score_sum FROM Album WHERE album_id=%s", albums[0]) == \
+        [{'review_count': 2, 'score_sum': 15.5}]
+    assert drift(index) == []
+
+    admin = client('admin')
+    admin.get(f'/admin/delete_fan/{f3}')
+    assert query(db, "SELECT review_count, score_sum FROM Album WHERE album_id=%s", albums[1]) == \
+        [{'review_count': 0, 'score_sum': 0}]
+    assert drift(index) == []
+
+
+def test_reconcile_repairs_drift(index, db, catalog, client):
+    album = catalog['albums'][0]
+    rate(client, catalog['fans'][0], album, '8')
+    execute(db, "UPDATE Album SET review_count=5, score_sum=1 WHERE album_id=%s", album)
+    assert [(d['album_id'], d['actual_count']) for d in drift(index)] == [(album, 1)]
+    assert drift(index) == []
@@ -0,0 +1,34 @@
+"""推荐：相似列表的二进制编码往返；写入 Item_Neighbor 之后读回的相似列表"""
+import pytest
+
+from _recommend import Recommender, decode_neighbors, encode_neighbors
+
+
+def test_neighbor_blob_round_trip():
+    neighbors = [(1, 1.0), (2 ** 32 - 1, 0.5), (42, 0.0), (7, 1 / 3)]
+    blob = encode_neighbors(neighbors)
+    assert len(blob) == 6 * len(neighbors)
+    assert blob[:4] == b'\x01\x00\x00\x00'  # 小端，与机器字节序无关
+    decoded = decode_neighbors(blob)
+    assert [i for i, _ in decoded] == [i for i, _ in neighbors]
+    for (_, got), (_, want) in zip(decoded, neighbors):
+        assert got == pytest.approx(want, abs=1 / 65535)
+    assert decode_neighbors(encode_neighbors([])) == []
+    assert decode_neighbors(encode_neighbors([(5, 1.7), (6, -0.2)])) == [(5, 1.0), (6, 0.0)]
+
+
+def test_rebuilt_neighbors_are_read_back(index, catalog, client):
+    songs = catalog['songs']
+    for fan_id in catalog['fans']:
+        fan = client('fan', fan_id=fan_id)
+        for song in songs[:2]:
+            fan.get(f'/fan/toggle_like/song/{song}?op=like&format=json')
+    client('fan', fan_id=catalog['fans'][0]).get(f'/fan/toggle_like/song/{songs[2]}?op=like&format=json')
+    with index.db_pool.connection() as conn:
+        index.recommender.rebuild(conn)
+    index.recommender.invalidate()
+
+    similar = index.recommender.similar('song', songs[0])
+    assert [s['id'] for s in similar] == [songs[1], songs[2]]
+    assert similar[0]['score'] > similar[1]['score']
+    assert Recommender(index.db_pool).similar('song', songs[0]) == similar
@@ -0,0 +1,33 @@
+"""站内搜索：中日韩文字按单字 + bigram 切分，其他文字按单词，NFKC + 大小写折叠"""
+from _search import SearchIndex, index_terms, query_terms
+from conftest import execute
+
+
+def test_cjk_runs_index_unigrams_and_bigrams():
+    assert index_terms('春日影') == {'春', '日', '影', '春日', '日影'}
+    assert index_terms('迷星叫 MyGO') == {'迷', '星', '叫', '迷星', '星叫', 'mygo'}
+    assert index_terms('ｂａｎｄ，リボン') == {'band', 'リ', 'ボ', 'ン', 'リボ', 'ボン'}
+
+
+def test_queries_use_bigrams_and_a_trailing_prefix():
+    assert query_terms('春日影') == (['春日', '日影'], None)
+    assert query_terms('影') == (['影'], None)
+    assert query_terms('春日 Myg') == (['春日'], 'myg')
+    assert query_terms('春日 MyGO ') == (['春日', 'mygo'], None)
+
+
+def test_search_matches_cjk_titles_and_updates_incrementally(index, db, catalog):
+    album = catalog['albums'][0]
+    song = execute(db, "INSERT INTO Song (title, album_id, authors) VALUES ('春日影', %s, 'CRYCHIC')", album)
+    execute(db, "INSERT INTO Song (title, album_id) VALUES ('日常', %s)", album)
+    search = SearchIndex(index.db_pool)
+
+    assert [(r['type'], r['id']) for r in search.search('春日影')] == [('song', song)]
+    assert [r['id'] for r in search.search('日影')] == [song]
+    assert [r['id'] for r in search.search('cryc')] == [song]
+    assert search.search('影春') == []  # bigram 顺序不对
+
+    search.put_song(song, album, '春日影 (Live)')
+    assert search.search('live')[0]['id'] == song
+    search.remove('song', song)
+    assert search.search('春日影') == []
@@ -0,0 +1,94 @@
+"""写后缓冲：整批写入失败时逐条重试，坏数据转入死信，其余照常写入；崩溃后按顺序重放日志"""
+import json
+import os
+from decimal import Decimal
+
+import pymysql
+import pytest
+
+from conftest import execute, query
+
+
+@pytest.fixture
+def write_behind(index, tmp_path):
+    from _writebehind import WriteBehind
+    wb = WriteBehind(index.flush_interactions, str(tmp_path / 'write-behind'), flush_interval=3600,
+                     is_permanent=index.permanent_write_error)
+    wb.start()
+    yield wb
+    wb.close()
+
+
+def test_bad_review_is_dead_lettered_and_the_rest_of_the_batch_is_written(index, db, catalog, write_behind):
+    # 模拟线上严格模式下超长评论被拒绝
+    execute(db, """
+        CREATE TRIGGER reject_long_comment BEFORE INSERT ON Review WHEN NEW.comment = 'too long'
+        BEGIN SELECT RAISE(ABORT, 'Data too long for column comment'); END
+    """)
+    album = catalog['albums'][0]
+    good_fan, bad_fan, liker = catalog['fans']
+    write_behind.enqueue_review(good_fan, album, Decimal('8'), 'ok')
+    write_behind.enqueue_review(bad_fan, album, Decimal('3'), 'too long')
+    write_behind.enqueue_likes(liker, {'song': {catalog['songs'][0]: 'like'}})
+
+    assert write_behind.flush() == 3
+
+    assert query(db, "SELECT fan_id, score FROM Review") == [{'fan_id': good_fan, 'score': 8.0}]
+    assert query(db, "SELECT review_count, score_sum FROM Album WHERE album_id=%s", album) == [{'review_count': 1, 'score_sum': 8.0}]
+    assert query(db, "SELECT fan_id, song_id FROM Fan_Like_Song") == [{'fan_id': liker, 'song_id': catalog['songs'][0]}]
+    stats = write_behind.stats()
+    assert (stats['pending'], stats['dead_lettered'], stats['errors']) == (0, 1, 0)
+    with open(os.path.join(write_behind.log_dir, 'dead-letter.jsonl'), encoding='utf-8') as f:
+        dead = [json.loads(line) for line in f]
+    assert [(d['t'], d['f'], d['a'], d['c']) for d in dead] == [('review', bad_fan, album, 'too long')]
+    assert 'Data too long' in dead[0]['error']
+
+
+def test_transient_error_keeps_the_batch_queued(index, db, catalog, write_behind):
+    def database_down(likes, reviews):
+        raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+
+    write_behind.flush_fn = database_down
+    write_behind.enqueue_review(catalog['fans'][0], catalog['albums'][0], Decimal('8'), 'ok')
+    write_behind.enqueue_likes(catalog['fans'][1], {'band': {catalog['bands'][0]: 'like'}})
+    with pytest.raises(pymysql.err.OperationalError):
+        write_behind.flush()
+    assert write_behind.stats()['pending'] == 2
+    assert write_behind.stats()['dead_lettered'] == 0
+
+    write_behind.flush_fn = index.flush_interactions
+    assert write_behind.flush() == 2
+    assert len(query(db, "SELECT * FROM Review")) == 1
+    assert len(query(db, "SELECT * FROM Fan_Like_Band")) == 1
+
+
+def test_log_left_by_a_crashed_process_is_replayed_in_order(index, db, catalog, tmp_path):
+    from _writebehind import WriteBehind
+    log_dir = str(tmp_path / 'write-behind')
+    fan, song, album = catalog['fans'][0], catalog['songs'][0], catalog['albums'][0]
+    # 崩溃的进程：入队落盘之后没来得及写入数据库，也没有正常关闭 (不启动后台线程)
+    crashed = WriteBehind(index.flush_interactions, log_dir, flush_interval=3600)
+    os.makedirs(log_dir)
+    crashed._open_segment()
+    crashed.enqueue_likes(fan, {'song': {song: 'like'}, 'band': {catalog['bands'][0]: 'like'}})
+    crashed.enqueue_review(fan, album, Decimal('6'), 'first')
+    crashed._open_segment()
+    crashed.enqueue_likes(fan, {'song': {song: 'unlike'}})  # 新的日志段里的操作覆盖旧的
+    crashed.enqueue_review(fan, album, Decimal('9'), 'second')
+    _, f = crashed._segments[-1]
+    f.write('{"t": "like", "f": ')  # 崩溃时只写了一半的一行
+    for _, f in crashed._segments:
+        f.close()
+
+    wb = WriteBehind(index.flush_interactions, log_dir, flush_interval=3600)
+    wb.start()
+    try:
+        assert wb.stats()['recovered'] == 5
+        assert wb.pending_likes(fan) == {'song': {song: 'unlike'}, 'band': {catalog['bands'][0]: 'like'}}
+        assert wb.flush() == 3
+    finally:
+        wb.close()
+    assert query(db, "SELECT * FROM Fan_Like_Song") == []
+    assert query(db, "SELECT fan_id, band_id FROM Fan_Like_Band") == [{'fan_id': fan, 'band_id': catalog['bands'][0]}]
+    assert query(db, "SELECT score, comment FROM Review") == [{'score': 9.0, 'comment': 'second'}]
+    assert [name for name in os.listdir(log_dir) if name.endswith('.log')] == []